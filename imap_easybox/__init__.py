@@ -1,5 +1,10 @@
 from .server import ImapEasyBox
-from .folder import Folder, FolderList
-from .email import Mail
+from .folder import Folder, FolderList, MailList
+from .email import Mail, MailPart
+from .cache import MailCache
+from .index import MailIndex
+from .store import AttachmentStore
+from .pool import ConnectionPool
+from .pipeline import Pipeline
 
 __version__ = '0.1.0'
@@ -0,0 +1,490 @@
+"""基于asyncio的异步客户端
+
+:class:`AsyncImapEasyBox`, :class:`AsyncFolder`, :class:`AsyncMail` 分别对应 :class:`.ImapEasyBox`, :class:`.Folder`,
+:class:`.Mail`，底层是非阻塞的 :class:`AsyncImapConnection`，每条命令有独立的tag，多条命令可以连续发送而不需要等待
+上一条命令的响应(pipelining)。一个事件循环可以同时管理成百上千个邮箱。
+
+Examples
+--------
+>>> async def main():
+...     async with AsyncImapEasyBox('imap.mail.com', user='username', password='password') as box:
+...         inbox = await box.select('inbox')
+...         mails = await inbox.search(subject='test')
+...         await inbox.fetch(mails)
+...         print(mails[0].subject, mails[0].text_body)
+>>> asyncio.run(main())
+"""
+import asyncio
+import itertools
+import re
+import ssl as ssl_module
+from .email import Mail
+from .folder import Folder
+from .utils import to_message_sets, parse_fetch_response, parse_folder_list, imap_utf7_encode
+
+_LITERAL_RE = re.compile(rb'\{(\d+)\+?\}$')
+_UNTAGGED_RE = re.compile(rb'\* (?:(\d+) )?([A-Za-z-]+) ?(.*)', re.S)
+_CODE_RE = re.compile(rb'\[([A-Z-]+) ?([^\]]*)\]')
+
+
+class AsyncResponse:
+    """命令的响应
+
+    Attributes
+    ----------
+    typ: str
+        命令执行结果，``'OK'``, ``'NO'`` 或 ``'BAD'``
+    text: bytes
+        tagged响应的文本
+    untagged: dict
+        untagged响应，格式和 :attr:`imaplib.IMAP4.untagged_responses` 相同，比如 ``{'FETCH': [...], 'EXISTS': [b'3']}``
+    """
+
+    def __init__(self, typ: str, text: bytes, untagged: dict):
+        self.typ = typ
+        self.text = text
+        self.untagged = untagged
+
+    def get(self, name: str) -> list:
+        """返回指定名称的untagged响应数据"""
+        return self.untagged.get(name.upper(), [])
+
+    def __repr__(self):
+        return f"AsyncResponse<{self.typ} {self.text!r}>"
+
+
+class AsyncImapConnection:
+    """非阻塞的imap连接，负责给命令分配tag，发送命令，并根据tag把响应分发给对应的命令
+
+    命令发送以后不需要等待响应就可以发送下一条命令，服务器按顺序返回响应，untagged响应归属于在它之后第一个完成的命令
+
+    Parameters
+    ----------
+    host: str
+        服务器域名
+    port: int, default 993
+        服务器端口
+    ssl: bool, default True
+        是否使用ssl连接
+    ssl_context: ssl.SSLContext, default None
+        ssl连接使用的上下文，默认为 :func:`ssl.create_default_context`
+    """
+
+    def __init__(self, host: str, port: int = 993, ssl: bool = True, ssl_context: ssl_module.SSLContext = None):
+        self.host = host
+        self.port = port
+        self.ssl_context = (ssl_context or ssl_module.create_default_context()) if ssl else None
+        self.capabilities = ()
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._tags = (f"A{i:04d}".encode('ascii') for i in itertools.count(1))
+        self._pending = {}
+        self._untagged = {}
+        self._continuation = None
+        self._send_lock = asyncio.Lock()
+        self._closed = False
+
+    async def open(self):
+        """建立连接并读取服务器的欢迎信息"""
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl_context)
+        greeting = await self._read_response()
+        if not greeting[0].startswith(b'* OK') and not greeting[0].startswith(b'* PREAUTH'):
+            raise ConnectionError(greeting[0].decode('utf-8', 'replace'))
+        self._reader_task = asyncio.create_task(self._read_loop())
+        await self.update_capabilities()
+
+    async def update_capabilities(self):
+        """重新获取服务器支持的扩展"""
+        response = await self.command('CAPABILITY')
+        if response.get('CAPABILITY'):
+            self.capabilities = tuple(response.get('CAPABILITY')[-1].decode('ascii').upper().split())
+
+    async def _read_response(self) -> list:
+        """读取一条完整的响应，格式和imaplib相同：包含字面量的部分为元组 ``(b'... {n}', 字面量)``"""
+        parts = []
+
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                raise ConnectionError("connection closed by server")
+            line = line.rstrip(b'\r\n')
+            match = _LITERAL_RE.search(line)
+            if not match:
+                parts.append(line)
+                return parts
+            literal = await self._reader.readexactly(int(match.group(1)))
+            parts.append((line, literal))
+
+    async def _read_loop(self):
+        try:
+            while True:
+                resp = await self._read_response()
+                first = resp[0][0] if isinstance(resp[0], tuple) else resp[0]
+
+                if first.startswith(b'* '):
+                    self._add_untagged(resp)
+                elif first.startswith(b'+'):
+                    if self._continuation is not None and not self._continuation.done():
+                        self._continuation.set_result(first)
+                else:
+                    tag, _, rest = first.partition(b' ')
+                    typ, _, text = rest.partition(b' ')
+                    # 先解析响应再取出等待的命令，解析失败时命令仍然在_pending中，由_fail通知
+                    typ = typ.decode('ascii').upper()
+                    future = self._pending.pop(tag, None)
+                    untagged, self._untagged = self._untagged, {}
+                    if future is not None and not future.done():
+                        future.set_result(AsyncResponse(typ, text, untagged))
+        except Exception as error:
+            # 除了连接错误，服务器返回格式错误的响应时也要结束所有等待的命令，否则它们会一直等待下去
+            self._fail(error)
+
+    def _add_untagged(self, resp: list):
+        """按照imaplib的格式保存untagged响应"""
+        first = resp[0][0] if isinstance(resp[0], tuple) else resp[0]
+        match = _UNTAGGED_RE.match(first)
+        if match is None:
+            return
+
+        number, name, rest = match.groups()
+        name = name.decode('ascii').upper()
+        # * 5 FETCH (...)保存为b'5 (...)'，* 3 EXISTS保存为b'3'
+        data = number + (b' ' + rest if rest else b'') if number is not None else rest
+
+        if isinstance(resp[0], tuple):
+            resp = [(data, resp[0][1])] + resp[1:]
+        else:
+            resp = [data]
+        self._untagged.setdefault(name, []).extend(resp)
+
+        # * OK [UIDVALIDITY 3857529045]等响应码单独保存
+        if name in ('OK', 'NO', 'BAD') and number is None:
+            code = _CODE_RE.match(rest)
+            if code:
+                self._untagged.setdefault(code.group(1).decode('ascii'), []).append(code.group(2))
+
+    def _fail(self, error: Exception):
+        self._closed = True
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(str(error)))
+        self._pending.clear()
+        if self._continuation is not None and not self._continuation.done():
+            self._continuation.set_exception(ConnectionError(str(error)))
+
+    async def command(self, name: str, *args: str | bytes) -> AsyncResponse:
+        """发送命令并等待响应，参数中bytes类型的多行内容会作为字面量发送
+
+        多个协程可以同时调用，命令会立即发送，不需要等待前面命令的响应
+        """
+        if self._closed:
+            raise ConnectionError("connection is closed")
+
+        tag = next(self._tags)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[tag] = future
+
+        line = tag + b' ' + name.encode('ascii')
+        literal_plus = 'LITERAL+' in self.capabilities
+
+        async with self._send_lock:
+            for arg in args:
+                if isinstance(arg, str):
+                    arg = arg.encode('utf-8')
+                if b'\r' in arg or b'\n' in arg:
+                    # 字面量：先发送{n}，等待服务器的继续响应以后再发送内容，服务器支持LITERAL+时不需要等待
+                    line += b' {%d%s}\r\n' % (len(arg), b'+' if literal_plus else b'')
+                    self._writer.write(line)
+                    if not literal_plus:
+                        self._continuation = asyncio.get_running_loop().create_future()
+                        await self._writer.drain()
+                        await self._continuation
+                    line = arg
+                else:
+                    line += b' ' + arg
+            self._writer.write(line + b'\r\n')
+            await self._writer.drain()
+
+        return await future
+
+    async def close(self):
+        """关闭连接"""
+        self._closed = True
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+
+def quote(value: str) -> str:
+    """将字符串转换成imap的引号字符串"""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class AsyncImapEasyBox:
+    """异步版本的 :class:`.ImapEasyBox`
+
+    Parameters
+    ----------
+    host : str
+        服务器域名
+    port : int, default 993
+        服务器端口，默认为993
+    user: str, default None
+        用户名，也可以稍后在调用 ``login`` 方法时指定
+    password: str, default None
+        密码，也可以稍后在调用 ``login`` 方法时指定
+    ssl: bool, default True
+        是否使用ssl连接
+    ssl_context: ssl.SSLContext, default None
+        ssl连接使用的上下文
+
+    Examples
+    ----------
+    >>> async with AsyncImapEasyBox('imap.mail.com', user='username', password='password') as box:
+    ...     inbox = await box.select('inbox')
+    """
+
+    def __init__(self, host: str, port: int = 993, user: str | None = None, password: str | None = None,
+                 ssl: bool = True, ssl_context: ssl_module.SSLContext = None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.ssl = ssl
+        self.ssl_context = ssl_context
+        self.server = None
+        self.cache = None
+        self._folders = None
+        self._enabled = set()
+
+    async def login(self, user: str | None = None, password: str | None = None):
+        """登录邮箱"""
+        if user is not None:
+            self.user = user
+        if password is not None:
+            self.password = password
+
+        self.server = AsyncImapConnection(self.host, self.port, self.ssl, self.ssl_context)
+        await self.server.open()
+        await self.command('LOGIN', quote(self.user), quote(self.password))
+        await self.server.update_capabilities()
+        await self.update_folders()
+
+    async def quit(self):
+        """退出登录"""
+        try:
+            await self.server.command('LOGOUT')
+        except ConnectionError:
+            pass
+        await self.server.close()
+
+    async def __aenter__(self):
+        await self.login()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.quit()
+
+    def has_capability(self, capability: str) -> bool:
+        """服务器是否支持指定的扩展"""
+        return capability.upper() in self.server.capabilities
+
+    async def command(self, name: str, *args: str | bytes) -> AsyncResponse:
+        """发送命令，命令执行失败时抛出 :class:`RuntimeError`"""
+        response = await self.server.command(name, *args)
+        if response.typ != 'OK':
+            raise RuntimeError(f"{name} failed: {response.text.decode('utf-8', 'replace')}")
+        return response
+
+    async def uid(self, command: str, *args: str | bytes) -> AsyncResponse:
+        """发送UID命令，比如 ``await box.uid('FETCH', '1:10', '(FLAGS)')``"""
+        return await self.command('UID', command, *args)
+
+    async def update_folders(self):
+        """更新文件夹列表"""
+        response = await self.command('LIST', '""', '"*"')
+        self._folders = parse_folder_list(response.get('LIST'))
+
+    @property
+    def folders(self) -> list['AsyncFolder']:
+        """返回邮箱当前所有文件夹，使用前需要调用 :meth:`select` 选择文件夹"""
+        return [AsyncFolder(folder_name, self) for folder_name in self._folders]
+
+    async def select(self, folder_name: str) -> 'AsyncFolder':
+        """选择文件夹，返回 :class:`AsyncFolder` 实例"""
+        response = await self.command('SELECT', quote(self._folders[folder_name.lower()]))
+        folder = AsyncFolder(folder_name, self)
+
+        def code(name):
+            data = response.get(name)
+            return int(data[-1]) if data and data[-1] else None
+
+        folder.exists = code('EXISTS')
+        folder.uidvalidity = code('UIDVALIDITY')
+        folder.uidnext = code('UIDNEXT')
+        folder.highestmodseq = code('HIGHESTMODSEQ')
+        return folder
+
+    async def create_folder(self, folder_name: str):
+        """创建文件夹"""
+        await self.command('CREATE', quote(imap_utf7_encode(folder_name).decode('ascii')))
+        await self.update_folders()
+
+    async def delete_folder(self, folder_name: str):
+        """删除文件夹"""
+        await self.command('DELETE', quote(self._folders[folder_name.lower()]))
+        await self.update_folders()
+
+
+def _sync_only(name: str, hint: str = 'use ImapEasyBox instead'):
+    """生成替代同步接口的方法，:class:`AsyncFolder` 和 :class:`AsyncMail` 继承的同步接口需要 :class:`.ImapEasyBox`，
+    直接调用时会访问异步连接上不存在的属性，这里改为抛出说明原因的 :class:`TypeError`"""
+    def method(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__}.{name} is not supported by the async client, {hint}")
+
+    method.__name__ = name
+    method.__doc__ = "异步客户端不支持，调用时抛出 :class:`TypeError`"
+    return method
+
+
+class AsyncFolder(Folder):
+    """异步版本的 :class:`.Folder`
+
+    只支持 :attr:`mails`, :meth:`search`, :meth:`fetch`，:class:`.Folder` 的其它方法调用时抛出 :class:`TypeError`
+    """
+
+    sort = _sync_only('sort')
+    thread = _sync_only('thread')
+    search_stats = _sync_only('search_stats')
+    search_local = _sync_only('search_local')
+    fetch_all = _sync_only('fetch_all')
+    extract_contents = _sync_only('extract_contents')
+    sync = _sync_only('sync')
+    idle = _sync_only('idle')
+    add_flags = _sync_only('add_flags', "use 'await mail.add_flags()' instead")
+    set_flags = _sync_only('set_flags', "use 'await mail.set_flags()' instead")
+    remove_flags = _sync_only('remove_flags', "use 'await mail.remove_flags()' instead")
+    move = _sync_only('move', "use 'await mail.move_to()' instead")
+    export = _sync_only('export')
+    import_ = _sync_only('import_')
+    rename = _sync_only('rename')
+    delete = _sync_only('delete', "use 'await box.delete_folder()' instead")
+    info = property(_sync_only('info'))
+
+    @property
+    async def mails(self) -> list['AsyncMail']:
+        """返回当前文件夹中所有邮件，使用方法: ``mails = await folder.mails``"""
+        return await self.search('ALL')
+
+    async def search(self, query: str = None, *, encoding: str = None, prefetch: bool | str = False,
+                     **kwargs) -> list['AsyncMail']:
+        """根据条件搜索邮件，参数参考 :meth:`.Folder.search`"""
+        if query is None:
+            query = self._format_search_query(kwargs)
+
+        if encoding:
+            if isinstance(query, str):
+                query = query.encode(encoding)
+            response = await self.box.uid('SEARCH', 'CHARSET', encoding, query)
+        else:
+            response = await self.box.uid('SEARCH', query)
+
+        mail_ids = b' '.join(data for data in response.get('SEARCH') if data).decode('ascii').split()
+        mails = [AsyncMail(i, self) for i in mail_ids]
+
+        if prefetch == 'headers':
+            await self.fetch(mails, parts='BODY.PEEK[HEADER]')
+        elif prefetch:
+            await self.fetch(mails)
+
+        return mails
+
+    async def fetch(self, mails: list['AsyncMail'], parts: str = 'RFC822', batch_size: int = 500
+                    ) -> list['AsyncMail']:
+        """批量获取邮件内容，所有批次的fetch命令连续发送，不需要等待上一批的响应，参数参考 :meth:`.Folder.fetch`"""
+        mails_by_id = self._uncached(mails, parts)
+        commands = [self.box.uid('FETCH', message_set, f"({parts})")
+                    for message_set in to_message_sets(mails_by_id.keys(), batch_size)]
+
+        for response in await asyncio.gather(*commands):
+            self._apply_fetch(mails_by_id, response.get('FETCH'))
+
+        return mails
+
+
+class AsyncMail(Mail):
+    """异步版本的 :class:`.Mail`
+
+    需要先调用 :meth:`fetch_content` 或 :meth:`fetch_headers` 获取邮件内容，之后可以和 :class:`.Mail` 一样访问
+    ``subject``, ``text_body``, ``attachments`` 等属性，需要请求服务器的同步接口调用时抛出 :class:`TypeError`
+    """
+
+    __slots__ = ()
+
+    flags = property(_sync_only('flags', "use 'await mail.fetch_flags()' instead"))
+    structure = property(_sync_only('structure', "use 'await mail.fetch_content()' instead"))
+
+    def _fetch(self, command) -> dict:
+        raise RuntimeError("mail content is not loaded, call 'await mail.fetch_content()' first")
+
+    async def _fetch_async(self, command: str) -> dict:
+        response = await self.box.uid('FETCH', self.mail_id, command)
+
+        for number, attrs in parse_fetch_response(response.get('FETCH')):
+            if attrs.get('UID') == self.mail_id:
+                return attrs
+
+        return {}
+
+    async def fetch_content(self) -> dict:
+        """获取完整邮件，返回 :attr:`.Mail.content`"""
+        if self._raw_mail is None:
+            self._update(await self._fetch_async("(RFC822)"))
+        return self.content
+
+    async def fetch_headers(self) -> dict:
+        """只获取邮件头，返回 :attr:`.Mail.headers`"""
+        if self._headers is None and self._raw_mail is None:
+            self._update(await self._fetch_async("(BODY.PEEK[HEADER])"))
+        return self.headers
+
+    async def fetch_flags(self) -> list[str]:
+        """返回邮件当前所有flag标志构成的列表"""
+        attrs = await self._fetch_async('(FLAGS)')
+        return [flag.lstrip('\\') for flag in attrs.get('FLAGS', [])]
+
+    async def _store_flags(self, command: str, flags: list | str):
+        await self.box.uid('STORE', self.mail_id, command, f"({self._format_flags(flags)})")
+
+    async def set_flags(self, flags: list | str):
+        """设置邮件标识，参数参考 :meth:`.Mail.set_flags`"""
+        await self._store_flags('FLAGS', flags)
+
+    async def add_flags(self, flags: list | str):
+        """添加邮件标识，参数参考 :meth:`.Mail.add_flags`"""
+        await self._store_flags('+FLAGS', flags)
+
+    async def remove_flags(self, flags: list | str):
+        """删除邮件标识，参数参考 :meth:`.Mail.remove_flags`"""
+        await self._store_flags('-FLAGS', flags)
+
+    async def move_to(self, folder_name: str):
+        """将邮件移动到指定文件夹，服务器支持MOVE时使用 ``UID MOVE`` 命令"""
+        dest = quote(self.box._folders[folder_name.lower()])
+        if self.box.has_capability('MOVE'):
+            await self.box.uid('MOVE', self.mail_id, dest)
+            return
+
+        await self.box.uid('COPY', self.mail_id, dest)
+        await self.add_flags('deleted')
+        if self.box.has_capability('UIDPLUS'):
+            await self.box.uid('EXPUNGE', self.mail_id)
+
+    def __repr__(self):
+        return f"AsyncMail<{self.mail_id}>"
@@ -0,0 +1,213 @@
+import os
+import re
+import socket
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import NamedTuple, Iterator
+
+# Maildir文件名中的标志，按字母顺序排列
+MAILDIR_FLAGS = {'\\Draft': 'D', '\\Flagged': 'F', '\\Answered': 'R', '\\Seen': 'S', '\\Deleted': 'T'}
+
+ARCHIVE_FORMATS = ('mbox', 'maildir', 'eml')
+
+_FROM_RE = re.compile(rb'^(>*From )', re.M)
+_QUOTED_FROM_RE = re.compile(rb'^>(>*From )', re.M)
+_LINE_END_RE = re.compile(rb'\r?\n')
+_MBOX_DATE_FORMAT = '%a %b %d %H:%M:%S %Y'
+
+
+class ArchivedMail(NamedTuple):
+    """导出或导入的一封邮件
+
+    Attributes
+    ----------
+    uid: int or None
+        邮件的uid，导入时为 ``None``
+    data: bytes
+        邮件原始内容
+    flags: tuple of str
+        邮件标志，比如 ``('\\Seen',)``
+    date: datetime or None
+        邮件的INTERNALDATE
+    """
+    uid: int | None
+    data: bytes
+    flags: tuple = ()
+    date: datetime | None = None
+
+
+class MboxWriter:
+    """追加写入mboxrd格式的文件，正文中以 ``From `` 开头的行前面加上 ``>``，换行符转换为LF
+
+    Parameters
+    ----------
+    path: str or Path
+        mbox文件路径
+    offset: int, default None
+        继续导出时，截断到上次检查点记录的位置，丢弃检查点之后写入的不完整数据
+    """
+
+    def __init__(self, path: str | Path, offset: int | None = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, 'r+b' if offset is not None and self.path.exists() else 'wb')
+        if offset is not None:
+            self.file.truncate(offset)
+        self.file.seek(0, os.SEEK_END)
+
+    def write(self, mails: list[ArchivedMail]):
+        for mail in mails:
+            date = (mail.date or datetime.now(timezone.utc)).astimezone(timezone.utc)
+            data = _FROM_RE.sub(rb'>\1', _LINE_END_RE.sub(b'\n', mail.data))
+            if not data.endswith(b'\n'):
+                data += b'\n'
+            self.file.write(b'From MAILER-DAEMON ' + date.strftime(_MBOX_DATE_FORMAT).encode('ascii') + b'\n')
+            self.file.write(data)
+            self.file.write(b'\n')
+        self.file.flush()
+
+    def state(self) -> dict:
+        """检查点需要记录的写入位置"""
+        return {'offset': self.file.tell()}
+
+    def close(self):
+        self.file.close()
+
+
+class MaildirWriter:
+    """写入Maildir目录，邮件先写入 ``tmp`` 再移动到 ``cur``，标志保存在文件名中，修改时间设为INTERNALDATE
+
+    文件名由UIDVALIDITY和uid生成，重复导出同一封邮件会覆盖原来的文件
+    """
+
+    def __init__(self, path: str | Path, uidvalidity: int | None = None):
+        self.path = Path(path)
+        self.uidvalidity = uidvalidity
+        for name in ('tmp', 'new', 'cur'):
+            (self.path / name).mkdir(parents=True, exist_ok=True)
+        self.hostname = socket.gethostname().replace('/', '\\057').replace(':', '\\072')
+
+    def write(self, mails: list[ArchivedMail]):
+        for mail in mails:
+            timestamp = int(mail.date.timestamp()) if mail.date else int(time.time())
+            flags = ''.join(sorted(MAILDIR_FLAGS[flag] for flag in mail.flags if flag in MAILDIR_FLAGS))
+            name = f"{timestamp}.U{self.uidvalidity}I{mail.uid}.{self.hostname}"
+            tmp_path = self.path / 'tmp' / name
+            tmp_path.write_bytes(_LINE_END_RE.sub(b'\n', mail.data))
+            os.utime(tmp_path, (timestamp, timestamp))
+            os.replace(tmp_path, self.path / 'cur' / f"{name}:2,{flags}")
+
+    def state(self) -> dict:
+        return {}
+
+    def close(self):
+        pass
+
+
+class EmlWriter:
+    """每封邮件原样写入一个 ``<uid>.eml`` 文件，修改时间设为INTERNALDATE"""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def write(self, mails: list[ArchivedMail]):
+        for mail in mails:
+            file_path = self.path / f"{mail.uid}.eml"
+            file_path.write_bytes(mail.data)
+            if mail.date:
+                os.utime(file_path, (mail.date.timestamp(), mail.date.timestamp()))
+
+    def state(self) -> dict:
+        return {}
+
+    def close(self):
+        pass
+
+
+def open_writer(path: str | Path, format: str, uidvalidity: int | None = None, state: dict | None = None):
+    """创建指定格式的写入器，``state`` 为上次检查点记录的状态"""
+    if format == 'mbox':
+        return MboxWriter(path, state.get('offset') if state else None)
+    if format == 'maildir':
+        return MaildirWriter(path, uidvalidity)
+    if format == 'eml':
+        return EmlWriter(path)
+    raise ValueError(f"unsupported format {format!r}, must be one of {ARCHIVE_FORMATS}")
+
+
+def detect_format(path: str | Path) -> str:
+    """根据路径判断格式，包含 ``cur`` 子目录的是Maildir，其它目录是eml文件，普通文件是mbox"""
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(path)
+    if path.is_dir():
+        return 'maildir' if (path / 'cur').is_dir() else 'eml'
+    return 'mbox'
+
+
+def _file_date(path: Path) -> datetime:
+    return datetime.fromtimestamp(path.stat().st_mtime, timezone.utc)
+
+
+def _read_mbox(path: Path) -> Iterator[ArchivedMail]:
+    date, lines = None, None
+
+    def build():
+        data = b''.join(lines)
+        # 去掉写入时在邮件之间添加的空行
+        if data.endswith(b'\n\n'):
+            data = data[:-1]
+        return ArchivedMail(None, _QUOTED_FROM_RE.sub(rb'\1', data), (), date)
+
+    with open(path, 'rb') as file:
+        for line in file:
+            if line.startswith(b'From '):
+                if lines is not None:
+                    yield build()
+                # From MAILER-DAEMON Mon Jan  2 15:04:05 2023
+                try:
+                    date = datetime.strptime(' '.join(line.decode('ascii').split()[-5:]), _MBOX_DATE_FORMAT)
+                    date = date.replace(tzinfo=timezone.utc)
+                except ValueError:
+                    date = None
+                lines = []
+            elif lines is not None:
+                lines.append(line)
+
+    if lines is not None:
+        yield build()
+
+
+def _read_maildir(path: Path) -> Iterator[ArchivedMail]:
+    reverse_flags = {value: key for key, value in MAILDIR_FLAGS.items()}
+    for subdir in ('new', 'cur'):
+        for file_path in sorted((path / subdir).iterdir()):
+            if file_path.name.startswith('.') or not file_path.is_file():
+                continue
+            _, _, info = file_path.name.partition(':2,')
+            flags = tuple(reverse_flags[flag] for flag in info if flag in reverse_flags)
+            yield ArchivedMail(None, file_path.read_bytes(), flags, _file_date(file_path))
+
+
+def _read_eml(path: Path) -> Iterator[ArchivedMail]:
+    def sort_key(file_path: Path):
+        # 导出的文件名是uid，按数字顺序导入
+        return (0, int(file_path.stem), '') if file_path.stem.isdigit() else (1, 0, file_path.name)
+
+    for file_path in sorted(path.glob('*.eml'), key=sort_key):
+        yield ArchivedMail(None, file_path.read_bytes(), (), _file_date(file_path))
+
+
+def read_archive(path: str | Path, format: str | None = None) -> Iterator[ArchivedMail]:
+    """依次读取mbox文件、Maildir目录或者eml文件所在目录中的邮件，``format`` 为 ``None`` 时自动判断"""
+    path = Path(path)
+    format = format or detect_format(path)
+    if format == 'mbox':
+        return _read_mbox(path)
+    if format == 'maildir':
+        return _read_maildir(path)
+    if format == 'eml':
+        return _read_eml(path)
+    raise ValueError(f"unsupported format {format!r}, must be one of {ARCHIVE_FORMATS}")
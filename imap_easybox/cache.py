@@ -0,0 +1,178 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class MailCache:
+    """基于SQLite的本地邮件缓存，以 ``(文件夹, UIDVALIDITY, uid)`` 为键保存邮件原始内容和邮件头
+
+    邮件内容不会变化，标志随时可能被其它客户端修改，所以不缓存标志。文件夹的 ``UIDVALIDITY`` 变化以后，旧的缓存不会再被命中，
+    :meth:`.ImapEasyBox.select` 发现 ``UIDVALIDITY`` 变化时删除旧的缓存
+
+    Parameters
+    ----------
+    path: str or Path, default 'imap_easybox_cache.db'
+        缓存数据库文件路径，为 ``':memory:'`` 时缓存只保存在内存中
+    max_size: int, default None
+        缓存邮件内容的最大字节数，超过时删除最久没有访问的邮件，为 ``None`` 时不限制
+    max_age: float, default None
+        缓存的最长保存秒数，为 ``None`` 时不限制
+
+    写入每 ``COMMIT_INTERVAL`` 次提交一次事务，读取时只在内存中记录访问时间，清理或者提交时再批量写入，
+    命中缓存不需要写磁盘。程序退出前需要调用 :meth:`commit` 或者 :meth:`close`，:meth:`.ImapEasyBox.quit` 会自动提交
+
+    Examples
+    --------
+    >>> cache = MailCache('cache.db', max_size=1024 ** 3, max_age=7 * 24 * 3600)
+    >>> box = ImapEasyBox('imap.mail.com', user='username', password='password', cache=cache)
+    """
+
+    # 每写入多少次提交一次事务，同一个连接中的读取可以看到未提交的数据
+    COMMIT_INTERVAL = 100
+    # 每写入多少次检查一次是否需要清理缓存
+    EVICT_INTERVAL = 100
+
+    def __init__(self, path: str | Path = 'imap_easybox_cache.db', max_size: int | None = None,
+                 max_age: float | None = None):
+        self.path = str(path)
+        self.max_size = max_size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._writes = 0
+        # 还没有写入数据库的访问时间，键为(文件夹, UIDVALIDITY, uid)
+        self._accessed = {}
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS mails (
+                folder TEXT NOT NULL,
+                uidvalidity INTEGER NOT NULL,
+                uid INTEGER NOT NULL,
+                raw BLOB,
+                headers BLOB,
+                size INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (folder, uidvalidity, uid)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS mails_accessed ON mails (accessed)")
+        self._conn.commit()
+
+    def get(self, folder: str, uidvalidity: int, uid: int | str) -> dict | None:
+        """返回缓存的邮件，字典的键为 ``raw``, ``headers``，没有缓存时返回 ``None``"""
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT raw, headers, created FROM mails WHERE folder = ? AND uidvalidity = ? AND uid = ?",
+                (folder, uidvalidity, int(uid))).fetchone()
+
+            if row is None:
+                return None
+
+            raw, headers, created = row
+            if self.max_age is not None and now - created > self.max_age:
+                return None
+
+            self._accessed[(folder, uidvalidity, int(uid))] = now
+            if len(self._accessed) >= self.COMMIT_INTERVAL:
+                self._flush_accessed()
+                self._conn.commit()
+
+        return {"raw": raw, "headers": headers}
+
+    def put(self, folder: str, uidvalidity: int, uid: int | str, *, raw: bytes | None = None,
+            headers: bytes | None = None):
+        """写入缓存，只更新传入的字段"""
+        if raw is None and headers is None:
+            return
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO mails (folder, uidvalidity, uid, raw, headers, size, created, accessed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (folder, uidvalidity, uid) DO UPDATE SET
+                    raw = coalesce(excluded.raw, raw),
+                    headers = coalesce(excluded.headers, headers),
+                    size = length(coalesce(excluded.raw, raw, '')) + length(coalesce(excluded.headers, headers, '')),
+                    accessed = excluded.accessed
+            """, (folder, uidvalidity, int(uid), raw, headers, len(raw or b'') + len(headers or b''), now, now))
+            self._accessed.pop((folder, uidvalidity, int(uid)), None)
+            self._writes += 1
+            if self._writes % self.COMMIT_INTERVAL == 0:
+                self._flush_accessed()
+                self._conn.commit()
+            need_evict = self._writes % self.EVICT_INTERVAL == 0
+
+        if need_evict:
+            self.evict()
+
+    def evict(self, uidvalidities: dict[str, int] | None = None):
+        """清理过期的缓存，超过 ``max_size`` 时删除最久没有访问的邮件
+
+        Parameters
+        ----------
+        uidvalidities: dict, default None
+            文件夹名称和当前 ``UIDVALIDITY`` 构成的字典，这些文件夹中 ``UIDVALIDITY`` 不同的旧缓存会被删除
+        """
+        with self._lock:
+            # 先写入访问时间，按最近访问时间删除
+            self._flush_accessed()
+
+            if self.max_age is not None:
+                self._conn.execute("DELETE FROM mails WHERE created < ?", (time.time() - self.max_age,))
+
+            for folder, uidvalidity in (uidvalidities or {}).items():
+                self._conn.execute("DELETE FROM mails WHERE folder = ? AND uidvalidity != ?", (folder, uidvalidity))
+
+            if self.max_size is not None:
+                total, = self._conn.execute("SELECT coalesce(sum(size), 0) FROM mails").fetchone()
+                if total > self.max_size:
+                    rows = self._conn.execute("SELECT rowid, size FROM mails ORDER BY accessed").fetchall()
+                    expired = []
+                    for rowid, size in rows:
+                        if total <= self.max_size:
+                            break
+                        expired.append((rowid,))
+                        total -= size
+                    self._conn.executemany("DELETE FROM mails WHERE rowid = ?", expired)
+
+            self._conn.commit()
+
+    def clear(self, folder: str | None = None):
+        """清空缓存，指定 ``folder`` 时只清空该文件夹的缓存"""
+        with self._lock:
+            if folder is None:
+                self._conn.execute("DELETE FROM mails")
+                self._accessed.clear()
+            else:
+                self._conn.execute("DELETE FROM mails WHERE folder = ?", (folder,))
+                self._accessed = {key: value for key, value in self._accessed.items() if key[0] != folder}
+            self._conn.commit()
+
+    def _flush_accessed(self):
+        """写入内存中记录的访问时间，需要持有锁"""
+        if self._accessed:
+            self._conn.executemany("UPDATE mails SET accessed = ? WHERE folder = ? AND uidvalidity = ? AND uid = ?",
+                                   [(accessed, *key) for key, accessed in self._accessed.items()])
+            self._accessed.clear()
+
+    def commit(self):
+        """写入访问时间并提交未提交的写入"""
+        with self._lock:
+            self._flush_accessed()
+            self._conn.commit()
+
+    def close(self):
+        """提交写入并关闭数据库连接"""
+        self.commit()
+        self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM mails").fetchone()[0]
+
+    def __repr__(self):
+        return f"MailCache<{self.path}>"
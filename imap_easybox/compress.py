@@ -0,0 +1,115 @@
+import imaplib
+import io
+import socket
+import zlib
+
+# imaplib不认识COMPRESS命令，需要登记可以执行的状态
+imaplib.Commands.setdefault('COMPRESS', ('AUTH', 'SELECTED'))
+
+
+class _DeflateReader(io.RawIOBase):
+    """从 :class:`DeflateSocket` 读取解压后的数据，用于创建imaplib读取响应的文件对象"""
+
+    def __init__(self, sock: 'DeflateSocket'):
+        self._sock = sock
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._sock.recv(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class DeflateSocket:
+    """RFC 4978 COMPRESS=DEFLATE的socket包装，发送的数据用raw deflate压缩，接收的数据解压以后再交给imaplib
+
+    解压状态保存在socket上而不是文件对象上，读取超时以后重新调用 ``makefile`` 返回同一个文件对象，可以继续读取。其它方法和属性，
+    比如 ``settimeout``, ``gettimeout``, ``shutdown`` 直接调用原来的socket
+
+    Parameters
+    ----------
+    sock: socket.socket
+        已经完成COMPRESS命令的socket，可以是ssl socket
+
+    Attributes
+    ----------
+    bytes_sent: int
+        压缩前发送的字节数
+    bytes_received: int
+        解压后接收的字节数
+    raw_bytes_sent: int
+        实际通过网络发送的字节数
+    raw_bytes_received: int
+        实际通过网络接收的字节数
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self._decompressor = zlib.decompressobj(-15)
+        # 已经解压但还没有被读取的数据
+        self._pending = b''
+        self._file = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.raw_bytes_sent = 0
+        self.raw_bytes_received = 0
+
+    def sendall(self, data: bytes):
+        # 每次发送都需要Z_SYNC_FLUSH，服务器才能立即解压出完整的命令
+        compressed = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.sock.sendall(compressed)
+        self.bytes_sent += len(data)
+        self.raw_bytes_sent += len(compressed)
+
+    def recv(self, size: int) -> bytes:
+        """返回最多 ``size`` 字节的解压后数据，连接关闭时返回空字节串"""
+        while not self._pending:
+            # 上次限制了输出长度，还有没解压完的数据
+            if self._decompressor.unconsumed_tail:
+                chunk = self._decompressor.unconsumed_tail
+            else:
+                chunk = self.sock.recv(65536)
+                if not chunk:
+                    return b''
+                self.raw_bytes_received += len(chunk)
+            self._pending = self._decompressor.decompress(chunk, 1024 * 1024)
+
+        data, self._pending = self._pending[:size], self._pending[size:]
+        self.bytes_received += len(data)
+        return data
+
+    def makefile(self, mode: str = 'rb', *args, **kwargs) -> io.BufferedReader:
+        # 读取超时不会影响解压状态，返回同一个文件对象，避免丢失文件对象中已经缓冲的数据
+        if self._file is None:
+            self._file = io.BufferedReader(_DeflateReader(self))
+        return self._file
+
+    @property
+    def ratio(self) -> float:
+        """接收数据的压缩比，解压后的字节数除以实际接收的字节数"""
+        return self.bytes_received / self.raw_bytes_received if self.raw_bytes_received else 1.0
+
+    def __getattr__(self, item: str):
+        return getattr(self.sock, item)
+
+
+def start_compression(server: imaplib.IMAP4) -> bool:
+    """在 :class:`imaplib.IMAP4` 连接上发送COMPRESS DEFLATE命令，成功以后替换连接的socket和文件对象
+
+    服务器不支持COMPRESS=DEFLATE，或者压缩已经启用时返回 ``False``
+    """
+    if isinstance(server.sock, DeflateSocket) or 'COMPRESS=DEFLATE' not in server.capabilities:
+        return False
+
+    typ, data = server._simple_command('COMPRESS', 'DEFLATE')
+    if typ != 'OK':
+        return False
+
+    # 从tagged响应以后开始，双方发送的数据都是压缩的
+    server.sock = DeflateSocket(server.sock)
+    server.file = server.sock.makefile('rb')
+    return True
+
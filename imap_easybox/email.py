@@ -1,46 +1,333 @@
 import email
 import re
+import shutil
 from email import generator
+from email.parser import BytesHeaderParser
 from pathlib import Path
 from datetime import datetime
 from typing import TYPE_CHECKING
-from .utils import decode_mail_header, parse_raw_mail, image_to_base64
+from .extract import SpilledPayload
+from .index import html_to_text
+from .stats import measure
+from .utils import (decode_mail_header, parse_raw_mail, image_to_base64, parse_fetch_response,
+                    decode_transfer_encoding, decode_params, TransferDecoder, decode_bytes)
 
 VALID_FLAGS = ['Seen', 'Flagged', 'Answered', 'Draft', 'Deleted', 'Recent']
 
 if TYPE_CHECKING:
     from .folder import Folder
+    from .store import AttachmentStore, StoredBlob
+
+
+class MailPart:
+    """邮件中的一个MIME部分，根据 ``BODYSTRUCTURE`` 创建，内容在访问时才通过 ``BODY.PEEK[<section>]`` 获取
+
+    为了兼容以前的字典格式，也可以通过 ``part["filename"]``, ``part["content"]`` 的方式访问属性
+    """
+
+    def __init__(self, mail: 'Mail', section: str, structure: list):
+        self.mail = mail
+        self.section = section
+        self.children = []
+        self._content = None
+
+        if structure and isinstance(structure[0], list):
+            # multipart: (子部分1)(子部分2)... 子类型 参数 disposition ...
+            index = 0
+            while index < len(structure) and isinstance(structure[index], list):
+                child_section = f"{section}.{index + 1}" if section else str(index + 1)
+                self.children.append(MailPart(mail, child_section, structure[index]))
+                index += 1
+            self.content_type = f"multipart/{structure[index]}".lower()
+            extension = structure[index + 1:]
+            self.params = decode_params(extension[0] if extension else None)
+            self.content_id = self.encoding = self.md5 = None
+            self.size = sum(child.size for child in self.children)
+            disposition = extension[1] if len(extension) > 1 else None
+        else:
+            # 非multipart: 类型 子类型 参数 id 描述 编码 大小 [行数] md5 disposition ...
+            self.content_type = f"{structure[0]}/{structure[1]}".lower()
+            self.params = decode_params(structure[2])
+            self.content_id = structure[3].strip('<>') if structure[3] else None
+            self.encoding = structure[5]
+            self.size = int(structure[6])
+            if self.content_type.startswith('text/'):
+                extension = structure[8:]
+            elif self.content_type == 'message/rfc822':
+                extension = structure[10:]
+            else:
+                extension = structure[7:]
+            self.md5 = extension[0] if extension else None
+            disposition = extension[1] if len(extension) > 1 else None
+
+        self.disposition = disposition[0].lower() if disposition else None
+        self.disposition_params = decode_params(disposition[1]) if disposition else {}
+
+    @property
+    def filename(self) -> str | None:
+        """附件名称"""
+        return self.disposition_params.get('filename') or self.params.get('name')
+
+    @property
+    def charset(self) -> str | None:
+        """文本的字符集"""
+        return self.params.get('charset')
+
+    @property
+    def is_attachment(self) -> bool:
+        """是否为附件，规则和 :func:`.parse_raw_mail` 一致"""
+        if self.children or self.content_type in ('text/plain', 'text/html'):
+            return False
+        return not self.content_type.startswith('image') and self.disposition == 'attachment'
+
+    @property
+    def content(self) -> bytes:
+        """解码后的内容，首次访问时从服务器获取"""
+        if self._content is None:
+            attrs = self.mail._fetch(f"(BODY.PEEK[{self.section}])")
+            self._content = decode_transfer_encoding(attrs.get(f"BODY[{self.section}]", b''), self.encoding)
+        return self._content
+
+    @property
+    def text(self) -> str:
+        """按字符集解码后的文本内容"""
+        return decode_bytes(self.content, self.charset)
+
+    def save(self, path: str | Path, chunk_size: int = 1024 * 1024) -> Path:
+        """分块下载内容并边解码边写入文件，内存占用和附件大小无关
+
+        Parameters
+        ----------
+        path: str or Path
+            保存路径
+        chunk_size: int, default 1048576
+            每次下载的字节数，对应 ``BODY.PEEK[<section>]<offset.chunk_size>``
+
+        Returns
+        -------
+            保存的文件路径
+        """
+        path = Path(path)
+
+        if self._content is not None:
+            with measure(self.mail._stats, 'write', 'attachment', len(self._content)):
+                path.write_bytes(self._content)
+            return path
+
+        with open(path, 'wb') as f:
+            for data in self._download(chunk_size):
+                f.write(data)
+
+        return path
+
+    def _download(self, chunk_size: int):
+        """分块下载内容，依次返回解码后的数据"""
+        decoder = TransferDecoder(self.encoding)
+        offset = 0
+
+        while True:
+            attrs = self.mail._fetch(f"(BODY.PEEK[{self.section}]<{offset}.{chunk_size}>)")
+            chunk = attrs.get(f"BODY[{self.section}]<{offset}>") or b''
+            # 只统计解码和写入的耗时，下载的耗时记录在命令统计中
+            with measure(self.mail._stats, 'write', 'attachment') as timer:
+                data = decoder.decode(chunk)
+                timer.size = len(data)
+                yield data
+            offset += len(chunk)
+            if len(chunk) < chunk_size or offset >= self.size:
+                break
+        yield decoder.flush()
+
+    def store(self, store: 'AttachmentStore | None' = None, chunk_size: int = 1024 * 1024) -> 'StoredBlob':
+        """保存到附件仓库，返回 :class:`.StoredBlob`
+
+        仓库中已经有Content-MD5和大小都相同的内容时不再下载；否则分块下载，边下载边计算哈希，内容已经存在时只保存一份
+
+        Parameters
+        ----------
+        store: AttachmentStore, default None
+            附件仓库，默认为 ``ImapEasyBox`` 的 ``attachment_store``
+        chunk_size: int, default 1048576
+            分块下载时每次下载的字节数
+        """
+        store = store or self.mail._attachment_store
+        if store is None:
+            raise RuntimeError("attachment store is not enabled, pass attachment_store to ImapEasyBox")
+
+        blob = store.lookup(self.md5, self.size)
+        if blob is not None:
+            return blob
+
+        if self._content is not None:
+            blob = store.add(self._content)
+        else:
+            with store.writer() as writer:
+                for data in self._download(chunk_size):
+                    writer.write(data)
+                blob = writer.commit()
+
+        store.add_alias(self.md5, self.size, blob)
+        return blob
+
+    def walk(self):
+        """深度优先遍历当前部分及所有子部分"""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def __getitem__(self, item):
+        try:
+            return getattr(self, item)
+        except AttributeError:
+            raise KeyError(item)
+
+    def __repr__(self):
+        return f"MailPart<{self.section or 'ROOT'} {self.content_type}>"
 
 
 class Mail:
+    """文件夹中的一封邮件，``mail_id`` 为邮件的uid，在 ``UIDVALIDITY`` 不变的情况下始终不变"""
+
+    # 文件夹中可能有几十万封邮件，使用__slots__减少每个对象的内存占用
+    __slots__ = ('folder', 'mail_id', '_raw_mail', '_content', '_headers', '_structure')
+
     def __init__(self, mail_id: int | str, folder: 'Folder'):
         self.folder = folder
-        self.box = folder.box
-        self.server = folder.server
         self.mail_id = str(mail_id)
         self._raw_mail = None
         self._content = None
         self._headers = None
+        self._structure = None
+
+    @property
+    def box(self):
+        """邮件所属的 :class:`.ImapEasyBox`"""
+        return self.folder.box
+
+    @property
+    def server(self):
+        return self.folder.server
+
+    @property
+    def _attachment_store(self):
+        return getattr(getattr(self.folder, 'box', None), 'attachment_store', None)
+
+    @property
+    def _stats(self):
+        # 测试中的邮件可能没有所属文件夹或者邮箱，不能抛出AttributeError，否则会调用__getattr__获取邮件
+        return getattr(getattr(self.folder, 'box', None), '_stats', None)
 
     def __getattr__(self, item):
         return getattr(self.raw_mail, item)
 
-    def _fetch(self, command):
-        """根据指令获取邮件内容"""
+    def _fetch(self, command) -> dict:
+        """根据指令获取邮件内容，返回数据项名称和值构成的字典，字面量保持为bytes"""
         # imap fetch的第二个参数是用括号括起来的1个或者多个指令，比如(RFC822), (RFC822 FLAGS)
-        # 返回的data是一个列表，如果列表元素是一个元组，则元组的第二个元素是邮件实体
-        # 当指定的mail_id不正确的时候，返回的值为('OK', [None])
-        typ, data = self.server.fetch(self.mail_id, command)
-
-        outputs = []
-
-        for resp in data:
-            if isinstance(resp, tuple):
-                outputs.append(resp[1].decode("utf-8"))
-            if isinstance(resp, bytes):
-                outputs.append(resp.decode("utf-8"))
+        # uid fetch的每条响应都包含UID数据项，据此找到当前邮件的响应
+        # 当指定的uid不存在的时候，返回的值为('OK', [None])
+        typ, data = self.server.uid('FETCH', self.mail_id, command)
+
+        for number, attrs in parse_fetch_response(data):
+            if attrs.get('UID') == self.mail_id:
+                return attrs
+
+        return {}
+
+    def _update(self, attrs: dict):
+        """根据批量fetch返回的数据项填充邮件内容，避免再次请求服务器"""
+        raw = attrs.get('RFC822', attrs.get('BODY[]'))
+        if isinstance(raw, bytes):
+            self._set_raw(raw)
+            self._cache_put(raw=raw)
+
+        header = attrs.get('BODY[HEADER]', attrs.get('RFC822.HEADER'))
+        if isinstance(header, bytes) and self._headers is None:
+            with measure(self._stats, 'parse', 'headers', len(header)):
+                self._headers = self._parse_headers(header)
+            self._cache_put(headers=header)
+
+        if isinstance(raw, bytes) or isinstance(header, bytes):
+            self._index_put()
+
+        structure = attrs.get('BODYSTRUCTURE')
+        if structure is not None:
+            self._structure = self._build_structure(structure)
+
+    def _set_raw(self, raw: bytes):
+        with measure(self._stats, 'parse', 'message', len(raw)):
+            self._raw_mail = email.message_from_bytes(raw)
+        self._content = None
+        self._headers = None
 
-        return outputs
+    @property
+    def _cache_key(self) -> tuple | None:
+        """邮件在缓存中的键，没有启用缓存或者不知道文件夹的UIDVALIDITY时返回None"""
+        if self.box is None or self.box.cache is None or self.folder.uidvalidity is None:
+            return None
+        return self.folder.folder_name.lower(), self.folder.uidvalidity, self.mail_id
+
+    def _cache_get(self) -> dict | None:
+        key = self._cache_key
+        return self.box.cache.get(*key) if key else None
+
+    def _cache_put(self, **kwargs):
+        key = self._cache_key
+        if key:
+            self.box.cache.put(*key, **kwargs)
+
+    def _load_cache(self, headers_only: bool = False) -> bool:
+        """从缓存中读取邮件内容，读取成功返回True"""
+        cached = self._cache_get()
+        if not cached:
+            return False
+
+        if cached["raw"] is not None:
+            self._set_raw(cached["raw"])
+            self._index_put()
+            return True
+
+        if headers_only and cached["headers"] is not None:
+            with measure(self._stats, 'parse', 'headers', len(cached["headers"])):
+                self._headers = self._parse_headers(cached["headers"])
+            self._index_put()
+            return True
+
+        return False
+
+    def _index_put(self, body: str | None = None):
+        """将已经获取的邮件头和传入的正文写入全文索引，没有启用索引或者不知道文件夹的UIDVALIDITY时不做任何事"""
+        index = getattr(getattr(self.folder, 'box', None), 'index', None)
+        if index is None or self.folder.uidvalidity is None:
+            return
+
+        fields = {'body': body}
+        if self._headers is not None or self._raw_mail is not None:
+            fields['subject'] = self.subject or ''
+            fields['sender'] = self.from_ or ''
+            fields['recipients'] = ', '.join(filter(None, (self.to, self._get_mail_info('cc'))))
+        index.put(self.folder.folder_name.lower(), self.folder.uidvalidity, self.mail_id, **fields)
+
+    def _store_content(self, content: dict):
+        """启用附件仓库时，将附件和图片的内容保存到仓库中，替换成 :class:`.StoredBlob`，相同的内容在内存和磁盘上都只有一份"""
+        store = self._attachment_store
+        if store is None:
+            return
+        for item in content['attachments'] + content['images']:
+            if item['content'] is not None:
+                item['content'] = store.add(item['content'])
+
+    @staticmethod
+    def _content_text(content: dict) -> str:
+        """邮件内容中用于索引的正文，没有纯文本正文时使用去掉标签的html"""
+        if content['text_body']:
+            return content['text_body']
+        return html_to_text(content['html_body']) if content['html_body'] else ''
+
+    @staticmethod
+    def _parse_headers(data: bytes) -> dict:
+        """只解析邮件头，返回小写的邮件头名称和值构成的字典"""
+        message = BytesHeaderParser().parsebytes(data, headersonly=True)
+        return {k.lower(): v for k, v in message.raw_items()}
 
     @property
     def content(self) -> dict:
@@ -57,22 +344,52 @@ class Mail:
                 }
         """
         if self._content is None:
-            self._content = parse_raw_mail(self.raw_mail)
+            raw_mail = self.raw_mail
+            with measure(self._stats, 'parse', 'content'):
+                self._content = parse_raw_mail(raw_mail)
+            self._store_content(self._content)
+            self._index_put(self._content_text(self._content))
         return self._content
 
+    @property
+    def structure(self) -> MailPart:
+        """根据 ``BODYSTRUCTURE`` 返回邮件的MIME结构，各部分的内容在访问时才会下载"""
+        if self._structure is None:
+            attrs = self._fetch("(BODYSTRUCTURE)")
+            self._structure = self._build_structure(attrs["BODYSTRUCTURE"])
+        return self._structure
+
+    def _build_structure(self, structure: list) -> MailPart:
+        # 非multipart邮件的正文编号为1
+        return MailPart(self, '' if isinstance(structure[0], list) else '1', structure)
+
+    def _find_part(self, content_type: str) -> MailPart | None:
+        for part in self.structure.walk():
+            if part.content_type == content_type and part.disposition != 'attachment':
+                return part
+        return None
+
     @property
     def raw_mail(self) -> email.message.Message:
-        """返回邮件原始的 :class:`~email.message.Message` 对象"""
-        if self._raw_mail is None:
+        """返回邮件原始的 :class:`~email.message.Message` 对象，启用缓存时优先从缓存读取"""
+        if self._raw_mail is None and not self._load_cache():
             data = self._fetch("(RFC822)")
-            self._raw_mail = email.message_from_string(data[0])
+            self._update(data)
         return self._raw_mail
 
     @property
     def headers(self) -> dict:
-        """返回邮件元信息"""
+        """返回邮件元信息
+
+        如果还没有获取完整邮件，则只获取邮件头( ``BODY.PEEK[HEADER]`` )，不会下载邮件正文和附件，启用缓存时优先从缓存读取
+        """
+        if self._headers is None and self._raw_mail is None:
+            if not self._load_cache(headers_only=True):
+                self._update(self._fetch("(BODY.PEEK[HEADER])"))
+
         if self._headers is None:
-            self._headers = {k.lower(): v for k, v in self.raw_mail.items()}
+            self._headers = {k.lower(): v for k, v in self.raw_mail.raw_items()}
+
         return self._headers
 
     def _get_mail_info(self, key):
@@ -115,13 +432,37 @@ class Mail:
 
     @property
     def text_body(self) -> str:
-        """返回邮件的文本内容"""
-        return self.content.get("text_body")
+        """返回邮件的文本内容，如果还没有获取完整邮件，则只下载文本部分"""
+        if self._content is not None or self._raw_mail is not None:
+            return self.content.get("text_body")
+        part = self._find_part('text/plain')
+        text = part.text if part else None
+        if text is not None:
+            self._index_put(text)
+        return text
 
     @property
     def html_body(self) -> str:
-        """返回邮件html的内容"""
-        return self.content.get("html_body")
+        """返回邮件html的内容，如果还没有获取完整邮件，则只下载html部分"""
+        if self._content is not None or self._raw_mail is not None:
+            return self.content.get("html_body")
+        part = self._find_part('text/html')
+        return part.text if part else None
+
+    @property
+    def html_encoding(self) -> str:
+        """返回邮件html内容的编码"""
+        if self._content is not None or self._raw_mail is not None:
+            return self.content.get("html_encoding")
+        part = self._find_part('text/html')
+        return part.charset if part else None
+
+    @property
+    def images(self) -> list:
+        """返回邮件中的图片，如果还没有获取完整邮件，返回 :class:`MailPart` 组成的列表，图片内容在访问时才下载"""
+        if self._content is not None or self._raw_mail is not None:
+            return self.content["images"]
+        return [part for part in self.structure.walk() if part.content_type.startswith('image')]
 
     def save_html(self, save_path: str = '.'):
         """将邮件保存为html文件，图片编码成base64格式嵌入
@@ -140,40 +481,96 @@ class Mail:
         Path.mkdir(save_path, exist_ok=True)
         html_path = save_path / f'{self.mail_id}.html'
 
-        for image in self.content["images"]:
+        for image in self.images:
             content_id = image['content_id']
             content_type = image['content_type']
-            content = image_to_base64(image['content'], self.content['html_coding'])
+            content = image_to_base64(image['content'], 'ascii')
             base64_image = f"data:{content_type};base64,{content}"
             html_body = html_body.replace(f"cid:{content_id}", base64_image)
 
-        html_path.write_text(html_body, self.content["html_encoding"])
+        with measure(self._stats, 'write', 'html') as timer:
+            timer.size = html_path.write_text(html_body, self.html_encoding)
 
     @property
     def attachments(self) -> list:
-        """返回一个列表，元素是字典，字典的键是附件名称，值是附件二进制内容"""
-        return self.content["attachments"]
+        """返回一个列表，元素是字典，字典的键是附件名称，值是附件二进制内容
+
+        如果还没有获取完整邮件，则返回 :class:`MailPart` 组成的列表，附件内容在访问时才下载
+        """
+        if self._content is not None or self._raw_mail is not None:
+            return self.content["attachments"]
+        return [part for part in self.structure.walk() if part.is_attachment]
 
-    def save_attachments(self, save_path: str = '.'):
+    def save_attachments(self, save_path: str = '.', chunk_size: int = 1024 * 1024):
         """保存所有附件，返回附件路径组成的列表
 
+        如果还没有获取完整邮件，附件会通过 :meth:`MailPart.save` 分块下载并直接写入文件。启用附件仓库时，附件先保存到仓库，
+        再通过硬链接放到保存目录，目录中已经有同名的其它文件时不会覆盖，而是在文件名后面加上序号
+
         Parameters
         ----------
         save_path: str, default '.'
             附件保存目录，默认为当前目录
+        chunk_size: int, default 1048576
+            分块下载时每次下载的字节数
         """
         save_path = Path(save_path)
         Path.mkdir(save_path, exist_ok=True)
 
         pathes = []
 
+        store = self._attachment_store
+
         for attachment in self.attachments:
             filepath = save_path / Path(attachment["filename"])
-            filepath.write_bytes(attachment["content"])
+            if store is not None:
+                blob = self._store_attachment(store, attachment, chunk_size)
+                filepath = store.link(blob, filepath)
+            elif isinstance(attachment, MailPart):
+                attachment.save(filepath, chunk_size)
+            elif isinstance(attachment["content"], SpilledPayload):
+                # extract_contents写入临时文件的附件直接复制，不读入内存
+                with measure(self._stats, 'write', 'attachment', len(attachment["content"])):
+                    shutil.copyfile(attachment["content"], filepath)
+            else:
+                with measure(self._stats, 'write', 'attachment', len(attachment["content"])):
+                    filepath.write_bytes(attachment["content"])
             pathes.append(str(filepath))
 
         return pathes
 
+    def store_attachments(self, store: 'AttachmentStore | None' = None, chunk_size: int = 1024 * 1024) -> list[dict]:
+        """将所有附件保存到附件仓库，不在其它目录创建文件
+
+        Parameters
+        ----------
+        store: AttachmentStore, default None
+            附件仓库，默认为 ``ImapEasyBox`` 的 ``attachment_store``
+        chunk_size: int, default 1048576
+            分块下载时每次下载的字节数
+
+        Returns
+        -------
+            字典组成的列表，``filename`` 为附件名称，``content`` 为 :class:`.StoredBlob`
+
+        Examples
+        --------
+        >>> for attachment in mail.store_attachments(store):
+        ...     print(attachment['filename'], attachment['content'].sha256)
+        """
+        store = store or self._attachment_store
+        if store is None:
+            raise RuntimeError("attachment store is not enabled, pass attachment_store to ImapEasyBox")
+
+        return [{"filename": attachment["filename"], "content": self._store_attachment(store, attachment, chunk_size)}
+                for attachment in self.attachments]
+
+    @staticmethod
+    def _store_attachment(store: 'AttachmentStore', attachment, chunk_size: int) -> 'StoredBlob':
+        if isinstance(attachment, MailPart):
+            return attachment.store(store, chunk_size)
+        return store.add(attachment["content"])
+
     def save(self, filename: str = None):
         """将邮件保存为eml文件
 
@@ -190,27 +587,30 @@ class Mail:
         if filename.suffix != '.eml':
             raise ValueError("file suffix must be .eml")
 
-        with open(filename, 'wt') as eml:
-            gen = generator.Generator(eml)
-            gen.flatten(self.raw_mail)
+        raw_mail = self.raw_mail
+
+        # 使用BytesGenerator原样写入8bit内容，避免非utf-8编码的邮件保存失败
+        with measure(self._stats, 'write', 'eml') as timer, open(filename, 'wb') as eml:
+            gen = generator.BytesGenerator(eml)
+            gen.flatten(raw_mail)
+            timer.size = eml.tell()
 
     @property
     def flags(self) -> list[str]:
         """返回邮件当前所有flag标志构成的列表"""
-        # self._fetch('FLAGS')的结果为['1 (FLAGS (\\Seen \\Flagged))']或者['1 (FLAGS ())']
-        # 转换成'1 FLAGS \\Seen \\Flagged'或者'1 FLAG  '
-        flags = self._fetch('FLAGS')[0].replace('(', '').replace(')', '').replace('\\', '')
-        # split不加参数会去掉结果中包含的''
-        flags = flags.split()[2:]
-        return flags
+        # self._fetch('(FLAGS)')的结果为{'UID': '1', 'FLAGS': ['\\Seen', '\\Flagged']}或者{'UID': '1', 'FLAGS': []}
+        return [flag.lstrip('\\') for flag in self._fetch('(FLAGS)')['FLAGS']]
 
     # 把flag设置为mail的特性容易和text_body等属性造成混淆，所以统一通过add_flags,set_flags,remove_flags来设置标志
     def _store_flags(self, command: str, flags: str):
         """设置邮件标志通用方法"""
-        try:
-            flags = re.split(r',|\s+', flags)
-        except TypeError:
-            pass
+        self.server.uid('STORE', self.mail_id, command, self._format_flags(flags))
+
+    @staticmethod
+    def _format_flags(flags: list | str) -> str:
+        """校验标志并转换成imap格式，比如 ``'seen, flagged'`` 转换成 ``'\\Seen \\Flagged'``"""
+        if isinstance(flags, str):
+            flags = re.split(r'[,\s]+', flags.strip())
 
         flags = [flag.capitalize() for flag in flags]
 
@@ -218,8 +618,7 @@ class Mail:
             if flag not in VALID_FLAGS:
                 raise ValueError(f'{flag} is not a valid flag.')
 
-        flags = ' '.join([rf'\{flag}' for flag in flags])
-        self.server.store(self.mail_id, command, flags)
+        return ' '.join([rf'\{flag}' for flag in flags])
 
     def set_flags(self, flags: list | str):
         """设置邮件标识，可用标识有seen, flagged, answered, draft, deleted
@@ -259,8 +658,7 @@ class Mail:
         folder_name: str
             目的文件夹名称
         """
-        self.server.copy(self.mail_id, self.box._folders[folder_name])
-        self.add_flags('deleted')
+        self.folder.move([self], folder_name)
 
     def __repr__(self):
         return f"Mail<{self.mail_id}>"
@@ -0,0 +1,87 @@
+import email
+import os
+import tempfile
+import time
+import weakref
+from pathlib import Path
+from .utils import parse_raw_mail
+
+
+class SpilledPayload:
+    """在子进程中写入临时文件的附件或者图片内容，避免通过pickle把大段数据传回主进程
+
+    可以像路径一样传给 ``open``, ``shutil.copyfile`` 等函数，``bytes(payload)`` 或者 :meth:`read` 读取全部内容。
+    没有指定保存目录时，对象被回收以后临时文件会自动删除
+
+    Attributes
+    ----------
+    path: str
+        临时文件路径
+    size: int
+        内容的字节数
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+
+    def read(self) -> bytes:
+        return Path(self.path).read_bytes()
+
+    def __bytes__(self) -> bytes:
+        return self.read()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __fspath__(self) -> str:
+        return self.path
+
+    def __repr__(self):
+        return f"SpilledPayload<{self.path} {self.size} bytes>"
+
+
+def _spill(data: bytes, spill_dir: str | None) -> SpilledPayload:
+    fd, path = tempfile.mkstemp(prefix='imap_easybox_', suffix='.bin', dir=spill_dir)
+    with os.fdopen(fd, 'wb') as file:
+        file.write(data)
+    return SpilledPayload(path, len(data))
+
+
+def extract_batch(raws: list[bytes], spill_dir: str | None = None,
+                  spill_threshold: int | None = 1024 * 1024) -> list[tuple[dict, dict, float]]:
+    """解析一批原始邮件，在进程池的子进程中执行，函数和返回值都需要可以pickle
+
+    Returns
+    -------
+        每封邮件的 ``(邮件头, 邮件内容, 解析耗时)`` 组成的列表，邮件内容和 :func:`.parse_raw_mail` 的结构一致，
+        超过 ``spill_threshold`` 的附件和图片内容替换为 :class:`SpilledPayload`
+    """
+    results = []
+    for raw in raws:
+        start = time.perf_counter()
+        message = email.message_from_bytes(raw)
+        content = parse_raw_mail(message)
+        headers = {k.lower(): v for k, v in message.raw_items()}
+
+        if spill_threshold is not None:
+            for item in content['attachments'] + content['images']:
+                if item['content'] is not None and len(item['content']) > spill_threshold:
+                    item['content'] = _spill(item['content'], spill_dir)
+
+        results.append((headers, content, time.perf_counter() - start))
+    return results
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_on_collect(content: dict):
+    """邮件内容中的 :class:`SpilledPayload` 被回收时删除对应的临时文件"""
+    for item in content['attachments'] + content['images']:
+        if isinstance(item['content'], SpilledPayload):
+            weakref.finalize(item['content'], _remove, item['content'].path)
@@ -1,6 +1,23 @@
+import imaplib
+import json
+import os
+import re
+import time
+from array import array
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime, getaddresses
 from collections import UserList
-from typing import TYPE_CHECKING
+from collections.abc import Sequence
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple, Iterator
+from .archive import ArchivedMail, open_writer, read_archive
 from .email import Mail
+from .extract import extract_batch, remove_on_collect
+from .stats import StatsEvent, measure
+from .utils import (to_message_sets, parse_fetch_response, parse_message_set, parse_imap_list, base_subject,
+                    decode_mail_header, quote_mailbox)
 
 if TYPE_CHECKING:
     from .server import ImapEasyBox
@@ -9,7 +26,7 @@ if TYPE_CHECKING:
 class FolderList(UserList):
     """
     覆盖了 :class:`collections.UserList` 的 ``__getitem__`` 方法，可通过整数或者文件夹名称选择文件夹，在内部会调用
-    :meth:`.ImapEasyBox.select` 方法选定该文件夹
+    :meth:`.ImapEasyBox.select` 方法选定该文件夹，文件夹已经被选定时不会重复选择
 
     Examples
     ----------
@@ -25,68 +42,974 @@ class FolderList(UserList):
 
     """
 
+    def __init__(self, initlist=None):
+        super().__init__(initlist)
+        # 小写的文件夹名称和位置构成的索引，第一次按名称查找时创建
+        self._index = {}
+
+    def _find(self, name: str) -> int:
+        name = name.lower()
+        index = self._index.get(name)
+
+        # 列表被修改以后索引可能失效，重新创建
+        if index is None or index >= len(self.data) or self.data[index].folder_name.lower() != name:
+            self._index = {folder.folder_name.lower(): i for i, folder in enumerate(self.data)}
+            index = self._index.get(name)
+
+        if index is None:
+            raise KeyError(name)
+        return index
+
     def __getitem__(self, item):
         if isinstance(item, str):
-            for folder in self:
-                if item == folder.folder_name:
-                    val = folder
-                    break
-            else:
-                raise KeyError(item)
+            val = self.data[self._find(item)]
         else:
             val = super().__getitem__(item)
 
         if isinstance(val, Folder):
-            val.box.select(val.folder_name)
+            val = val.box.select(val.folder_name)
         return val
 
 
+class FolderInfo(NamedTuple):
+    """LIST命令返回的文件夹信息，保存在 :class:`.ImapEasyBox` 中，参考 :meth:`.ImapEasyBox.folder_info`"""
+    #: 解码后的文件夹名称
+    name: str
+    #: 文件夹的原始名称
+    raw_name: str
+    #: 层级分隔符，比如 ``'/'``，没有层级时为 ``None``
+    delimiter: str | None
+    #: 文件夹属性，比如 ``('\\HasNoChildren', '\\Sent')``
+    attributes: tuple
+
+    @property
+    def selectable(self) -> bool:
+        """文件夹是否可以选择，有 ``\\Noselect`` 或 ``\\NonExistent`` 属性的文件夹不能选择"""
+        return not {attribute.lower() for attribute in self.attributes} & {'\\noselect', '\\nonexistent'}
+
+    @property
+    def special_use(self) -> str | None:
+        """RFC 6154定义的特殊用途，比如 ``'\\Sent'``, ``'\\Trash'``，没有时为 ``None``"""
+        return next((attribute for attribute in self.attributes if attribute.lower() in SPECIAL_USE), None)
+
+
+class SyncResult(NamedTuple):
+    """:meth:`Folder.sync` 的返回结果"""
+    #: 新邮件
+    new: list[Mail]
+    #: 标志发生变化的邮件，键是uid，值是当前的标志列表，全量同步或者服务器不支持CONDSTORE时为 ``None``
+    changed: dict[str, list[str]] | None
+    #: 被删除邮件的uid，全量同步或者服务器不支持QRESYNC时为 ``None``
+    vanished: list[str] | None
+    #: 同步状态，可以序列化保存，下次同步时传入
+    state: dict
+    #: 是否为全量同步
+    full: bool
+
+
+class MailList(Sequence):
+    """:meth:`Folder.search` 返回的邮件序列，内部只保存uid数组，访问时才创建 :class:`.Mail` 对象
+
+    支持索引、切片和倒序遍历，切片返回新的 :class:`MailList`，和原序列共享已经创建的 :class:`.Mail` 对象。
+    设置了 ``prefetch`` 时，访问某封邮件会通过一条fetch命令获取它所在的一整页邮件
+
+    Parameters
+    ----------
+    folder: Folder
+        邮件所属的文件夹
+    uids: iterable of int or str
+        邮件的uid
+    prefetch: str, default None
+        预取的fetch数据项，比如 ``'RFC822'`` 或者 ``'BODY.PEEK[HEADER]'``，为 ``None`` 时不预取
+    page_size: int, default 500
+        每页的邮件数量
+
+    Examples
+    --------
+    >>> mails = inbox.search(prefetch='headers')
+    >>> for mail in reversed(mails[-50:]):
+    ...     print(mail.subject)
+    """
+
+    def __init__(self, folder: 'Folder', uids, prefetch: str | None = None, page_size: int = 500,
+                 _mails: dict | None = None):
+        self.folder = folder
+        # uid是32位无符号整数，保存为紧凑的数组
+        self.uids = uids if isinstance(uids, array) else array('I', (int(uid) for uid in uids))
+        self.prefetch = prefetch
+        self.page_size = page_size
+        self._mails = {} if _mails is None else _mails
+
+    def _mail(self, uid: int) -> Mail:
+        mail = self._mails.get(uid)
+        if mail is None:
+            mail = self._mails[uid] = Mail(uid, self.folder)
+        return mail
+
+    def _loaded(self, mail: Mail) -> bool:
+        if self.prefetch == 'BODY.PEEK[HEADER]':
+            return mail._headers is not None or mail._raw_mail is not None
+        return mail._raw_mail is not None
+
+    def _prefetch_page(self, index: int):
+        start = index - index % self.page_size
+        page = [self._mail(uid) for uid in self.uids[start:start + self.page_size]]
+        unloaded = [mail for mail in page if not self._loaded(mail)]
+        if unloaded:
+            self.folder.fetch(unloaded, parts=self.prefetch, batch_size=self.page_size)
+
+    def _all(self) -> list[Mail]:
+        """创建所有邮件对象，不预取内容"""
+        return [self._mail(uid) for uid in self.uids]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return MailList(self.folder, self.uids[index], self.prefetch, self.page_size, self._mails)
+
+        if index < 0:
+            index += len(self.uids)
+        if not 0 <= index < len(self.uids):
+            raise IndexError("MailList index out of range")
+
+        mail = self._mail(self.uids[index])
+        if self.prefetch is not None and not self._loaded(mail):
+            self._prefetch_page(index)
+        return mail
+
+    def __len__(self):
+        return len(self.uids)
+
+    def __contains__(self, mail):
+        return isinstance(mail, Mail) and int(mail.mail_id) in self.uids
+
+    def __repr__(self):
+        mails = [f"Mail<{uid}>" for uid in self.uids[:20]]
+        if len(self.uids) > 20:
+            mails.append('...')
+        return f"[{', '.join(mails)}]"
+
+
+class IdleEvent(NamedTuple):
+    """:meth:`Folder.idle` 返回的事件"""
+    #: 事件类型，``'EXISTS'``, ``'EXPUNGE'``, ``'FETCH'`` 或者 ``'VANISHED'``
+    type: str
+    #: EXISTS为文件夹当前的邮件数量，EXPUNGE和FETCH为邮件的序号，VANISHED为 ``None``
+    number: int | None
+    #: FETCH为数据项字典，比如 ``{'FLAGS': ['\\Seen']}``，VANISHED为被删除邮件的uid列表，其它为 ``None``
+    data: dict | list | None = None
+
+
+# 批量命令中序列集合的最大长度，RFC 7162建议命令行不超过8192字节
+MAX_MESSAGE_SET_LENGTH = 4000
+
+# RFC 6154定义的特殊用途文件夹属性
+SPECIAL_USE = ('\\all', '\\archive', '\\drafts', '\\flagged', '\\junk', '\\sent', '\\trash')
+
+# RFC 5256定义的排序条件
+SORT_KEYS = ('ARRIVAL', 'CC', 'DATE', 'FROM', 'SIZE', 'SUBJECT', 'TO')
+
+_COPYUID_RE = re.compile(r'\[COPYUID \d+ ([\d:,]+) ([\d:,]+)\]', re.I)
+_IDLE_EVENT_RE = re.compile(rb'\* (\d+) (EXISTS|EXPUNGE|FETCH)(?: (.*))?', re.I)
+_VANISHED_RE = re.compile(rb'\* VANISHED (?:\(EARLIER\) )?(.*)', re.I)
+_LINE_END_RE = re.compile(rb'\r?\n')
+
+
+def _mail_uids(mails) -> list[str]:
+    """邮件或uid组成的序列转换成uid列表，:class:`MailList` 直接使用uid数组，不创建邮件对象，也不会触发预取"""
+    if isinstance(mails, MailList):
+        return [str(uid) for uid in mails.uids]
+    return [mail.mail_id if isinstance(mail, Mail) else str(mail) for mail in mails]
+
+
+def _to_utc(value: datetime) -> datetime:
+    """没有时区的时间按UTC处理，便于比较"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _parse_internaldate(value: str | None) -> datetime:
+    """解析INTERNALDATE，比如 ``17-Jul-1996 02:44:25 -0700``"""
+    try:
+        return _to_utc(datetime.strptime(value.strip(), "%d-%b-%Y %H:%M:%S %z"))
+    except (AttributeError, ValueError):
+        return datetime.min.replace(tzinfo=timezone.utc)
+
+
 class Folder:
-    """对应邮箱中的文件夹"""
+    """对应邮箱中的文件夹
+
+    通过 :meth:`.ImapEasyBox.select` 选择文件夹后，``uidvalidity``, ``uidnext``, ``exists`` 属性会记录服务器返回的
+    ``UIDVALIDITY``, ``UIDNEXT`` 和邮件数量，服务器支持CONDSTORE时 ``highestmodseq`` 属性记录 ``HIGHESTMODSEQ``，
+    未选择时为 ``None``。邮件的uid只有在 ``uidvalidity`` 不变时才有效。
+    """
 
     def __init__(self, folder_name: str, box: 'ImapEasyBox'):
         self.box = box
         self.server = box.server
         self.folder_name = folder_name
+        self.uidvalidity = None
+        self.uidnext = None
+        self.exists = None
+        self.highestmodseq = None
 
     @property
-    def mails(self) -> list[Mail]:
+    def mails(self) -> MailList:
         """返回当前文件夹中所有邮件"""
 
         return self.search('ALL')
 
-    def search(self, query: str = None, *, encoding: str = None, **kwargs) -> list[Mail]:
+    def search(self, query: str = None, *, encoding: str = None, prefetch: bool | str = False,
+               page_size: int = 500, **kwargs) -> MailList:
         """
         根据条件搜索邮件，具体例子参考 :ref:`tutorial:搜索邮件`
 
         Parameters
         ----------
-        query: str, default None
-            原生搜索字符串，具体查看 :ref:`按原生字符串搜索 <raw search string>`
+        query: str or bytes, default None
+            原生搜索字符串，具体查看 :ref:`按原生字符串搜索 <raw search string>`，为bytes时表示已经按 ``encoding`` 编码
         encoding: str, default None
             注意，如果搜索条件包含中文，需要指定编码。是否支持该编码依赖于服务器支持
+        prefetch: bool or str, default False
+            是否通过 :meth:`fetch` 批量获取搜索结果的邮件内容，为 ``'headers'`` 时只获取邮件头。访问某封邮件时才获取它
+            所在的一整页邮件
+        page_size: int, default 500
+            预取时每页的邮件数量
         **kwargs:
             按关键字搜索，支持的关键字参考 `RFC3501 <https://www.rfc-editor.org/rfc/rfc3501#section-6.4.4>`_, 不区分大小写。
             条件之间是与的关系，如果是或，否的关系，请使用原生搜索字符串。
 
         Returns
         -------
-            返回 :class:`.Mail` 对象组成的列表
+            返回 :class:`MailList`，邮件编号为uid，访问时才创建 :class:`.Mail` 对象
 
         """
         if query is None:
             query = self._format_search_query(kwargs)
 
-        if encoding:
+        # sort, thread等方法降级时传入的是已经编码的搜索条件
+        if encoding and isinstance(query, str):
             query = query.encode(encoding)
 
-        typ, data = self.server.search(encoding, query)
+        if encoding:
+            typ, data = self.server.uid('SEARCH', 'CHARSET', encoding, query)
+        else:
+            typ, data = self.server.uid('SEARCH', query)
+
+        if typ != 'OK':
+            raise RuntimeError(data[0].decode("ascii"))
+
+        if prefetch == 'headers':
+            parts = 'BODY.PEEK[HEADER]'
+        elif prefetch:
+            parts = 'RFC822'
+        else:
+            parts = None
+
+        return MailList(self, data[0].split(), parts, page_size)
+
+    def search_local(self, query: str, *, fields: list[str] | None = None, limit: int | None = None,
+                     rank: bool = False) -> MailList:
+        """在本地全文索引中搜索邮件，不需要请求服务器，需要在创建 ``ImapEasyBox`` 时传入 ``index``
+
+        只能搜索到已经写入索引的邮件：获取过邮件头的邮件可以按主题、发件人和收件人搜索，解析过内容的邮件可以按正文搜索，
+        可以先调用 :meth:`fetch` 或者 :meth:`extract_contents` 批量写入索引。中文不需要指定编码
+
+        Parameters
+        ----------
+        query: str
+            空格分隔的搜索词，词之间是与的关系，每个词按短语匹配，不区分大小写
+        fields: list of str, default None
+            只在这些字段中搜索，可以是 ``'subject'``, ``'sender'``, ``'recipients'``, ``'body'``，默认搜索所有字段
+        limit: int, default None
+            最多返回的邮件数量
+        rank: bool, default False
+            为 ``True`` 时按相关度排序，否则按uid排序
+
+        Returns
+        -------
+            :class:`MailList`，邮件编号为uid
+
+        Examples
+        --------
+        >>> inbox.fetch(inbox.mails, 'BODY.PEEK[HEADER]')
+        >>> inbox.search_local('季度报告', fields=['subject'])
+        """
+        if self.box.index is None:
+            raise RuntimeError("local index is not enabled, pass index to ImapEasyBox")
+        if self.uidvalidity is None:
+            raise RuntimeError(f"UIDVALIDITY of folder {self.folder_name} is unknown, select it first")
+
+        uids = self.box.index.search(self.folder_name.lower(), self.uidvalidity, query, fields=fields, limit=limit,
+                                     rank=rank)
+        return MailList(self, uids)
+
+    def fetch(self, mails: list[Mail], parts: str = 'RFC822', batch_size: int = 500) -> list[Mail]:
+        """批量获取邮件内容，每批邮件只发送一条fetch命令，并填充到对应的 :class:`.Mail` 对象中
+
+        Parameters
+        ----------
+        mails: list of Mail
+            需要获取内容的邮件
+        parts: str, default 'RFC822'
+            fetch命令的数据项，多个数据项用空格分隔。如果只需要主题、发件人等元信息，可以使用
+            ``'BODY.PEEK[HEADER]'`` 只获取邮件头
+        batch_size: int, default 500
+            每条fetch命令包含的邮件数量
+
+        Returns
+        -------
+            传入的 :class:`.Mail` 对象组成的列表
+
+        Examples
+        --------
+        >>> mails = inbox.fetch(inbox.mails)
+        >>> mails[0].subject
+        """
+        mails_by_id = self._uncached(mails, parts)
+
+        for message_set in to_message_sets(mails_by_id.keys(), batch_size):
+            self._apply_fetch(mails_by_id, self._uid_fetch(self.server, message_set, parts))
+
+        return mails
+
+    def fetch_all(self, mails: list[Mail] | None = None, parts: str = 'RFC822', batch_size: int = 500,
+                  workers: int | None = None) -> list[Mail]:
+        """通过连接池并行获取邮件内容，邮件按 ``batch_size`` 分成多批，由多个连接同时获取
+
+        连接以只读方式选择文件夹，获取邮件内容不会改变邮件的已读状态
+
+        Parameters
+        ----------
+        mails: list of Mail, default None
+            需要获取内容的邮件，默认为文件夹中的所有邮件
+        parts: str, default 'RFC822'
+            fetch命令的数据项，参考 :meth:`fetch`
+        batch_size: int, default 500
+            每条fetch命令包含的邮件数量
+        workers: int, default None
+            并行的连接数，默认为 ``ImapEasyBox`` 的 ``pool_size``
+
+        Returns
+        -------
+            :class:`.Mail` 对象组成的列表，顺序和传入的邮件一致
+
+        Examples
+        --------
+        >>> mails = inbox.fetch_all(workers=8)
+        """
+        if mails is None:
+            mails = self.mails
+
+        pool = self.box.pool
+        workers = min(workers or pool.size, pool.size)
+        folder = self.box._folders[self.folder_name.lower()]
+        mails_by_id = self._uncached(mails, parts)
+
+        def fetch_batch(message_set):
+            with pool.acquire(folder, readonly=True) as server:
+                return self._uid_fetch(server, message_set, parts)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # map按提交顺序返回结果，在当前线程中填充邮件，保证顺序和线程安全
+            for data in executor.map(fetch_batch, to_message_sets(mails_by_id.keys(), batch_size)):
+                self._apply_fetch(mails_by_id, data)
+
+        return mails
+
+    def _uncached(self, mails: list[Mail], parts: str) -> dict[str, Mail]:
+        """返回需要从服务器获取的邮件，启用缓存时，已经缓存的邮件不再从服务器获取"""
+        if isinstance(mails, MailList):
+            mails = mails._all()
+        mails_by_id = {mail.mail_id: mail for mail in mails}
+
+        if self.box.cache is not None and parts in ('RFC822', 'BODY.PEEK[HEADER]'):
+            headers_only = parts == 'BODY.PEEK[HEADER]'
+            mails_by_id = {mail_id: mail for mail_id, mail in mails_by_id.items()
+                           if not mail._load_cache(headers_only)}
+
+        return mails_by_id
+
+    @staticmethod
+    def _uid_fetch(server, message_set: str, parts: str) -> list:
+        typ, data = server.uid('FETCH', message_set, f"({parts})")
 
         if typ != 'OK':
             raise RuntimeError(data[0].decode("ascii"))
 
-        mail_ids = data[0].decode('ascii').split()
-        return [Mail(i, self) for i in mail_ids]
+        return data
+
+    @staticmethod
+    def _apply_fetch(mails_by_id: dict[str, Mail], data: list):
+        """将fetch返回的数据填充到对应的邮件中"""
+        for number, attrs in parse_fetch_response(data):
+            mail = mails_by_id.get(attrs.get('UID'))
+            if mail is not None:
+                mail._update(attrs)
+
+    def extract_contents(self, mails: list[Mail] | None = None, workers: int | None = None, *,
+                         executor: Executor | None = None, batch_size: int = 50,
+                         spill_threshold: int | None = 1024 * 1024, spill_dir: str | Path | None = None) -> list[dict]:
+        """在进程池中解析邮件内容，适合批量提取大量邮件的正文和附件
+
+        解析MIME结构是纯Python的CPU计算，在线程中执行也只能用到一个CPU。这里分批获取邮件的原始内容，交给子进程调用
+        :func:`.parse_raw_mail` 解析，获取下一批邮件时子进程同时解析上一批。解析结果填充到邮件中，之后访问 ``content``,
+        ``text_body``, ``attachments`` 等属性不需要再请求服务器或者解析。
+
+        超过 ``spill_threshold`` 的附件和图片在子进程中写入临时文件，``content`` 为 :class:`.SpilledPayload`，
+        可以当作路径使用，也可以通过 ``bytes(payload)`` 读取，避免通过pickle把大段数据传回主进程。
+
+        Parameters
+        ----------
+        mails: list of Mail, default None
+            需要解析的邮件，默认为文件夹中的所有邮件，已经解析过的邮件会跳过
+        workers: int, default None
+            子进程数量，默认为CPU数量
+        executor: Executor, default None
+            使用已有的 :class:`concurrent.futures.ProcessPoolExecutor`，多次调用时可以避免重复创建进程，不会被关闭
+        batch_size: int, default 50
+            每条fetch命令获取、每个子进程任务解析的邮件数量
+        spill_threshold: int or None, default 1M
+            附件和图片写入临时文件的大小下限，为 ``None`` 时全部传回主进程
+        spill_dir: str or Path, default None
+            临时文件的保存目录，默认为系统临时目录，此时临时文件在 :class:`.SpilledPayload` 被回收时自动删除；
+            指定目录时文件会保留
+
+        Returns
+        -------
+            邮件内容组成的列表，顺序和传入的邮件一致，结构参考 :attr:`.Mail.content`
+
+        Examples
+        --------
+        >>> contents = inbox.extract_contents(workers=4)
+        >>> with ProcessPoolExecutor() as executor:
+        ...     inbox.extract_contents(inbox.mails[:1000], executor=executor)
+        """
+        if mails is None:
+            mails = self.mails
+        if isinstance(mails, MailList):
+            mails = mails._all()
+
+        stats = getattr(self.box, '_stats', None)
+        spill_path = None if spill_dir is None else str(spill_dir)
+        # 每个子进程最多排队两批，避免获取速度比解析快时所有原始内容都堆积在内存中
+        max_in_flight = 2 * (workers or os.cpu_count() or 1)
+
+        # 已经有原始内容或者缓存的邮件不需要再从服务器获取
+        local, remote = [], {}
+        for mail in mails:
+            if mail._content is not None:
+                continue
+            if mail._raw_mail is not None:
+                local.append((mail, mail._raw_mail.as_bytes()))
+                continue
+            cached = mail._cache_get()
+            if cached and cached['raw'] is not None:
+                local.append((mail, cached['raw']))
+            else:
+                remote[mail.mail_id] = mail
+
+        def apply(batch, future):
+            for (mail, raw), (headers, content, duration) in zip(batch, future.result()):
+                if spill_path is None:
+                    remove_on_collect(content)
+                mail._store_content(content)
+                mail._content = content
+                if mail._headers is None:
+                    mail._headers = headers
+                mail._index_put(mail._content_text(content))
+                if stats is not None:
+                    stats.record(StatsEvent('parse', 'content', duration, size=len(raw)))
+
+        def batches():
+            for start in range(0, len(local), batch_size):
+                yield local[start:start + batch_size]
+            for message_set in to_message_sets(remote.keys(), batch_size):
+                batch = []
+                for number, attrs in parse_fetch_response(self._uid_fetch(self.server, message_set, 'BODY.PEEK[]')):
+                    mail = remote.get(attrs.get('UID'))
+                    if mail is not None and isinstance(attrs.get('BODY[]'), bytes):
+                        mail._cache_put(raw=attrs['BODY[]'])
+                        batch.append((mail, attrs['BODY[]']))
+                if batch:
+                    yield batch
+
+        owned = executor is None
+        if owned:
+            executor = ProcessPoolExecutor(max_workers=workers)
+
+        try:
+            pending = deque()
+            for batch in batches():
+                pending.append((batch, executor.submit(extract_batch, [raw for mail, raw in batch], spill_path,
+                                                       spill_threshold)))
+                while len(pending) > max_in_flight:
+                    apply(*pending.popleft())
+            while pending:
+                apply(*pending.popleft())
+        finally:
+            if owned:
+                executor.shutdown()
+
+        return [mail._content for mail in mails]
+
+    def sync(self, state: dict | None = None) -> SyncResult:
+        """增量同步文件夹，只返回上次同步以来的变化
+
+        - 新邮件根据 ``UIDNEXT`` 获取
+        - 服务器支持CONDSTORE时，通过 ``CHANGEDSINCE`` 获取标志发生变化的邮件
+        - 服务器支持QRESYNC时，同时获取被删除邮件的uid
+        - 没有传入 ``state`` 或者 ``UIDVALIDITY`` 发生变化时，进行全量同步，所有邮件都做为新邮件返回，``changed`` 和
+          ``vanished`` 为 ``None``
+
+        Parameters
+        ----------
+        state: dict, default None
+            上次同步返回的 ``state``
+
+        Returns
+        -------
+            :class:`SyncResult` 实例
+
+        Examples
+        --------
+        >>> result = inbox.sync()
+        >>> state = result.state  # 保存状态，比如json.dump(state, f)
+        >>> result = inbox.sync(state)
+        >>> result.new, result.changed, result.vanished
+        """
+        # 启用QRESYNC以后重新选择文件夹，获取最新的UIDVALIDITY, UIDNEXT和HIGHESTMODSEQ
+        qresync = self.box._enable_qresync()
+        selected = self.box.select(self.folder_name, force=True)
+        self.uidvalidity = selected.uidvalidity
+        self.uidnext = selected.uidnext
+        self.exists = selected.exists
+        self.highestmodseq = selected.highestmodseq
+
+        uidnext = self.uidnext
+        if uidnext is None:
+            # 服务器没有返回UIDNEXT时，根据最后一封邮件的uid推算
+            last = self.search('UID *') if self.exists else []
+            uidnext = int(last[-1].mail_id) + 1 if len(last) else 1
+
+        new_state = {
+            "uidvalidity": self.uidvalidity,
+            "uidnext": uidnext,
+            "highestmodseq": self.highestmodseq,
+        }
+
+        if not state or state.get("uidvalidity") != self.uidvalidity:
+            # 全量同步没有旧状态可以比较，不返回标志变化和被删除的邮件
+            return SyncResult(self.search('ALL'), None, None, new_state, True)
+
+        # 之前保存的状态中没有UIDNEXT时，从第一封邮件开始搜索
+        since = state.get("uidnext") or 1
+
+        new = []
+        if uidnext > since:
+            # 没有新邮件时，uid n:*也会返回最后一封邮件，所以要过滤掉
+            new = [mail for mail in self.search(f"UID {since}:*") if int(mail.mail_id) >= since]
+
+        changed = vanished = None
+        modseq = state.get("highestmodseq")
+
+        if modseq and self.highestmodseq:
+            changed = {}
+            vanished = [] if qresync else None
+            if self.highestmodseq > modseq and since > 1:
+                modifiers = f"(CHANGEDSINCE {modseq}{' VANISHED' if vanished is not None else ''})"
+                typ, data = self.server.uid('FETCH', f"1:{since - 1}", '(FLAGS)', modifiers)
+
+                if typ != 'OK':
+                    raise RuntimeError(data[0].decode("ascii"))
+
+                for number, attrs in parse_fetch_response(data):
+                    changed[attrs['UID']] = [flag.lstrip('\\') for flag in attrs.get('FLAGS', [])]
+
+                if vanished is not None:
+                    # * VANISHED (EARLIER) 1:3,7
+                    typ, data = self.server.response('VANISHED')
+                    for resp in data:
+                        if resp:
+                            uids = resp.decode('ascii').replace('(EARLIER)', '').strip()
+                            vanished.extend(str(uid) for uid in parse_message_set(uids))
+
+        if vanished and self.box.index is not None:
+            self.box.index.delete(self.folder_name.lower(), self.uidvalidity, vanished)
+
+        return SyncResult(new, changed, vanished, new_state, False)
+
+    def idle(self, timeout: float | None = None, renew_interval: float = 28 * 60,
+             poll_interval: float = 30) -> Iterator[IdleEvent]:
+        """等待服务器推送文件夹的变化，返回 :class:`IdleEvent` 的生成器
+
+        服务器支持IDLE时，使用IDLE命令等待服务器推送，每隔 ``renew_interval`` 秒重新发送IDLE命令，避免服务器29分钟后
+        断开连接；不支持IDLE时，每隔 ``poll_interval`` 秒发送NOOP命令检查变化。返回事件之前会结束IDLE，处理事件时可以
+        正常使用连接，比如调用 :meth:`sync` 获取新邮件。
+
+        Parameters
+        ----------
+        timeout: float, default None
+            最长等待的秒数，为 ``None`` 时一直等待
+        renew_interval: float, default 1680
+            重新发送IDLE命令的间隔秒数
+        poll_interval: float, default 30
+            服务器不支持IDLE时，发送NOOP命令的间隔秒数
+
+        Examples
+        --------
+        >>> state = inbox.sync().state
+        >>> for event in inbox.idle():
+        ...     if event.type == 'EXISTS':
+        ...         result = inbox.sync(state)
+        ...         state = result.state
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        if not self.box.has_capability('IDLE'):
+            yield from self._poll(deadline, poll_interval)
+            return
+
+        while deadline is None or time.monotonic() < deadline:
+            until = time.monotonic() + renew_interval
+            if deadline is not None:
+                until = min(until, deadline)
+
+            tag, events = self._idle_start()
+            try:
+                if not events:
+                    events = self._idle_wait(until)
+            finally:
+                # 收到通知或者超时以后结束IDLE，返回事件时连接可以执行其它命令
+                events += self._idle_done(tag)
+
+            yield from events
+
+    def _idle_start(self) -> tuple[bytes, list[IdleEvent]]:
+        """发送IDLE命令，等待服务器的继续响应"""
+        tag = self.server._new_tag()
+        self.server.send(tag + b' IDLE\r\n')
+        events = []
+
+        while True:
+            line = self.server._get_line()
+            if line.startswith(b'+'):
+                return tag, events
+            if line.startswith(tag):
+                raise RuntimeError(line.decode('utf-8', 'replace'))
+            events.extend(self._parse_idle_line(line))
+
+    def _idle_wait(self, until: float) -> list[IdleEvent]:
+        """等待服务器推送事件，直到指定时间，超时返回空列表"""
+        sock = self.server.sock
+        original_timeout = sock.gettimeout()
+
+        try:
+            while True:
+                wait = until - time.monotonic()
+                if wait <= 0:
+                    return []
+                sock.settimeout(wait)
+                try:
+                    line = self.server._get_line()
+                except TimeoutError:
+                    # 超时以后socket的文件对象不能再读取，需要重新创建
+                    self.server.file = sock.makefile('rb')
+                    return []
+                events = self._parse_idle_line(line)
+                if events:
+                    return events
+        finally:
+            sock.settimeout(original_timeout)
+
+    def _idle_done(self, tag: bytes) -> list[IdleEvent]:
+        """发送DONE结束IDLE，返回结束前服务器推送的事件"""
+        self.server.send(b'DONE\r\n')
+        events = []
+
+        while True:
+            line = self.server._get_line()
+            if line.startswith(tag):
+                return events
+            events.extend(self._parse_idle_line(line))
+
+    @staticmethod
+    def _parse_idle_line(line: bytes) -> list[IdleEvent]:
+        match = _IDLE_EVENT_RE.match(line)
+        if match:
+            number, name, rest = match.groups()
+            name = name.decode('ascii').upper()
+            data = None
+            if name == 'FETCH':
+                data = parse_fetch_response([number + b' ' + rest])[0][1]
+            return [IdleEvent(name, int(number), data)]
+
+        match = _VANISHED_RE.match(line)
+        if match:
+            uids = [str(uid) for uid in parse_message_set(match.group(1).decode('ascii'))]
+            return [IdleEvent('VANISHED', None, uids)]
+
+        return []
+
+    def _poll(self, deadline: float | None, poll_interval: float) -> Iterator[IdleEvent]:
+        """服务器不支持IDLE时，定时发送NOOP检查变化"""
+        names = ('EXPUNGE', 'VANISHED', 'FETCH', 'EXISTS')
+
+        # 丢弃之前命令遗留的untagged响应，比如select返回的EXISTS
+        for name in names:
+            self.server.response(name)
+
+        while True:
+            self.server.noop()
+
+            for name in names:
+                typ, data = self.server.response(name)
+                data = [item for item in data if item is not None]
+                if not data:
+                    continue
+                if name == 'FETCH':
+                    for number, attrs in parse_fetch_response(data):
+                        yield IdleEvent(name, int(number), attrs)
+                elif name == 'VANISHED':
+                    for item in data:
+                        uids = item.decode('ascii').replace('(EARLIER)', '').strip()
+                        yield IdleEvent(name, None, [str(uid) for uid in parse_message_set(uids)])
+                else:
+                    for item in data:
+                        yield IdleEvent(name, int(item))
+
+            wait = poll_interval if deadline is None else min(poll_interval, deadline - time.monotonic())
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def _search_query(self, query: str | None, encoding: str | None, kwargs: dict) -> str | bytes:
+        if query is None:
+            query = self._format_search_query(kwargs) if kwargs else 'ALL'
+        return query.encode(encoding) if encoding else query
+
+    def sort(self, criteria: str | list = 'REVERSE DATE', query: str = None, *, encoding: str = None,
+             prefetch: bool | str = False, page_size: int = 500, **kwargs) -> MailList:
+        """按条件搜索邮件并排序，服务器支持SORT扩展时由服务器排序，否则获取排序需要的邮件头以后在本地排序
+
+        Parameters
+        ----------
+        criteria: str or list, default 'REVERSE DATE'
+            排序条件，可用条件有 ``ARRIVAL``, ``CC``, ``DATE``, ``FROM``, ``SIZE``, ``SUBJECT``, ``TO``，
+            条件前面加上 ``REVERSE`` 表示倒序，多个条件用空格分隔或者组成列表
+        query: str, default None
+            原生搜索字符串，为 ``None`` 时根据关键字参数搜索，都没有时为所有邮件
+        encoding: str, default None
+            搜索条件的编码，参考 :meth:`search`
+        prefetch, page_size:
+            参考 :meth:`search`
+        **kwargs:
+            按关键字搜索，参考 :meth:`search`
+
+        Returns
+        -------
+            排序后的 :class:`MailList`
+
+        Examples
+        --------
+        最新的100封来自imap.mail.com的邮件:
+
+        >>> mails = inbox.sort('REVERSE DATE', from_='imap.mail.com')[:100]
+        """
+        keys = self._parse_sort_criteria(criteria)
+        query = self._search_query(query, encoding, kwargs)
+
+        if self.box.has_capability('SORT'):
+            sort_criteria = ' '.join(('REVERSE ' if reverse else '') + key for key, reverse in keys)
+            typ, data = self.server.uid('SORT', f"({sort_criteria})", encoding or 'UTF-8', query)
+
+            if typ != 'OK':
+                raise RuntimeError(data[0].decode("ascii"))
+
+            uids = b' '.join(item for item in data if item).split()
+        else:
+            uids = self._sort_locally(keys, self.search(query, encoding=encoding).uids)
+
+        parts = {'headers': 'BODY.PEEK[HEADER]'}.get(prefetch, 'RFC822') if prefetch else None
+        return MailList(self, uids, parts, page_size)
+
+    @staticmethod
+    def _parse_sort_criteria(criteria: str | list) -> list[tuple[str, bool]]:
+        """将排序条件转换成(条件, 是否倒序)组成的列表"""
+        if isinstance(criteria, str):
+            criteria = criteria.split()
+
+        keys = []
+        reverse = False
+
+        for item in criteria:
+            item = item.upper()
+            if item == 'REVERSE':
+                reverse = True
+                continue
+            if item not in SORT_KEYS:
+                raise ValueError(f'{item} is not a valid sort criteria.')
+            keys.append((item, reverse))
+            reverse = False
+
+        return keys
+
+    def _sort_locally(self, keys: list[tuple[str, bool]], uids) -> list[int]:
+        """服务器不支持SORT时，在本地按条件稳定排序，条件相同的邮件按uid排序"""
+        values = self._sort_values(uids)
+        ordered = sorted(values)
+
+        # 从最后一个条件开始依次稳定排序
+        for key, reverse in reversed(keys):
+            ordered.sort(key=lambda uid: values[uid][key], reverse=reverse)
+
+        return ordered
+
+    def _sort_values(self, uids) -> dict[int, dict]:
+        """获取邮件排序需要的日期、大小和邮件头，返回uid和各个排序条件的值构成的字典"""
+        parts = 'INTERNALDATE RFC822.SIZE BODY.PEEK[HEADER.FIELDS (DATE SUBJECT FROM TO CC)]'
+        values = {}
+
+        for message_set in to_message_sets(uids, None, MAX_MESSAGE_SET_LENGTH):
+            for number, attrs in parse_fetch_response(self._uid_fetch(self.server, message_set, parts)):
+                header = next((value for key, value in attrs.items() if key.startswith('BODY[HEADER.FIELDS')), b'')
+                headers = Mail._parse_headers(header if isinstance(header, bytes) else b'')
+
+                def text(name):
+                    return ''.join(decode_mail_header(headers[name])) if headers.get(name) else ''
+
+                def address(name):
+                    addresses = getaddresses([text(name)])
+                    return addresses[0][1].lower() if addresses else ''
+
+                arrival = _parse_internaldate(attrs.get('INTERNALDATE'))
+                try:
+                    date = _to_utc(parsedate_to_datetime(text('date')))
+                except (TypeError, ValueError, IndexError):
+                    date = arrival
+
+                values[int(attrs['UID'])] = {
+                    'ARRIVAL': arrival,
+                    'CC': address('cc'),
+                    'DATE': date,
+                    'FROM': address('from'),
+                    'SIZE': int(attrs.get('RFC822.SIZE') or 0),
+                    'SUBJECT': base_subject(text('subject')),
+                    'TO': address('to'),
+                }
+
+        return values
+
+    def thread(self, algorithm: str | None = None, query: str = None, *, encoding: str = None,
+               **kwargs) -> list[list]:
+        """按会话归并邮件，服务器支持THREAD扩展时由服务器归并，否则在本地按主题归并(ORDEREDSUBJECT)
+
+        Parameters
+        ----------
+        algorithm: str, default None
+            归并算法，``'REFERENCES'`` 或者 ``'ORDEREDSUBJECT'``，为 ``None`` 时优先使用服务器支持的 ``REFERENCES``
+        query: str, default None
+            原生搜索字符串，为 ``None`` 时根据关键字参数搜索，都没有时为所有邮件
+        encoding: str, default None
+            搜索条件的编码，参考 :meth:`search`
+        **kwargs:
+            按关键字搜索，参考 :meth:`search`
+
+        Returns
+        -------
+            会话组成的列表，每个会话是邮件和子会话组成的嵌套列表，和RFC 5256的THREAD响应结构一致，
+            比如 ``[Mail<3>, Mail<6>, [Mail<4>, Mail<23>], [Mail<44>]]`` 表示3的回复是6，6有两个分支
+
+        Examples
+        --------
+        >>> for thread in inbox.thread():
+        ...     print(thread[0].subject, len(thread))
+        """
+        if algorithm is None:
+            algorithm = next((name for name in ('REFERENCES', 'ORDEREDSUBJECT')
+                              if self.box.has_capability(f'THREAD={name}')), 'ORDEREDSUBJECT')
+        algorithm = algorithm.upper()
+        query = self._search_query(query, encoding, kwargs)
+
+        if self.box.has_capability(f'THREAD={algorithm}'):
+            typ, data = self.server.uid('THREAD', algorithm, encoding or 'UTF-8', query)
+
+            if typ != 'OK':
+                raise RuntimeError(data[0].decode("ascii"))
+
+            threads = parse_imap_list(b''.join(item for item in data if item))
+        else:
+            threads = self._thread_locally(self.search(query, encoding=encoding).uids)
+
+        return self._build_threads(threads)
+
+    def _thread_locally(self, uids) -> list[list]:
+        """按主题归并会话，会话内按日期排序，第一封邮件为其它邮件的父节点"""
+        values = self._sort_values(uids)
+        threads = {}
+
+        for uid in sorted(values, key=lambda uid: (values[uid]['DATE'], uid)):
+            threads.setdefault(values[uid]['SUBJECT'], []).append(str(uid))
+
+        return [[first] + [[uid] for uid in rest] for first, *rest in threads.values()]
+
+    def _build_threads(self, threads: list) -> list:
+        return [self._build_threads(item) if isinstance(item, list) else Mail(item, self) for item in threads]
+
+    def search_stats(self, query: str = None, *, returns: tuple | list = ('MIN', 'MAX', 'COUNT'),
+                     encoding: str = None, **kwargs) -> dict:
+        """只返回搜索结果的统计信息，服务器支持ESEARCH时不需要返回所有邮件的uid
+
+        Parameters
+        ----------
+        query: str, default None
+            原生搜索字符串，为 ``None`` 时根据关键字参数搜索，都没有时为所有邮件
+        returns: tuple or list, default ('MIN', 'MAX', 'COUNT')
+            需要返回的统计信息，可用的有 ``MIN``, ``MAX``, ``COUNT``, ``ALL``
+        encoding: str, default None
+            搜索条件的编码，参考 :meth:`search`
+        **kwargs:
+            按关键字搜索，参考 :meth:`search`
+
+        Returns
+        -------
+            小写的统计名称和值构成的字典，``min`` 和 ``max`` 为最小和最大的uid，没有搜索到邮件时为 ``None``，
+            ``count`` 为邮件数量，``all`` 为 :class:`MailList`
+
+        Examples
+        --------
+        >>> inbox.search_stats(seen=False)
+        {'min': 3, 'max': 1024, 'count': 96}
+        """
+        returns = [item.upper() for item in returns]
+        query = self._search_query(query, encoding, kwargs)
+
+        if self.box.has_capability('ESEARCH'):
+            args = ['RETURN', f"({' '.join(returns)})"] + (['CHARSET', encoding] if encoding else []) + [query]
+            typ, data = self.server.uid('SEARCH', *args)
+
+            if typ != 'OK':
+                raise RuntimeError(data[0].decode("ascii"))
+
+            # ESEARCH响应: * ESEARCH (TAG "A5") UID MIN 1 MAX 9 COUNT 5 ALL 1:3,5,7:9
+            typ, data = self.server.response('ESEARCH')
+            tokens = [token for token in parse_imap_list(b' '.join(item for item in data if item))
+                      if isinstance(token, str) and token.upper() != 'UID']
+            values = {key.upper(): value for key, value in zip(tokens[::2], tokens[1::2])}
+            uids = parse_message_set(values['ALL']) if 'ALL' in values else []
+        else:
+            uids = list(self.search(query, encoding=encoding).uids)
+            values = {'MIN': min(uids, default=None), 'MAX': max(uids, default=None), 'COUNT': len(uids)}
+
+        result = {}
+        for item in returns:
+            if item == 'ALL':
+                result['all'] = MailList(self, uids)
+            elif item == 'COUNT':
+                result['count'] = int(values.get('COUNT', 0))
+            else:
+                value = values.get(item)
+                result[item.lower()] = int(value) if value is not None else None
+
+        return result
 
     @staticmethod
     def _format_search_query(kwargs):
@@ -108,6 +1031,297 @@ class Folder:
         query = f"({' '.join(criteria)})"
         return query
 
+    def add_flags(self, mails: list[Mail | str | int], flags: list | str, silent: bool = True) -> dict[str, list]:
+        """批量添加邮件标志，可用标志有seen, flagged, answered, draft, deleted
+
+        邮件的uid会压缩成序列集合，比如 ``1:200,305,400:900``，一条STORE命令可以设置大量邮件的标志
+
+        Parameters
+        ----------
+        mails: list of Mail, str or int
+            邮件或者邮件的uid
+        flags: list or str
+            标志构成的列表，或者多个标志组成的字符串，标志之间用逗号或空格分隔
+        silent: bool, default True
+            为 ``True`` 时使用 ``+FLAGS.SILENT``，服务器不返回邮件修改后的标志
+
+        Returns
+        -------
+            ``silent`` 为 ``False`` 时返回uid和修改后标志构成的字典，否则返回空字典
+
+        Examples
+        --------
+        >>> inbox.add_flags(inbox.search(seen=False), 'seen')
+        """
+        return self._store_flags(mails, '+FLAGS', flags, silent)
+
+    def set_flags(self, mails: list[Mail | str | int], flags: list | str, silent: bool = True) -> dict[str, list]:
+        """批量设置邮件标志，参数和 :meth:`add_flags` 相同"""
+        return self._store_flags(mails, 'FLAGS', flags, silent)
+
+    def remove_flags(self, mails: list[Mail | str | int], flags: list | str, silent: bool = True) -> dict[str, list]:
+        """批量删除邮件标志，参数和 :meth:`add_flags` 相同"""
+        return self._store_flags(mails, '-FLAGS', flags, silent)
+
+    def _store_flags(self, mails: list[Mail | str | int], command: str, flags: list | str,
+                     silent: bool) -> dict[str, list]:
+        # 标志只需要校验一次
+        flags = Mail._format_flags(flags)
+        if silent:
+            command += '.SILENT'
+
+        uids = _mail_uids(mails)
+        result = {}
+
+        for message_set in to_message_sets(uids, None, MAX_MESSAGE_SET_LENGTH):
+            typ, data = self.server.uid('STORE', message_set, command, f"({flags})")
+
+            if typ != 'OK':
+                raise RuntimeError(data[0].decode("ascii"))
+
+            if not silent:
+                for number, attrs in parse_fetch_response([item for item in data if item is not None]):
+                    if 'UID' in attrs and 'FLAGS' in attrs:
+                        result[attrs['UID']] = [flag.lstrip('\\') for flag in attrs['FLAGS']]
+
+        return result
+
+    def move(self, mails: list[Mail | str | int], folder_name: str) -> dict[str, str]:
+        """批量移动邮件到指定文件夹
+
+        服务器支持MOVE时使用 ``UID MOVE`` 命令；否则使用 ``UID COPY`` 复制邮件并添加 ``\\Deleted`` 标志，服务器支持UIDPLUS
+        时再通过 ``UID EXPUNGE`` 删除这些邮件，不支持时邮件只会被标记为删除，不会影响文件夹中其它标记为删除的邮件。
+
+        Parameters
+        ----------
+        mails: list of Mail, str or int
+            邮件或者邮件的uid
+        folder_name: str
+            目的文件夹名称
+
+        Returns
+        -------
+            服务器支持UIDPLUS时，返回原uid和目的文件夹中新uid构成的字典，否则返回空字典
+
+        Examples
+        --------
+        >>> inbox.move(inbox.search(before='01-Jan-2020'), 'archive')
+        """
+        dest = quote_mailbox(self.box._folders[folder_name.lower()])
+        uids = _mail_uids(mails)
+        use_move = self.box.has_capability('MOVE')
+        use_expunge = self.box.has_capability('UIDPLUS')
+        copied = {}
+
+        for message_set in to_message_sets(uids, None, MAX_MESSAGE_SET_LENGTH):
+            if use_move:
+                typ, data = self.server.uid('MOVE', message_set, dest)
+                self._check_response(typ, data)
+                # MOVE的COPYUID在untagged响应中返回: * OK [COPYUID 1234 1:3 7:9] Moved
+                typ, codes = self.server.response('COPYUID')
+                copied.update(self._parse_copyuid([b'[COPYUID ' + code + b']' for code in codes if code]))
+                continue
+
+            # uid方法只返回untagged响应，COPYUID在tagged响应中返回: OK [COPYUID 1234 1:3 7:9] COPY completed
+            typ, data = self.server._simple_command('UID', 'COPY', message_set, dest)
+            self._check_response(typ, data)
+            copied.update(self._parse_copyuid(data))
+            # imaplib同时把tagged响应中的响应码保存在untagged_responses中，不丢弃会一直累积
+            self.server.response('COPYUID')
+
+            typ, data = self.server.uid('STORE', message_set, '+FLAGS.SILENT', r'(\Deleted)')
+            self._check_response(typ, data)
+
+            if use_expunge:
+                typ, data = self.server.uid('EXPUNGE', message_set)
+                self._check_response(typ, data)
+
+        # 丢弃被删除邮件的untagged响应
+        self.server.response('EXPUNGE')
+        self.server.response('VANISHED')
+
+        # 已经从当前文件夹删除的邮件不应该再被本地搜索到
+        if self.box.index is not None and self.uidvalidity is not None and (use_move or use_expunge):
+            self.box.index.delete(self.folder_name.lower(), self.uidvalidity, uids)
+
+        return copied
+
+    @staticmethod
+    def _check_response(typ: str, data: list):
+        if typ != 'OK':
+            raise RuntimeError(data[0].decode("ascii"))
+
+    @staticmethod
+    def _parse_copyuid(data: list) -> dict[str, str]:
+        """解析COPYUID响应码，返回原uid和新uid构成的字典"""
+        copied = {}
+        for item in data:
+            if not isinstance(item, bytes):
+                continue
+            match = _COPYUID_RE.search(item.decode('ascii', 'replace'))
+            if match:
+                source, dest = (parse_message_set(message_set) for message_set in match.groups())
+                copied.update((str(old), str(new)) for old, new in zip(source, dest))
+        return copied
+
+    def export(self, path: str | Path, format: str = 'mbox', *, batch_size: int = 500, resume: bool = True) -> int:
+        """将文件夹中的邮件导出为mbox文件、Maildir目录或者eml文件
+
+        邮件按uid顺序分批获取，原始内容直接写入磁盘，不需要解析邮件。写入在单独的线程中进行，和下一批邮件的获取同时执行。
+        每写完一批邮件，在 ``<path>.checkpoint`` 中记录已经导出的最大uid，中断以后再次调用会从检查点继续，导出完成以后
+        再次调用只会导出新邮件。
+
+        Parameters
+        ----------
+        path: str or Path
+            mbox文件路径，或者Maildir, eml文件所在的目录
+        format: str, default 'mbox'
+            ``'mbox'``, ``'maildir'`` 或 ``'eml'``
+        batch_size: int, default 500
+            每条fetch命令获取的邮件数量
+        resume: bool, default True
+            是否从检查点继续导出，为 ``False`` 时重新导出所有邮件，mbox文件会被覆盖
+
+        Returns
+        -------
+            本次导出的邮件数量
+
+        Examples
+        --------
+        >>> inbox.export('inbox.mbox')
+        >>> inbox.export('backup/inbox', format='maildir')
+        """
+        path = Path(path)
+        checkpoint_path = path.with_name(path.name + '.checkpoint')
+        state = None
+        if resume and checkpoint_path.exists():
+            state = json.loads(checkpoint_path.read_text('utf-8'))
+            if state['uidvalidity'] != self.uidvalidity:
+                raise RuntimeError(f"UIDVALIDITY of {self.folder_name} changed, "
+                                   f"delete {checkpoint_path} or set resume=False to export again")
+
+        last_uid = state['uid'] if state else 0
+        uids = [uid for uid in self.mails.uids if uid > last_uid]
+        writer = open_writer(path, format, self.uidvalidity, state)
+
+        stats = getattr(self.box, '_stats', None)
+
+        def write_batch(mails: list[ArchivedMail]):
+            with measure(stats, 'write', format, sum(len(mail.data) for mail in mails)):
+                writer.write(mails)
+            checkpoint = {'uidvalidity': self.uidvalidity, 'uid': mails[-1].uid, **writer.state()}
+            tmp_path = checkpoint_path.with_name(checkpoint_path.name + '.tmp')
+            tmp_path.write_text(json.dumps(checkpoint), 'utf-8')
+            os.replace(tmp_path, checkpoint_path)
+
+        count = 0
+        try:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                future = None
+                for message_set in to_message_sets(uids, batch_size):
+                    data = self._uid_fetch(self.server, message_set, 'BODY.PEEK[] FLAGS INTERNALDATE')
+                    mails = sorted((self._archived_mail(attrs) for number, attrs in parse_fetch_response(data)
+                                    if isinstance(attrs.get('BODY[]'), bytes)), key=lambda mail: mail.uid)
+                    if not mails:
+                        continue
+                    # 等待上一批写完再提交，保证检查点按顺序更新
+                    if future is not None:
+                        future.result()
+                    future = executor.submit(write_batch, mails)
+                    count += len(mails)
+                if future is not None:
+                    future.result()
+        finally:
+            writer.close()
+
+        return count
+
+    @staticmethod
+    def _archived_mail(attrs: dict) -> ArchivedMail:
+        date = _parse_internaldate(attrs.get('INTERNALDATE'))
+        return ArchivedMail(int(attrs['UID']), attrs['BODY[]'], tuple(attrs.get('FLAGS', ())),
+                            None if date.year == 1 else date)
+
+    def import_(self, path: str | Path, format: str | None = None, *, batch_size: int = 100,
+                max_batch_bytes: int = 16 * 1024 * 1024) -> int:
+        """将mbox文件、Maildir目录或者eml文件中的邮件导入当前文件夹
+
+        服务器支持MULTIAPPEND时，每批邮件只发送一条APPEND命令，否则连续发送多条APPEND命令，不等待上一条命令的响应；
+        服务器支持LITERAL+时，发送邮件内容前不需要等待服务器的继续响应。Maildir中的标志和邮件的日期会一起导入。
+
+        Parameters
+        ----------
+        path: str or Path
+            mbox文件路径，或者Maildir, eml文件所在的目录
+        format: str, default None
+            ``'mbox'``, ``'maildir'`` 或 ``'eml'``，为 ``None`` 时根据路径自动判断
+        batch_size: int, default 100
+            每批导入的最大邮件数量
+        max_batch_bytes: int, default 16M
+            每批导入的最大字节数
+
+        Returns
+        -------
+            导入的邮件数量
+
+        Examples
+        --------
+        >>> box.select('archive').import_('inbox.mbox')
+        """
+        count = 0
+        batch, batch_bytes = [], 0
+
+        for mail in read_archive(path, format):
+            if batch and (len(batch) >= batch_size or batch_bytes + len(mail.data) > max_batch_bytes):
+                count += self._append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(mail)
+            batch_bytes += len(mail.data)
+
+        if batch:
+            count += self._append(batch)
+
+        return count
+
+    def _append(self, mails: list[ArchivedMail]) -> int:
+        """通过APPEND命令上传邮件，支持MULTIAPPEND时所有邮件在一条命令中上传，否则连续发送多条命令"""
+        server = self.server
+        mailbox = quote_mailbox(self.box._folders[self.folder_name.lower()]).encode('ascii')
+        literal_plus = self.box.has_capability('LITERAL+')
+        commands = [mails] if self.box.has_capability('MULTIAPPEND') else [[mail] for mail in mails]
+        tags = []
+
+        for command in commands:
+            tag = server._new_tag()
+            line = tag + b' APPEND ' + mailbox
+            for mail in command:
+                data = _LINE_END_RE.sub(b'\r\n', mail.data)
+                flags = ' '.join(flag for flag in mail.flags if flag.lower() != '\\recent')
+                line += f" ({flags})".encode('ascii')
+                if mail.date is not None:
+                    line += b' ' + imaplib.Time2Internaldate(mail.date).encode('ascii')
+                line += b' {%d%s}\r\n' % (len(data), b'+' if literal_plus else b'')
+                server.send(line)
+                # 没有LITERAL+时需要等待服务器的继续响应，服务器拒绝时直接返回tagged响应
+                if not literal_plus:
+                    while server._get_response():
+                        if server.tagged_commands[tag]:
+                            break
+                    if server.tagged_commands[tag]:
+                        break
+                server.send(data)
+                line = b''
+            else:
+                server.send(b'\r\n')
+            tags.append(tag)
+
+        # 所有命令发送完以后再依次读取响应
+        results = [server._command_complete('APPEND', tag) for tag in tags]
+        for typ, data in results:
+            self._check_response(typ, data)
+
+        return len(mails)
+
     def rename(self, folder_name: str):
         """更改当前文件夹名称
 
@@ -118,7 +1332,6 @@ class Folder:
         """
         self.box.rename_folder(self.folder_name, folder_name)
         self.folder_name = folder_name
-        self.box.update_folders()
 
     def delete(self):
         """删除当前文件夹
@@ -130,5 +1343,10 @@ class Folder:
         self.box = None
         self.server = None
 
+    @property
+    def info(self) -> FolderInfo:
+        """文件夹的层级分隔符、属性等信息，参考 :meth:`.ImapEasyBox.folder_info`"""
+        return self.box.folder_info(self.folder_name)
+
     def __repr__(self):
         return f"Folder<{self.folder_name}>"
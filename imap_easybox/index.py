@@ -0,0 +1,226 @@
+import html
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+# 中文、日文假名和韩文，这些文字没有空格分词，按相邻两个字切分
+_CJK_RE = re.compile(r'([぀-ヿ㐀-䶿一-鿿豈-﫿가-힯]+)')
+_TAG_RE = re.compile(r'<(script|style)\b.*?</\1\s*>|<[^>]+>', re.S | re.I)
+
+# 可以搜索的字段，和FTS5表的列一致
+INDEX_FIELDS = ('subject', 'sender', 'recipients', 'body')
+
+
+def segment(text: str) -> str:
+    """切分文本中的CJK字符，用于写入索引
+
+    连续的CJK字符切分成相邻两个字组成的词，最后再加上单独的最后一个字，比如 ``'会议室'`` 切分成 ``'会议 议室 室'``，
+    其它文字交给FTS5的unicode61分词器处理
+
+    Examples
+    --------
+    >>> segment('Q3季度报告')
+    'Q3 季度 度报 报告 告'
+    """
+    parts = []
+    for index, part in enumerate(_CJK_RE.split(text)):
+        if index % 2 == 0:
+            parts.append(part)
+        else:
+            parts.append(' '.join([part[i:i + 2] for i in range(len(part) - 1)] + [part[-1]]))
+    return ' '.join(part for part in parts if part)
+
+
+def _query_term(term: str) -> str:
+    """将一个搜索词转换成FTS5的短语，CJK字符按相邻两个字切分，单独一个字时按前缀匹配"""
+    parts = _CJK_RE.split(term)
+    tokens = []
+    for index, part in enumerate(parts):
+        if index % 2 == 0 or len(part) == 1:
+            tokens.append(part)
+        else:
+            tokens.extend(part[i:i + 2] for i in range(len(part) - 1))
+    # 以单独一个CJK字结尾时按前缀匹配，比如"会"可以匹配索引中的"会议"
+    prefix = len(parts) > 1 and len(parts[-2]) == 1 and not parts[-1].strip()
+    phrase = ' '.join(token for token in tokens if token.strip())
+    return '"' + phrase.replace('"', '""') + '"' + (' *' if prefix else '')
+
+
+def build_query(query: str, fields: list[str] | tuple | None = None) -> str:
+    """将空格分隔的搜索词转换成FTS5查询，词之间是与的关系
+
+    Examples
+    --------
+    >>> build_query('季度报告 pdf', fields=['subject'])
+    '{subject} : ("季度 度报 报告" AND "pdf")'
+    """
+    terms = [_query_term(term) for term in query.split()]
+    if not terms:
+        raise ValueError("query must not be empty")
+
+    expression = ' AND '.join(terms)
+    if fields:
+        unknown = set(fields) - set(INDEX_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown fields {sorted(unknown)}, must be in {INDEX_FIELDS}")
+        expression = f"{{{' '.join(fields)}}} : ({expression})"
+    return expression
+
+
+def html_to_text(html_body: str) -> str:
+    """去掉html标签、脚本和样式，用于索引html邮件的正文"""
+    return html.unescape(_TAG_RE.sub(' ', html_body))
+
+
+class MailIndex:
+    """基于SQLite FTS5的本地全文索引，以 ``(文件夹, UIDVALIDITY, uid)`` 为键索引邮件的主题、发件人、收件人和正文
+
+    获取邮件头或者解析邮件内容时自动写入索引，通过 :meth:`.Folder.search_local` 搜索，不需要请求服务器。
+    中文等CJK文字按相邻两个字切分后写入索引，可以搜索任意长度的词
+
+    Parameters
+    ----------
+    path: str or Path, default 'imap_easybox_index.db'
+        索引数据库文件路径，为 ``':memory:'`` 时索引只保存在内存中
+
+    Examples
+    --------
+    >>> box = ImapEasyBox('imap.mail.com', user='username', password='password', index='index.db')
+    >>> inbox = box.select('inbox')
+    >>> inbox.extract_contents()
+    >>> inbox.search_local('季度报告')
+    """
+
+    # 每写入多少次提交一次事务，同一个连接中的搜索可以看到未提交的数据
+    COMMIT_INTERVAL = 100
+
+    def __init__(self, path: str | Path = 'imap_easybox_index.db'):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY,
+                folder TEXT NOT NULL,
+                uidvalidity INTEGER NOT NULL,
+                uid INTEGER NOT NULL,
+                UNIQUE (folder, uidvalidity, uid)
+            )
+        """)
+        self._conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS mail_fts USING fts5(
+                {', '.join(INDEX_FIELDS)}, tokenize = 'unicode61 remove_diacritics 2'
+            )
+        """)
+        self._conn.commit()
+
+    def put(self, folder: str, uidvalidity: int, uid: int | str, *, subject: str | None = None,
+            sender: str | None = None, recipients: str | None = None, body: str | None = None):
+        """写入索引，只更新传入的字段"""
+        fields = {name: segment(value) for name, value in
+                  (('subject', subject), ('sender', sender), ('recipients', recipients), ('body', body))
+                  if value is not None}
+        if not fields:
+            return
+
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM docs WHERE folder = ? AND uidvalidity = ? AND uid = ?",
+                                     (folder, uidvalidity, int(uid))).fetchone()
+            if row is None:
+                doc_id = self._conn.execute("INSERT INTO docs (folder, uidvalidity, uid) VALUES (?, ?, ?)",
+                                            (folder, uidvalidity, int(uid))).lastrowid
+                names = ', '.join(fields)
+                self._conn.execute(f"INSERT INTO mail_fts (rowid, {names}) VALUES (?{', ?' * len(fields)})",
+                                   (doc_id, *fields.values()))
+            else:
+                assignments = ', '.join(f"{name} = ?" for name in fields)
+                self._conn.execute(f"UPDATE mail_fts SET {assignments} WHERE rowid = ?", (*fields.values(), row[0]))
+
+            self._writes += 1
+            if self._writes % self.COMMIT_INTERVAL == 0:
+                self._conn.commit()
+
+    def search(self, folder: str, uidvalidity: int, query: str, *, fields: list[str] | tuple | None = None,
+               limit: int | None = None, rank: bool = False) -> list[int]:
+        """搜索文件夹中的邮件，返回uid组成的列表
+
+        Parameters
+        ----------
+        folder: str
+            小写的文件夹名称
+        uidvalidity: int
+            文件夹当前的 ``UIDVALIDITY``，其它 ``UIDVALIDITY`` 的旧索引不会被搜索到
+        query: str
+            空格分隔的搜索词，词之间是与的关系，每个词按短语匹配
+        fields: list of str, default None
+            只在这些字段中搜索，可以是 ``'subject'``, ``'sender'``, ``'recipients'``, ``'body'``，默认搜索所有字段
+        limit: int, default None
+            最多返回的数量
+        rank: bool, default False
+            为 ``True`` 时按相关度排序，否则按uid排序
+        """
+        # CROSS JOIN强制先查全文索引再查docs，否则SQLite可能先遍历文件夹中的所有邮件再逐条匹配
+        sql = f"""
+            SELECT docs.uid FROM mail_fts CROSS JOIN docs ON docs.id = mail_fts.rowid
+            WHERE mail_fts MATCH ? AND docs.folder = ? AND docs.uidvalidity = ?
+            ORDER BY {'mail_fts.rank' if rank else 'docs.uid'}
+            {'LIMIT ?' if limit is not None else ''}
+        """
+        params = [build_query(query, fields), folder, uidvalidity]
+        if limit is not None:
+            params.append(limit)
+
+        with self._lock:
+            return [uid for uid, in self._conn.execute(sql, params)]
+
+    def delete(self, folder: str, uidvalidity: int, uids: list[int | str]):
+        """删除已经移动或者删除的邮件的索引"""
+        with self._lock:
+            for uid in uids:
+                row = self._conn.execute("SELECT id FROM docs WHERE folder = ? AND uidvalidity = ? AND uid = ?",
+                                         (folder, uidvalidity, int(uid))).fetchone()
+                if row is not None:
+                    self._conn.execute("DELETE FROM mail_fts WHERE rowid = ?", row)
+                    self._conn.execute("DELETE FROM docs WHERE id = ?", row)
+            self._conn.commit()
+
+    def evict(self, uidvalidities: dict[str, int]):
+        """删除文件夹中 ``UIDVALIDITY`` 和当前不同的旧索引，``uidvalidities`` 为文件夹名称和当前 ``UIDVALIDITY`` 构成的字典"""
+        with self._lock:
+            for folder, uidvalidity in uidvalidities.items():
+                self._conn.execute("""
+                    DELETE FROM mail_fts WHERE rowid IN (SELECT id FROM docs WHERE folder = ? AND uidvalidity != ?)
+                """, (folder, uidvalidity))
+                self._conn.execute("DELETE FROM docs WHERE folder = ? AND uidvalidity != ?", (folder, uidvalidity))
+            self._conn.commit()
+
+    def clear(self, folder: str | None = None):
+        """清空索引，指定 ``folder`` 时只清空该文件夹的索引"""
+        with self._lock:
+            if folder is None:
+                self._conn.execute("DELETE FROM mail_fts")
+                self._conn.execute("DELETE FROM docs")
+            else:
+                self._conn.execute("DELETE FROM mail_fts WHERE rowid IN (SELECT id FROM docs WHERE folder = ?)",
+                                   (folder,))
+                self._conn.execute("DELETE FROM docs WHERE folder = ?", (folder,))
+            self._conn.commit()
+
+    def commit(self):
+        """提交未提交的写入"""
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        """提交写入并关闭数据库连接"""
+        self.commit()
+        self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM docs").fetchone()[0]
+
+    def __repr__(self):
+        return f"MailIndex<{self.path}>"
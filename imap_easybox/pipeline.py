@@ -0,0 +1,211 @@
+from collections import deque
+from typing import TYPE_CHECKING, Callable
+from .email import Mail
+from .folder import Folder, MailList, MAX_MESSAGE_SET_LENGTH
+from .utils import to_message_sets, quote_mailbox
+
+if TYPE_CHECKING:
+    from .server import ImapEasyBox
+
+
+class PipelineResult:
+    """:class:`Pipeline` 中排队的命令，执行以后 ``typ`` 和 ``data`` 和 :mod:`imaplib` 的返回值一致
+
+    Attributes
+    ----------
+    typ: str
+        命令的结果，``'OK'``, ``'NO'`` 或 ``'BAD'``，执行之前为 ``None``
+    data: list
+        命令返回的untagged响应数据，比如FETCH返回的邮件数据
+    text: list
+        tagged响应的文本，比如 ``[b'[COPYUID 1234 1:3 7:9] COPY completed']``
+    """
+
+    def __init__(self, name: str, args: tuple, untagged: str | None = None, callback: Callable | None = None,
+                 check: bool = False):
+        self.name = name
+        self.args = args
+        self.untagged = untagged
+        self.callback = callback
+        self.check = check
+        self.typ = None
+        self.data = None
+        self.text = None
+
+    @property
+    def done(self) -> bool:
+        """命令是否已经执行"""
+        return self.typ is not None
+
+    def __repr__(self):
+        return f"PipelineResult<{self.name} {' '.join(map(str, self.args))[:50]} {self.typ}>"
+
+
+class PipelineResultGroup(PipelineResult):
+    """邮件较多时，``fetch``, ``store``, ``copy`` 按序列集合的长度拆分成多条命令，返回的结果合并了这些命令的结果
+
+    ``typ`` 在所有命令都执行以后才不为 ``None``，有命令失败时为第一个失败命令的结果；``data`` 和 ``text`` 依次拼接各条命令的结果
+
+    Attributes
+    ----------
+    parts: list of PipelineResult
+        拆分后的各条命令
+    """
+
+    def __init__(self, parts: list[PipelineResult]):
+        self.parts = parts
+        self.name = parts[0].name
+        self.args = parts[0].args
+
+    @property
+    def typ(self) -> str | None:
+        if not all(part.done for part in self.parts):
+            return None
+        return next((part.typ for part in self.parts if part.typ != 'OK'), 'OK')
+
+    @property
+    def data(self) -> list | None:
+        return [item for part in self.parts for item in part.data] if self.done else None
+
+    @property
+    def text(self) -> list | None:
+        return [item for part in self.parts for item in part.text] if self.done else None
+
+
+class Pipeline:
+    """连续发送多条命令，不等待上一条命令的响应，最后按tag依次读取所有响应，命令只需要一次往返时间
+
+    通过 :meth:`.ImapEasyBox.pipeline` 创建，退出with语句时执行所有排队的命令。``fetch``, ``store``, ``copy`` 返回非OK
+    时抛出 :class:`RuntimeError`，``command`` 和 ``uid`` 需要自己检查 ``typ``。``mails`` 为空时抛出 :class:`ValueError`
+
+    Examples
+    --------
+    >>> inbox = box.select('inbox')
+    >>> with box.pipeline() as pipe:
+    ...     flags = pipe.fetch(mail, 'FLAGS')
+    ...     pipe.store(mail, '+FLAGS', 'seen')
+    ...     pipe.copy(mail, 'archive')
+    >>> flags.data
+    """
+
+    # 同时等待响应的最大命令数，避免服务器的接收缓冲区写满以后双方互相等待
+    MAX_IN_FLIGHT = 100
+
+    def __init__(self, box: 'ImapEasyBox'):
+        self.box = box
+        self.server = box.server
+        self._queue = []
+
+    def command(self, name: str, *args, untagged: str | None = None) -> PipelineResult:
+        """添加任意命令，``untagged`` 为需要收集的untagged响应名称，比如 ``'STATUS'``"""
+        result = PipelineResult(name.upper(), args, untagged)
+        self._queue.append(result)
+        return result
+
+    def uid(self, command: str, *args) -> PipelineResult:
+        """添加UID命令，参数和 :meth:`imaplib.IMAP4.uid` 一致"""
+        command = command.upper()
+        untagged = command if command in ('SEARCH', 'SORT', 'THREAD') else 'FETCH'
+        return self.command('UID', command, *args, untagged=untagged)
+
+    def fetch(self, mails, parts: str = 'RFC822') -> PipelineResult:
+        """获取邮件数据，``mails`` 为 :class:`.Mail` 时，执行以后自动填充邮件内容，参数参考 :meth:`.Folder.fetch`"""
+        message_sets, mails_by_id = self._message_sets(mails)
+        if isinstance(mails, MailList):
+            # 执行以后填充序列中的邮件对象
+            mails_by_id = {mail.mail_id: mail for mail in mails._all()}
+        callback = (lambda data: Folder._apply_fetch(mails_by_id, data)) if mails_by_id else None
+        return self._checked([self.uid('FETCH', message_set, f"({parts})") for message_set in message_sets],
+                             callback)
+
+    def store(self, mails, command: str, flags: list | str) -> PipelineResult:
+        """设置邮件标志，``command`` 为 ``'FLAGS'``, ``'+FLAGS'`` 或 ``'-FLAGS'``，可以加上 ``.SILENT``"""
+        message_sets, mails_by_id = self._message_sets(mails)
+        flags = f"({Mail._format_flags(flags)})"
+        return self._checked([self.uid('STORE', message_set, command, flags) for message_set in message_sets])
+
+    def copy(self, mails, folder_name: str) -> PipelineResult:
+        """复制邮件到指定文件夹"""
+        message_sets, mails_by_id = self._message_sets(mails)
+        dest = quote_mailbox(self.box._folders[folder_name.lower()])
+        return self._checked([self.uid('COPY', message_set, dest) for message_set in message_sets])
+
+    @staticmethod
+    def _checked(results: list[PipelineResult], callback: Callable | None = None) -> PipelineResult:
+        """执行后需要检查结果的命令，拆分成多条命令时返回合并的 :class:`PipelineResultGroup`"""
+        for result in results:
+            result.check = True
+            result.callback = callback
+        return results[0] if len(results) == 1 else PipelineResultGroup(results)
+
+    @staticmethod
+    def _message_sets(mails) -> tuple[list[str], dict[str, Mail]]:
+        """将邮件、uid或者它们组成的列表转换成序列集合，按长度拆分，避免命令超过服务器的长度限制"""
+        if isinstance(mails, (Mail, str, int)):
+            mails = [mails]
+        elif not isinstance(mails, MailList):
+            # 生成器只能遍历一次
+            mails = list(mails)
+        # 没有邮件时不能生成序列集合，提前报错，避免排队一条空命令
+        if not mails:
+            raise ValueError("mails must not be empty")
+
+        if isinstance(mails, MailList):
+            # 直接使用uid数组，不创建邮件对象，也不会触发预取
+            return to_message_sets(mails.uids, None, MAX_MESSAGE_SET_LENGTH), {}
+        mails_by_id = {mail.mail_id: mail for mail in mails if isinstance(mail, Mail)}
+        uids = [mail.mail_id if isinstance(mail, Mail) else str(mail) for mail in mails]
+
+        # 已经是序列集合时直接使用
+        if len(uids) == 1 and not uids[0].isdigit():
+            return uids, mails_by_id
+        return to_message_sets(uids, None, MAX_MESSAGE_SET_LENGTH), mails_by_id
+
+    def execute(self) -> list[PipelineResult]:
+        """发送所有排队的命令并读取响应，返回执行的 :class:`PipelineResult` 列表"""
+        queue, self._queue = self._queue, []
+        pending = deque()
+
+        for result in queue:
+            if len(pending) >= self.MAX_IN_FLIGHT:
+                self._complete(*pending.popleft())
+            pending.append((result, self.server._command(result.name, *result.args)))
+
+        while pending:
+            self._complete(*pending.popleft())
+
+        for result in queue:
+            if result.check and result.typ != 'OK':
+                raise RuntimeError(f"{result.name} {result.args[0]} failed: {result.text}")
+
+        return queue
+
+    def _complete(self, result: PipelineResult, tag: bytes):
+        # 服务器按顺序处理命令，读到这条命令的tagged响应时，之前收到的untagged响应都属于这条命令
+        try:
+            typ, data = self.server._command_complete(result.name, tag)
+        except self.server.abort:
+            raise
+        except self.server.error as e:
+            # BAD响应，继续读取后面命令的响应，保持连接可用
+            typ, data = 'BAD', [str(e).encode()]
+
+        result.text = data
+        if result.untagged is not None and typ == 'OK':
+            typ, data = self.server._untagged_response(typ, data, result.untagged)
+        result.typ, result.data = typ, data
+
+        if typ == 'OK' and result.callback is not None:
+            result.callback(data)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+        else:
+            self._queue = []
@@ -0,0 +1,172 @@
+import imaplib
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+from .utils import quote_mailbox
+
+if TYPE_CHECKING:
+    from .server import ImapEasyBox
+
+
+class _PooledConnection:
+    """连接池中的一个连接，记录当前选择的文件夹"""
+
+    def __init__(self, server: imaplib.IMAP4):
+        self.server = server
+        self.folder = None
+        self.readonly = None
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """多个已登录的imap连接组成的连接池，每个连接可以选择不同的文件夹，用于并行获取邮件
+
+    连接在第一次使用时才登录，使用完毕后放回连接池复用，不会重复登录。空闲超过 ``health_check_interval`` 秒的连接，
+    再次使用前会发送NOOP检查是否可用，不可用时重新登录。
+
+    Parameters
+    ----------
+    box: ImapEasyBox
+        连接池所属的邮箱，使用邮箱的服务器地址和用户名密码登录
+    size: int, default 4
+        最大连接数
+    health_check_interval: float, default 60
+        空闲多少秒以后需要检查连接
+
+    Examples
+    --------
+    >>> box = ImapEasyBox('imap.mail.com', user='username', password='password', pool_size=8)
+    >>> pool = box.pool
+    >>> with pool.acquire(box._folders['inbox']) as server:
+    ...     server.uid('FETCH', '1:100', '(FLAGS)')
+    """
+
+    def __init__(self, box: 'ImapEasyBox', size: int = 4, health_check_interval: float = 60):
+        self.box = box
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self._idle = []
+        self._created = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def _take(self, folder: str | None) -> _PooledConnection | None:
+        """从空闲连接中取出一个连接，优先选择已经选择了该文件夹的连接，需要持有锁"""
+        for index, conn in enumerate(self._idle):
+            if conn.folder == folder:
+                return self._idle.pop(index)
+        return self._idle.pop() if self._idle else None
+
+    def _check(self, conn: _PooledConnection) -> _PooledConnection:
+        """检查空闲较久的连接，不可用时重新登录"""
+        if time.monotonic() - conn.last_used < self.health_check_interval:
+            return conn
+
+        try:
+            conn.server.noop()
+            return conn
+        except (imaplib.IMAP4.error, OSError):
+            self._shutdown(conn)
+            return _PooledConnection(self.box.connect())
+
+    @staticmethod
+    def _shutdown(conn: _PooledConnection):
+        try:
+            conn.server.shutdown()
+        except OSError:
+            pass
+
+    @staticmethod
+    def _logout(conn: _PooledConnection):
+        try:
+            conn.server.logout()
+        except (imaplib.IMAP4.error, OSError):
+            pass
+
+    @contextmanager
+    def acquire(self, folder: str | None = None, readonly: bool = False):
+        """取出一个连接，使用完毕后自动放回连接池
+
+        Parameters
+        ----------
+        folder: str, default None
+            文件夹的原始名称，不为 ``None`` 时连接会选择该文件夹
+        readonly: bool, default False
+            是否以只读方式选择文件夹(EXAMINE)，只读时获取邮件内容不会将邮件标记为已读
+        """
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("connection pool is closed")
+                conn = self._take(folder)
+                if conn is not None:
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                self._condition.wait()
+
+        try:
+            conn = self._check(conn) if conn is not None else _PooledConnection(self.box.connect())
+        except BaseException:
+            # 登录或者重新登录失败，比如密码错误(IMAP4.error)，不能把已经断开的连接放回连接池
+            self._discard(conn)
+            raise
+
+        try:
+            if folder is not None and (conn.folder != folder or conn.readonly != readonly):
+                # SELECT失败时服务器会取消之前选择的文件夹
+                conn.folder = conn.readonly = None
+                typ, data = conn.server.select(quote_mailbox(folder), readonly)
+                if typ != 'OK':
+                    raise RuntimeError(data[0].decode("ascii"))
+                conn.folder, conn.readonly = folder, readonly
+
+            yield conn.server
+        except (imaplib.IMAP4.abort, OSError):
+            # 连接已经断开，不再放回连接池
+            self._discard(conn)
+            raise
+        except BaseException:
+            self._release(conn)
+            raise
+        else:
+            self._release(conn)
+
+    def _discard(self, conn: _PooledConnection | None):
+        """关闭不可用的连接，腾出一个连接数"""
+        if conn is not None:
+            self._shutdown(conn)
+        with self._condition:
+            self._created -= 1
+            self._condition.notify()
+
+    def _release(self, conn: _PooledConnection):
+        with self._condition:
+            if not self._closed:
+                conn.last_used = time.monotonic()
+                self._idle.append(conn)
+                self._condition.notify()
+                return
+            self._created -= 1
+
+        # 连接池关闭时正在使用的连接，放回时退出登录
+        self._logout(conn)
+
+    def close(self):
+        """退出连接池中所有的连接，正在使用的连接在放回时退出"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._condition.notify_all()
+
+        for conn in idle:
+            self._logout(conn)
+
+    def __len__(self):
+        return self._created
+
+    def __repr__(self):
+        return f"ConnectionPool<{self._created}/{self.size}>"
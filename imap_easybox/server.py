@@ -1,7 +1,15 @@
 import imaplib
-from typing import Union
-from .folder import Folder, FolderList
-from .utils import imap_utf7_encode, imap_utf7_decode
+from pathlib import Path
+from typing import Callable, Union
+from .cache import MailCache
+from .index import MailIndex
+from .store import AttachmentStore
+from .compress import DeflateSocket, start_compression
+from .folder import Folder, FolderList, FolderInfo
+from .pipeline import Pipeline
+from .pool import ConnectionPool
+from .stats import Stats, StatsEvent, IMAP4, IMAP4_SSL
+from .utils import imap_utf7_encode, imap_utf7_decode, parse_list_response, parse_imap_list, quote_mailbox
 
 
 class ImapEasyBox:
@@ -19,6 +27,18 @@ class ImapEasyBox:
         密码，也可以稍后在调用 ``login`` 方法时指定
     ssl: bool, default True
         为 ``True``, 则内部使用 :class:`imaplib.IMAP4`，否则使用 :class:`imaplib.IMAP4_SSL` 创建实例
+    cache: MailCache or str, default None
+        本地邮件缓存，可以是 :class:`.MailCache` 实例或者缓存数据库的路径，启用后邮件内容和邮件头优先从缓存读取
+    pool_size: int, default 4
+        连接池的最大连接数，连接池用于 :meth:`.Folder.fetch_all` 等并行操作，第一次使用时才会创建连接
+    compress: bool, default False
+        服务器支持COMPRESS=DEFLATE时压缩传输的数据，连接池中的连接也会压缩，适合带宽受限时批量下载邮件
+    index: MailIndex or str, default None
+        本地全文索引，可以是 :class:`.MailIndex` 实例或者索引数据库的路径，启用后获取的邮件头和解析的正文自动写入索引，
+        可以通过 :meth:`.Folder.search_local` 搜索
+    attachment_store: AttachmentStore or str, default None
+        按内容寻址的附件仓库，可以是 :class:`.AttachmentStore` 实例或者仓库目录，启用后相同内容的附件只下载、保存一份，
+        ``save_attachments`` 通过硬链接保存附件
     kwargs:
         任意关键字参数，会透传给 :class:`imaplib.IMAP4` 或 :class:`imaplib.IMAP4_SSL` 构造函数
 
@@ -47,18 +67,39 @@ class ImapEasyBox:
     server: Union[imaplib.IMAP4, imaplib.IMAP4_SSL, None]
 
     def __init__(self, host: str, port=993, user: str | None = None, password: str | None = None, ssl: bool = True,
-                 **kwargs):
+                 cache: MailCache | str | Path | None = None, pool_size: int = 4, compress: bool = False,
+                 index: MailIndex | str | Path | None = None,
+                 attachment_store: AttachmentStore | str | Path | None = None, **kwargs):
         self.host = host
         self.port = port
         self.user = user
         self.password = password
-        self.imap_cls = getattr(imaplib, 'IMAP4_SSL') if ssl else getattr(imaplib, 'IMAP4')
+        self.imap_cls = IMAP4_SSL if ssl else IMAP4
         self.server = None
         self.kwargs = kwargs
-        # self._folders是邮箱中文名和原始名称构成的字典
-        self._folders = None
-
-    def login(self, user: str | None = None, password: str | None = None):
+        self.cache = MailCache(cache) if isinstance(cache, (str, Path)) else cache
+        self.index = MailIndex(index) if isinstance(index, (str, Path)) else index
+        self.attachment_store = (AttachmentStore(attachment_store) if isinstance(attachment_store, (str, Path))
+                                 else attachment_store)
+        self.pool_size = pool_size
+        self.compress = compress
+        self._pool = None
+        # 小写的文件夹名称和FolderInfo构成的字典，为None时下次访问重新获取
+        self._folder_info = None
+        # 小写的文件夹名称和原始名称构成的字典
+        self._folder_names = None
+        # 当前选择的文件夹的原始名称和是否只读，以及选择时返回的Folder
+        self._selected = None
+        self._selected_folder = None
+        # 本次登录以来每个文件夹的UIDVALIDITY，发生变化时删除缓存和索引中的旧数据
+        self._uidvalidities = {}
+        # 通过ENABLE命令启用的扩展，以及是否已经尝试过启用QRESYNC
+        self._enabled = set()
+        self._qresync_checked = False
+        # 所有连接的命令统计信息
+        self._stats = Stats()
+
+    def login(self, user: str | None = None, password: str | None = None, compress: bool | None = None):
         """登陆邮箱
 
         Parameters
@@ -67,22 +108,165 @@ class ImapEasyBox:
             用户名，如果已指定，则可忽略
         password: str, default None
             密码，如果已指定，则可忽略
+        compress: bool, default None
+            是否通过COMPRESS=DEFLATE压缩传输的数据，为 ``None`` 时使用创建实例时的设置，服务器不支持时不压缩，
+            可以通过 ``compressed`` 特性确认是否已经启用
 
         """
-        if user is None:
-            user = self.user
-        if password is None:
-            password = self.password
+        if user is not None:
+            self.user = user
+        if password is not None:
+            self.password = password
+        if compress is not None:
+            self.compress = compress
+
+        self.server = self.connect()
+        self._enabled = set()
+        self._qresync_checked = False
+        self._selected = self._selected_folder = None
+
+        self.update_folders()
 
-        self.server = self.imap_cls(self.host, self.port, **self.kwargs)
+    def connect(self) -> imaplib.IMAP4:
+        """创建一个新的连接并登录，返回 :class:`imaplib.IMAP4` 或 :class:`imaplib.IMAP4_SSL` 实例"""
+        server = self.imap_cls(self.host, self.port, **self.kwargs)
+        server._stats = self._stats
         # 登录成果返回('OK', [b'LOGIN completed'])
         # 用户名密码错误抛出异常imaplib.IMAP4.error: b'LOGIN failure, invalid username/password'
         # 邮箱地址错误抛出异常imaplib.IMAP4.error: LOGIN command error: BAD [b'LOGIN failure, domain is disable.']
-        self.server.login(user, password)
-        self.update_folders()
+        server.login(self.user, self.password)
+        self._update_capabilities(server)
+
+        # 必须在登录以后启用压缩，有些服务器登录以后才返回COMPRESS=DEFLATE
+        if self.compress:
+            start_compression(server)
+        return server
+
+    @property
+    def compressed(self) -> bool:
+        """当前连接是否已经启用COMPRESS=DEFLATE压缩"""
+        return self.server is not None and isinstance(self.server.sock, DeflateSocket)
+
+    def stats(self) -> dict:
+        """返回所有连接的命令统计信息，以及解析邮件、写入磁盘的耗时
+
+        Returns
+        -------
+            字典，``commands``, ``parse``, ``write`` 中是按名称汇总的统计信息，包括次数、错误次数、总耗时、收发字节数，
+            以及耗时直方图 ``buckets``，键是桶的上限(秒)，值是耗时小于等于上限的累计次数，和Prometheus的直方图一致。
+            ``round_trips``, ``bytes_sent``, ``bytes_received`` 是所有命令的合计，``compressed`` 表示当前连接是否启用了
+            压缩，启用时 ``compression`` 中是压缩前后的字节数
+
+        Examples
+        --------
+        >>> box.stats()['commands']['UID FETCH']
+        {'count': 3, 'errors': 0, 'total_time': 0.12, 'mean_time': 0.04, ..., 'buckets': {0.005: 0, ...}}
+        """
+        result = self._stats.snapshot()
+        result['compressed'] = self.compressed
+        if result['compressed']:
+            sock = self.server.sock
+            result['compression'] = {
+                'bytes_sent': sock.bytes_sent, 'bytes_received': sock.bytes_received,
+                'raw_bytes_sent': sock.raw_bytes_sent, 'raw_bytes_received': sock.raw_bytes_received,
+                'ratio': sock.ratio,
+            }
+        return result
+
+    def reset_stats(self):
+        """清空统计信息"""
+        self._stats.reset()
+
+    def add_observer(self, callback: Callable[[StatsEvent], None]):
+        """添加观察者，每条命令完成、每次解析邮件或者写入磁盘以后，都会在当前线程中调用 ``callback(event)``
+
+        ``event`` 为 :class:`.StatsEvent`，可以在回调中转发到OpenTelemetry, Prometheus等监控系统，回调不应该抛出异常
+
+        Examples
+        --------
+        >>> box.add_observer(lambda event: print(event.name, event.duration))
+        """
+        self._stats.add_observer(callback)
+
+    def remove_observer(self, callback: Callable[[StatsEvent], None]):
+        """移除观察者"""
+        self._stats.remove_observer(callback)
+
+    @property
+    def pool(self) -> ConnectionPool:
+        """连接池，第一次访问时创建，最大连接数为 ``pool_size``"""
+        if self._pool is None:
+            self._pool = ConnectionPool(self, self.pool_size)
+        return self._pool
+
+    def pipeline(self) -> Pipeline:
+        """创建 :class:`.Pipeline`，在with语句中添加的命令会在退出时连续发送，只需要一次往返时间
+
+        Examples
+        --------
+        >>> with box.pipeline() as pipe:
+        ...     pipe.fetch(mails, 'BODY.PEEK[HEADER]')
+        ...     pipe.store(mails, '+FLAGS.SILENT', 'seen')
+        """
+        return Pipeline(self)
+
+    @staticmethod
+    def _update_capabilities(server: imaplib.IMAP4):
+        """登录以后服务器可能支持更多的扩展，重新获取服务器的capabilities"""
+        typ, data = server.capability()
+        if typ == 'OK' and data and data[-1]:
+            server.capabilities = tuple(data[-1].decode('ascii').upper().split())
+
+    def has_capability(self, capability: str) -> bool:
+        """服务器是否支持指定的扩展，比如 ``'IDLE'``, ``'MOVE'``"""
+        return capability.upper() in self.server.capabilities
+
+    def enable(self, *extensions: str) -> set:
+        """通过ENABLE命令启用扩展，返回服务器实际启用的扩展，只能在选择文件夹之前调用"""
+        self.server.enable(' '.join(extensions))
+        # 实际启用的扩展在untagged响应中返回: * ENABLED QRESYNC CONDSTORE
+        typ, data = self.server.response('ENABLED')
+        for resp in data:
+            if resp:
+                self._enabled.update(resp.decode('ascii').upper().split())
+        return self._enabled
+
+    def _enable_qresync(self) -> bool:
+        """第一次同步文件夹时才启用QRESYNC，返回是否已经启用
+
+        启用以后服务器用VANISHED代替EXPUNGE响应，所以不在登录时启用；ENABLE只能在没有选择文件夹时发送，
+        已经选择了文件夹时先通过UNSELECT取消选择，服务器不支持UNSELECT或者拒绝启用时不再尝试
+        """
+        if self._qresync_checked:
+            return 'QRESYNC' in self._enabled
+        self._qresync_checked = True
+
+        if not (self.has_capability('QRESYNC') and self.has_capability('ENABLE')):
+            return False
+
+        if self.server.state == 'SELECTED':
+            if not self.has_capability('UNSELECT'):
+                return False
+            self.server.unselect()
+            self._selected = self._selected_folder = None
+
+        try:
+            self.enable('QRESYNC')
+        except imaplib.IMAP4.error:
+            return False
+        return 'QRESYNC' in self._enabled
 
     def quit(self):
-        """退出登录"""
+        """退出登录，同时退出连接池中的所有连接"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+        if self.cache is not None:
+            self.cache.commit()
+        if self.index is not None:
+            self.index.commit()
+
         # 需要先选择select邮箱，然后再close，否则会抛出错误
         try:
             self.server.close()
@@ -101,24 +285,65 @@ class ImapEasyBox:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.quit()
 
-    def select(self, folder_name: str) -> Folder:
+    def select(self, folder_name: str, readonly: bool = False, force: bool = False) -> Folder:
         """选择文件夹
 
-        登录以后，必须先选择一个文件夹
+        登录以后，必须先选择一个文件夹。文件夹已经以相同的方式选择时，不会重复发送SELECT命令
 
         Parameters
         ----------
         folder_name: str
             文件夹名称
+        readonly: bool, default False
+            是否以只读方式选择(EXAMINE)
+        force: bool, default False
+            是否强制重新选择，重新选择可以获取文件夹最新的 ``UIDNEXT`` 和邮件数量
 
         Returns
         -------
         Folder
-            返回一个 :class:`Folder` 实例
+            返回一个 :class:`Folder` 实例，并记录文件夹的 ``UIDVALIDITY``, ``UIDNEXT``, ``HIGHESTMODSEQ`` 和邮件数量
         """
         folder_raw_name = self._folders[folder_name.lower()]
-        self.server.select(folder_raw_name)
-        return Folder(folder_name, self)
+        selected = self._selected_folder
+
+        # 用户可能通过box.close()等方法改变了连接状态，所以同时检查imaplib的状态
+        if not force and self._selected == (folder_raw_name, readonly) and self.server.state == 'SELECTED':
+            folder = Folder(folder_name, self)
+            folder.exists, folder.uidvalidity = selected.exists, selected.uidvalidity
+            folder.uidnext, folder.highestmodseq = selected.uidnext, selected.highestmodseq
+            return folder
+
+        self._selected = self._selected_folder = None
+        typ, data = self.server.select(quote_mailbox(folder_raw_name), readonly)
+
+        if typ != 'OK':
+            raise RuntimeError(data[0].decode("ascii"))
+
+        folder = Folder(folder_name, self)
+        folder.exists = int(data[0])
+        folder.uidvalidity = self._response_code('UIDVALIDITY')
+        folder.uidnext = self._response_code('UIDNEXT')
+        folder.highestmodseq = self._response_code('HIGHESTMODSEQ')
+        self._selected, self._selected_folder = (folder_raw_name, readonly), folder
+        self._check_uidvalidity(folder_name.lower(), folder.uidvalidity)
+        return folder
+
+    def _check_uidvalidity(self, folder_name: str, uidvalidity: int | None):
+        """文件夹第一次选择或者 ``UIDVALIDITY`` 发生变化时，删除缓存和索引中其它 ``UIDVALIDITY`` 的旧数据"""
+        if uidvalidity is None or self._uidvalidities.get(folder_name) == uidvalidity:
+            return
+        self._uidvalidities[folder_name] = uidvalidity
+
+        if self.cache is not None:
+            self.cache.evict({folder_name: uidvalidity})
+        if self.index is not None:
+            self.index.evict({folder_name: uidvalidity})
+
+    def _response_code(self, code: str) -> int | None:
+        """获取select等命令返回的响应码，比如 ``* OK [UIDVALIDITY 3857529045]``"""
+        typ, data = self.server.response(code)
+        return int(data[-1]) if data and data[-1] is not None else None
 
     @property
     def folders(self) -> FolderList:
@@ -135,49 +360,171 @@ class ImapEasyBox:
         """
         return FolderList(Folder(folder_name, self) for folder_name in self._folders.keys())
 
+    @property
+    def _folders(self) -> dict[str, str]:
+        """小写的文件夹名称和原始名称构成的字典，文件夹信息失效时重新获取"""
+        if self._folder_names is None:
+            self.update_folders()
+        return self._folder_names
+
     def update_folders(self):
         """更新文件夹列表
 
-        获取当前所有文件夹，更新内部 ``_folders`` 属性，``_folders`` 是一个字典，键是解析后的文件夹名称，
-        值是文件夹的原始名称
+        获取当前所有文件夹，缓存文件夹的原始名称、层级分隔符和属性，键是解析后的小写文件夹名称
         """
-        self._folders = {}
-
         # list返回的结果是('OK', [b'(\\Marked) "/" "INBOX"', b'(\\Marked) "/" "&XfJT0ZAB-"'])
         typ, data = self.server.list()
 
         # 结果中类似&XfJT0ZAB-的字符串是utf7编码，并且把+号替换回&符号
-        for folder_byte in data:
-            folder_name_byte = folder_byte.split(b' ')[-1].replace(b'"', b'')
-            folder_name_key = imap_utf7_decode(folder_name_byte).lower()
-            folder_name_val = folder_name_byte.decode('ascii')
-            self._folders[folder_name_key] = folder_name_val
+        folder_info = {}
+        for attributes, delimiter, raw_name in parse_list_response(data):
+            name = imap_utf7_decode(raw_name.encode('ascii'))
+            folder_info[name.lower()] = FolderInfo(name, raw_name, delimiter, attributes)
+
+        self._set_folder_info(folder_info)
+
+    def _set_folder_info(self, folder_info: dict[str, FolderInfo] | None):
+        self._folder_info = folder_info
+        self._folder_names = ({key: info.raw_name for key, info in folder_info.items()}
+                              if folder_info is not None else None)
+
+    def invalidate_folders(self):
+        """使缓存的文件夹信息失效，下次访问时重新获取，其它客户端修改了文件夹时调用"""
+        self._set_folder_info(None)
+
+    def folder_info(self, folder_name: str) -> FolderInfo:
+        """返回文件夹的原始名称、层级分隔符和属性，比如是否可以选择、特殊用途
+
+        Examples
+        --------
+        >>> box.folder_info('已发送')
+        FolderInfo(name='已发送', raw_name='&XfJT0ZAB-', delimiter='/', attributes=('\\HasNoChildren', '\\Sent'))
+        >>> box.folder_info('已发送').special_use
+        '\\Sent'
+        """
+        if self._folder_info is None:
+            self.update_folders()
+        return self._folder_info[folder_name.lower()]
+
+    def status(self, folders: list[str] | None = None,
+               items: tuple | list = ('MESSAGES', 'UNSEEN', 'UIDNEXT')) -> dict[str, dict]:
+        """获取文件夹的邮件数量等信息，不需要选择文件夹
+
+        服务器支持LIST-STATUS时，一条LIST命令返回所有文件夹的信息，否则对每个文件夹发送STATUS命令，所有STATUS命令连续发送
+
+        Parameters
+        ----------
+        folders: list of str, default None
+            文件夹名称，默认为所有文件夹
+        items: tuple or list, default ('MESSAGES', 'UNSEEN', 'UIDNEXT')
+            需要获取的信息，可用的有 ``MESSAGES``, ``RECENT``, ``UIDNEXT``, ``UIDVALIDITY``, ``UNSEEN``，
+            服务器支持CONDSTORE时还可以获取 ``HIGHESTMODSEQ``
+
+        Returns
+        -------
+            小写的文件夹名称和信息构成的字典，信息的键为小写，比如 ``{'inbox': {'messages': 3, 'unseen': 1, 'uidnext': 5}}``，
+            无法获取信息的文件夹(比如不能选择的文件夹)不在结果中
+
+        Examples
+        --------
+        >>> box.status()
+        {'inbox': {'messages': 30, 'unseen': 2, 'uidnext': 31}, '垃圾箱': {...}, ...}
+        """
+        names = [name.lower() for name in (folders if folders is not None else self._folders)]
+        raw_names = {self._folders[name]: name for name in names}
+        items = f"({' '.join(item.upper() for item in items)})"
+
+        if self.has_capability('LIST-STATUS'):
+            # LIST "" "*" RETURN (STATUS (MESSAGES UNSEEN))会同时返回LIST和STATUS响应
+            typ, data = self.server._simple_command('LIST', '""', '*', 'RETURN', f"(STATUS {items})")
+            self.server.response('LIST')
+            typ, data = self.server._untagged_response(typ, data, 'STATUS')
+            if typ != 'OK':
+                raise RuntimeError(data[0].decode("ascii"))
+        else:
+            with self.pipeline() as pipe:
+                results = [pipe.command('STATUS', quote_mailbox(raw_name), items, untagged='STATUS')
+                           for raw_name in raw_names]
+            # 不能选择的文件夹返回NO，忽略这些文件夹
+            data = [item for result in results if result.typ == 'OK' for item in result.data]
+
+        result = {}
+        for raw_name, values in self._parse_status(data):
+            if raw_name in raw_names:
+                result[raw_names[raw_name]] = values
+
+        return result
+
+    @staticmethod
+    def _parse_status(data: list) -> list[tuple[str, dict]]:
+        """解析STATUS响应，比如 ``b'"INBOX" (MESSAGES 3 UNSEEN 1)'``，返回原始名称和信息构成的元组组成的列表"""
+        results = []
+        tokens = parse_imap_list([item for item in data if item is not None])
+
+        for name, values in zip(tokens[::2], tokens[1::2]):
+            if isinstance(name, bytes):
+                name = name.decode('utf-8')
+            results.append((name, {key.lower(): int(value) for key, value in zip(values[::2], values[1::2])}))
+
+        return results
 
     def create_folder(self, folder_name: str):
-        """创建文件夹，创建成功更新邮箱所有文件夹"""
+        """创建文件夹，创建成功以后文件夹信息失效，下次访问时重新获取"""
         # 创建已存在的文件夹返回('NO', [b'CREATE Folder exist']
-        folder_name = imap_utf7_encode(folder_name)
-        self.server.create(folder_name)
-        self.update_folders()
+        folder_name = imap_utf7_encode(folder_name).decode('ascii')
+        typ, data = self.server.create(quote_mailbox(folder_name))
+
+        if typ == 'OK':
+            self.invalidate_folders()
 
     def rename_folder(self, old_folder_name: str, new_folder_name: str):
-        """修改指定文件夹名称，修改成功更新邮箱所有文件夹"""
+        """修改指定文件夹名称，修改成功以后直接更新缓存的文件夹信息，包括所有子文件夹"""
         try:
-            old_folder_name = self._folders[old_folder_name.lower()]
+            old_info = self.folder_info(old_folder_name)
         except KeyError:
             raise NameError(f"Folder<{old_folder_name}>不存在")
 
-        new_folder_name = imap_utf7_encode(new_folder_name).decode('ascii')
-        self.server.rename(old_folder_name, new_folder_name)
-        self.update_folders()
+        new_raw_name = imap_utf7_encode(new_folder_name).decode('ascii')
+        typ, data = self.server.rename(quote_mailbox(old_info.raw_name), quote_mailbox(new_raw_name))
+
+        if typ != 'OK':
+            return
+
+        if self._selected is not None and self._selected[0] == old_info.raw_name:
+            self._selected = self._selected_folder = None
+
+        # 子文件夹的名称以父文件夹名称和分隔符开头，同时被重命名
+        prefix = old_info.raw_name + (old_info.delimiter or '')
+        folder_info = {}
+        for key, info in self._folder_info.items():
+            if info.raw_name == old_info.raw_name:
+                raw_name = new_raw_name
+            elif old_info.delimiter and info.raw_name.startswith(prefix):
+                raw_name = new_raw_name + info.raw_name[len(old_info.raw_name):]
+            else:
+                folder_info[key] = info
+                continue
+            name = imap_utf7_decode(raw_name.encode('ascii'))
+            folder_info[name.lower()] = info._replace(name=name, raw_name=raw_name)
+
+        self._set_folder_info(folder_info)
 
     def delete_folder(self, folder_name: str):
-        """删除指定文件夹，删除成功更新邮箱所有文件夹"""
+        """删除指定文件夹，删除成功以后从缓存的文件夹信息中删除"""
         # 删除不存在的文件夹会返回('NO', [b'DELETE Folder not exist'])
         try:
-            folder_name = self._folders[folder_name.lower()]
+            raw_name = self._folders[folder_name.lower()]
         except KeyError:
             raise NameError(f"Folder<{folder_name}>不存在")
 
-        self.server.delete(folder_name)
-        self.update_folders()
+        typ, data = self.server.delete(quote_mailbox(raw_name))
+
+        if typ != 'OK':
+            return
+
+        if self._selected is not None and self._selected[0] == raw_name:
+            self._selected = self._selected_folder = None
+
+        folder_info = dict(self._folder_info)
+        del folder_info[folder_name.lower()]
+        self._set_folder_info(folder_info)
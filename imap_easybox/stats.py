@@ -0,0 +1,235 @@
+import imaplib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, NamedTuple
+
+# 耗时直方图每个桶的上限(秒)，和Prometheus客户端默认的桶一致
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+class StatsEvent(NamedTuple):
+    """:class:`Stats` 记录的一次命令或者操作，也会传给通过 :meth:`.ImapEasyBox.add_observer` 添加的观察者"""
+    #: ``'command'`` 表示imap命令，``'parse'`` 表示解析邮件，``'write'`` 表示写入磁盘
+    kind: str
+    #: 命令名称，比如 ``'UID FETCH'``，或者操作名称，比如 ``'message'``, ``'eml'``
+    name: str
+    #: 耗时(秒)，命令从分配tag开始计算，到读取完tagged响应为止
+    duration: float
+    #: 命令发送的字节数
+    bytes_sent: int = 0
+    #: 读取命令响应时接收的字节数
+    bytes_received: int = 0
+    #: 解析或者写入的字节数
+    size: int = 0
+    #: 命令的tag
+    tag: str | None = None
+    #: 命令的结果，``'OK'``, ``'NO'``, ``'BAD'``，抛出异常时为 ``'ERROR'``
+    typ: str | None = None
+
+
+class _Histogram:
+    """同一名称的命令或者操作的统计信息"""
+
+    __slots__ = ('count', 'errors', 'total', 'min', 'max', 'bytes_sent', 'bytes_received', 'size', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.size = 0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, event: StatsEvent):
+        self.count += 1
+        if event.typ not in (None, 'OK'):
+            self.errors += 1
+        self.total += event.duration
+        self.min = event.duration if self.min is None else min(self.min, event.duration)
+        self.max = event.duration if self.max is None else max(self.max, event.duration)
+        self.bytes_sent += event.bytes_sent
+        self.bytes_received += event.bytes_received
+        self.size += event.size
+        for index, bound in enumerate(BUCKETS):
+            if event.duration <= bound:
+                self.buckets[index] += 1
+                break
+
+    def to_dict(self) -> dict:
+        # 和Prometheus一样，每个桶记录耗时小于等于上限的累计次数
+        cumulative, buckets = 0, {}
+        for bound, count in zip(BUCKETS, self.buckets):
+            cumulative += count
+            buckets[bound] = cumulative
+        buckets[float('inf')] = self.count
+
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total_time': self.total,
+            'mean_time': self.total / self.count if self.count else 0.0,
+            'min_time': self.min,
+            'max_time': self.max,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'size': self.size,
+            'buckets': buckets,
+        }
+
+
+class _Timer:
+    __slots__ = ('size',)
+
+    def __init__(self, size: int):
+        self.size = size
+
+
+class Stats:
+    """记录imap命令的耗时、收发字节数，以及解析邮件、写入磁盘的耗时，按名称汇总成直方图
+
+    每个 :class:`.ImapEasyBox` 有一个 :class:`Stats`，连接池中的连接也记录在同一个对象中，可以在多个线程中使用。
+    通过 :meth:`.ImapEasyBox.stats` 获取汇总结果，通过 :meth:`.ImapEasyBox.add_observer` 接收每一条记录。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self.observers = []
+
+    def add_observer(self, callback: Callable[[StatsEvent], None]):
+        self.observers.append(callback)
+
+    def remove_observer(self, callback: Callable[[StatsEvent], None]):
+        self.observers.remove(callback)
+
+    def record(self, event: StatsEvent):
+        with self._lock:
+            histogram = self._histograms.get((event.kind, event.name))
+            if histogram is None:
+                histogram = self._histograms[(event.kind, event.name)] = _Histogram()
+            histogram.add(event)
+
+        for callback in self.observers:
+            callback(event)
+
+    @contextmanager
+    def timer(self, kind: str, name: str, size: int = 0):
+        """记录with语句中操作的耗时，可以在with语句中修改返回对象的 ``size``"""
+        timer = _Timer(size)
+        start = time.perf_counter()
+        typ = 'ERROR'
+        try:
+            yield timer
+            typ = 'OK'
+        finally:
+            self.record(StatsEvent(kind, name, time.perf_counter() - start, size=timer.size, typ=typ))
+
+    def snapshot(self) -> dict:
+        """返回汇总结果，参考 :meth:`.ImapEasyBox.stats`"""
+        with self._lock:
+            result = {'commands': {}, 'parse': {}, 'write': {}}
+            for (kind, name), histogram in sorted(self._histograms.items()):
+                key = 'commands' if kind == 'command' else kind
+                result.setdefault(key, {})[name] = histogram.to_dict()
+
+            commands = result['commands'].values()
+            result['round_trips'] = sum(command['count'] for command in commands)
+            result['bytes_sent'] = sum(command['bytes_sent'] for command in commands)
+            result['bytes_received'] = sum(command['bytes_received'] for command in commands)
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+@contextmanager
+def measure(stats: Stats | None, kind: str, name: str, size: int = 0):
+    """``stats`` 为 ``None`` 时不记录，便于在可能没有所属邮箱的对象中使用"""
+    if stats is None:
+        yield _Timer(size)
+    else:
+        with stats.timer(kind, name, size) as timer:
+            yield timer
+
+
+class _InstrumentedMixin:
+    """在imaplib的传输层记录每条命令的耗时和收发字节数，``_stats`` 为 ``None`` 时只统计字节数"""
+
+    _stats = None
+    _pending = None
+    _bytes_sent = 0
+    _bytes_received = 0
+
+    # IDLE等命令不通过_command_complete结束，限制未完成记录的数量
+    MAX_PENDING = 1000
+
+    # 大文件夹的SEARCH结果在一行中返回，几十万封邮件的uid就会超过imaplib默认的1000000字节限制，
+    # 只放宽本库创建的连接，不修改全局的imaplib._MAXLINE
+    MAX_LINE = 100 * 1024 * 1024
+
+    def _new_tag(self):
+        tag = super()._new_tag()
+        if self._stats is not None:
+            if self._pending is None:
+                self._pending = {}
+            while len(self._pending) >= self.MAX_PENDING:
+                self._pending.pop(next(iter(self._pending)))
+            # 命令名称，开始时间，分配tag时已经发送的字节数，命令发送的字节数
+            self._pending[tag] = [None, time.perf_counter(), self._bytes_sent, None]
+        return tag
+
+    def _command(self, name, *args):
+        tag = super()._command(name, *args)
+        entry = self._pending.get(tag) if self._pending else None
+        if entry is not None:
+            entry[0] = f"UID {args[0].upper()}" if name == 'UID' and args else name
+            entry[3] = self._bytes_sent - entry[2]
+        return tag
+
+    def _command_complete(self, name, tag):
+        received = self._bytes_received
+        typ = 'ERROR'
+        try:
+            result = super()._command_complete(name, tag)
+            typ = result[0]
+            return result
+        finally:
+            entry = self._pending.pop(tag, None) if self._pending else None
+            if entry is not None and self._stats is not None:
+                command, start, sent_before, sent = entry
+                # 连续发送的多条命令，读取响应时可能同时读取了后面命令的响应，字节数只是近似值
+                self._stats.record(StatsEvent(
+                    'command', command or name, time.perf_counter() - start,
+                    bytes_sent=self._bytes_sent - sent_before if sent is None else sent,
+                    bytes_received=self._bytes_received - received,
+                    tag=tag.decode('ascii'), typ=typ,
+                ))
+
+    def send(self, data):
+        super().send(data)
+        self._bytes_sent += len(data)
+
+    def read(self, size):
+        data = super().read(size)
+        self._bytes_received += len(data)
+        return data
+
+    def readline(self):
+        line = self.file.readline(self.MAX_LINE + 1)
+        if len(line) > self.MAX_LINE:
+            raise self.error(f"got more than {self.MAX_LINE} bytes")
+        self._bytes_received += len(line)
+        return line
+
+
+class IMAP4(_InstrumentedMixin, imaplib.IMAP4):
+    """记录命令统计信息的 :class:`imaplib.IMAP4`"""
+
+
+class IMAP4_SSL(_InstrumentedMixin, imaplib.IMAP4_SSL):
+    """记录命令统计信息的 :class:`imaplib.IMAP4_SSL`"""
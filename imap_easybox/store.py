@@ -0,0 +1,263 @@
+import base64
+import binascii
+import filecmp
+import hashlib
+import os
+import shutil
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+class StoredBlob:
+    """:class:`AttachmentStore` 中保存的一份内容，和 :class:`.SpilledPayload` 一样可以当作路径使用
+
+    Attributes
+    ----------
+    path: Path
+        仓库中的文件路径，文件是只读的，多封邮件的同一个附件共用这个文件
+    sha256: str
+        内容的SHA-256，十六进制
+    md5: str
+        内容的MD5，十六进制
+    size: int
+        内容的字节数
+    """
+
+    def __init__(self, path: Path, sha256: str, md5: str, size: int):
+        self.path = path
+        self.sha256 = sha256
+        self.md5 = md5
+        self.size = size
+
+    def read(self) -> bytes:
+        return self.path.read_bytes()
+
+    def __bytes__(self) -> bytes:
+        return self.read()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __fspath__(self) -> str:
+        return str(self.path)
+
+    def __eq__(self, other):
+        return isinstance(other, StoredBlob) and other.sha256 == self.sha256
+
+    def __hash__(self):
+        return hash(self.sha256)
+
+    def __repr__(self):
+        return f"StoredBlob<{self.sha256[:12]} {self.size} bytes>"
+
+
+class BlobWriter:
+    """边写入临时文件边计算哈希，:meth:`commit` 时内容已经存在则丢弃临时文件，否则移动到仓库中
+
+    通过 :meth:`AttachmentStore.writer` 创建，with语句中抛出异常时删除临时文件
+    """
+
+    def __init__(self, store: 'AttachmentStore'):
+        self.store = store
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.path / 'tmp')
+        self._file = os.fdopen(fd, 'wb')
+        self._sha256 = hashlib.sha256()
+        self._md5 = hashlib.md5()
+        self.size = 0
+
+    def write(self, data: bytes):
+        self._sha256.update(data)
+        self._md5.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    def commit(self) -> StoredBlob:
+        self._file.close()
+        return self.store._commit(self._tmp_path, self._sha256.hexdigest(), self._md5.hexdigest(), self.size)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None or not self._file.closed:
+            self.abort()
+
+
+def normalize_md5(md5: str | bytes | None) -> str | None:
+    """将BODYSTRUCTURE中的Content-MD5(base64编码，RFC 1864)转换成十六进制，无法解析时返回 ``None``"""
+    if not md5:
+        return None
+    if isinstance(md5, bytes):
+        md5 = md5.decode('ascii', 'replace')
+    md5 = md5.strip()
+    if len(md5) == 32 and all(c in '0123456789abcdefABCDEF' for c in md5):
+        return md5.lower()
+    try:
+        digest = base64.b64decode(md5, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return digest.hex() if len(digest) == 16 else None
+
+
+class AttachmentStore:
+    """按内容寻址的附件仓库，相同内容的附件只保存一份
+
+    文件保存在 ``<path>/blobs/<sha256前两位>/<sha256>``，附件的MD5, 大小等元信息保存在 ``<path>/store.db`` 中。
+    下载附件时边下载边计算哈希，内容已经存在时丢弃下载的数据；附件的BODYSTRUCTURE中带有Content-MD5时，
+    会记录Content-MD5和大小对应的内容，之后遇到Content-MD5和大小都相同的附件时不再下载。
+    只有Content-MD5和实际内容一致时才会记录，伪造的Content-MD5不会命中其它内容。
+
+    仓库中的文件设为只读，:meth:`link` 通过硬链接把文件放到其它目录，不占用额外的磁盘空间，修改链接的文件前需要先复制
+
+    Parameters
+    ----------
+    path: str or Path, default 'attachments'
+        仓库目录
+
+    Examples
+    --------
+    >>> store = AttachmentStore('attachments')
+    >>> box = ImapEasyBox('imap.mail.com', user='username', password='password', attachment_store=store)
+    >>> for mail in box.select('inbox').mails:
+    ...     mail.save_attachments(f'mails/{mail.mail_id}')
+    """
+
+    def __init__(self, path: str | Path = 'attachments'):
+        self.path = Path(path)
+        (self.path / 'blobs').mkdir(parents=True, exist_ok=True)
+        (self.path / 'tmp').mkdir(exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path / 'store.db'), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                md5 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        # BODYSTRUCTURE中的Content-MD5和编码后的大小对应的内容
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS aliases (
+                md5 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                PRIMARY KEY (md5, size)
+            )
+        """)
+        self._conn.commit()
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.path / 'blobs' / sha256[:2] / sha256
+
+    def writer(self) -> BlobWriter:
+        """返回分块写入的 :class:`BlobWriter`"""
+        return BlobWriter(self)
+
+    def add(self, data: bytes | os.PathLike | StoredBlob, chunk_size: int = 1024 * 1024) -> StoredBlob:
+        """保存一份内容，``data`` 可以是字节串或者文件路径，内容已经存在时直接返回已有的 :class:`StoredBlob`"""
+        if isinstance(data, StoredBlob):
+            return data
+
+        with self.writer() as writer:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                writer.write(data)
+            else:
+                with open(data, 'rb') as file:
+                    while chunk := file.read(chunk_size):
+                        writer.write(chunk)
+            return writer.commit()
+
+    def _commit(self, tmp_path: str, sha256: str, md5: str, size: int) -> StoredBlob:
+        path = self.blob_path(sha256)
+
+        with self._lock:
+            if path.exists():
+                os.remove(tmp_path)
+            else:
+                path.parent.mkdir(exist_ok=True)
+                os.chmod(tmp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                os.replace(tmp_path, path)
+            self._conn.execute("INSERT OR IGNORE INTO blobs (sha256, md5, size, created) VALUES (?, ?, ?, ?)",
+                               (sha256, md5, size, time.time()))
+            self._conn.commit()
+
+        return StoredBlob(path, sha256, md5, size)
+
+    def get(self, sha256: str) -> StoredBlob | None:
+        """根据SHA-256返回保存的内容，不存在时返回 ``None``"""
+        with self._lock:
+            row = self._conn.execute("SELECT md5, size FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+
+        path = self.blob_path(sha256)
+        if row is None or not path.exists():
+            return None
+        return StoredBlob(path, sha256, *row)
+
+    def lookup(self, md5: str | bytes | None, size: int) -> StoredBlob | None:
+        """根据BODYSTRUCTURE中的Content-MD5和大小查找已经保存的附件，没有找到时返回 ``None``"""
+        md5 = normalize_md5(md5)
+        if md5 is None:
+            return None
+
+        with self._lock:
+            row = self._conn.execute("SELECT sha256 FROM aliases WHERE md5 = ? AND size = ?", (md5, size)).fetchone()
+        return self.get(row[0]) if row else None
+
+    def add_alias(self, md5: str | bytes | None, size: int, blob: StoredBlob) -> bool:
+        """记录BODYSTRUCTURE中的Content-MD5和大小对应的内容，Content-MD5和内容的MD5不一致时不记录，返回是否记录"""
+        md5 = normalize_md5(md5)
+        if md5 is None or md5 != blob.md5:
+            return False
+
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO aliases (md5, size, sha256) VALUES (?, ?, ?)",
+                               (md5, size, blob.sha256))
+            self._conn.commit()
+        return True
+
+    def link(self, blob: StoredBlob, dest: str | Path) -> Path:
+        """在 ``dest`` 创建指向仓库文件的硬链接，不支持硬链接时复制文件，返回创建的路径
+
+        ``dest`` 已经是同一份内容时直接返回；已经存在其它文件时不会覆盖，在文件名后面加上序号，比如 ``report (1).pdf``
+        """
+        dest = Path(dest)
+        candidate, number = dest, 0
+        while candidate.exists():
+            # 之前链接或者复制过的同一份内容
+            if os.path.samefile(candidate, blob.path) or (
+                    candidate.stat().st_size == blob.size and filecmp.cmp(candidate, blob.path, shallow=False)):
+                return candidate
+            number += 1
+            candidate = dest.with_name(f"{dest.stem} ({number}){dest.suffix}")
+
+        candidate.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(blob.path, candidate)
+        except OSError:
+            # 跨文件系统或者文件系统不支持硬链接
+            shutil.copyfile(blob.path, candidate)
+        return candidate
+
+    def close(self):
+        """关闭数据库连接"""
+        self._conn.close()
+
+    def __contains__(self, sha256: str) -> bool:
+        return self.get(sha256) is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM blobs").fetchone()[0]
+
+    def __repr__(self):
+        return f"AttachmentStore<{self.path}>"
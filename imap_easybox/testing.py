@@ -0,0 +1,1320 @@
+"""本地imap测试服务器
+
+基于asyncio实现的IMAP4rev1服务器，运行在本机，数据全部保存在内存中。可以批量生成测试邮件，并注入网络延迟，
+用于离线测试和性能基准测试，不依赖任何真实邮箱。
+
+Examples
+--------
+>>> from imap_easybox import ImapEasyBox
+>>> from imap_easybox.testing import LocalImapServer
+>>> with LocalImapServer(latency=0.05) as server:
+...     server.seed('INBOX', 1000, attachment_size=4096)
+...     with ImapEasyBox(server.host, server.port, 'user', 'password', ssl=False) as box:
+...         inbox = box.select('inbox')
+"""
+import asyncio
+import base64
+import email
+import email.message
+import email.utils
+import functools
+import random
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timezone, timedelta
+from email.header import decode_header
+from email.utils import parsedate_to_datetime
+
+DEFAULT_CAPABILITIES = (
+    'IMAP4rev1', 'LITERAL+', 'UIDPLUS', 'MOVE', 'IDLE', 'ENABLE', 'CONDSTORE', 'QRESYNC', 'ESEARCH', 'SORT',
+    'THREAD=ORDEREDSUBJECT', 'THREAD=REFERENCES', 'LIST-STATUS', 'MULTIAPPEND', 'COMPRESS=DEFLATE', 'SPECIAL-USE',
+    'UNSELECT',
+)
+
+SYSTEM_FLAGS = ('\\Seen', '\\Answered', '\\Flagged', '\\Deleted', '\\Draft')
+
+_WORDS = ('imap', 'report', 'meeting', 'invoice', 'project', 'update', 'weekly', 'server', 'release', 'budget')
+_CJK_WORDS = ('会议', '报告', '发票', '项目', '更新', '周报', '服务器', '发布', '预算', '通知')
+
+
+class _Message:
+    __slots__ = ('uid', 'flags', '_raw', 'modseq', 'internaldate', '_parsed')
+
+    def __init__(self, uid, raw, flags, modseq, internaldate):
+        self.uid = uid
+        # 原始内容，或者是可以重新生成原始内容的函数，大量生成的邮件不需要一直保存在内存中
+        self._raw = raw
+        self.flags = set(flags)
+        self.modseq = modseq
+        self.internaldate = internaldate
+        self._parsed = None
+
+    @property
+    def raw(self) -> bytes:
+        return self._raw() if callable(self._raw) else self._raw
+
+    @property
+    def parsed(self) -> email.message.Message:
+        if callable(self._raw):
+            return email.message_from_bytes(self._raw())
+        if self._parsed is None:
+            self._parsed = email.message_from_bytes(self._raw)
+        return self._parsed
+
+    @property
+    def header_bytes(self) -> bytes:
+        index = self.raw.find(b'\r\n\r\n')
+        return self.raw if index < 0 else self.raw[:index + 4]
+
+    @property
+    def text_bytes(self) -> bytes:
+        index = self.raw.find(b'\r\n\r\n')
+        return b'' if index < 0 else self.raw[index + 4:]
+
+
+class _Mailbox:
+    def __init__(self, name, uidvalidity, attributes=()):
+        self.name = name
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        self.highestmodseq = 1
+        self.messages = []
+        # 被删除邮件的uid和删除时的modseq，用于QRESYNC的VANISHED响应
+        self.expunged = []
+        self.attributes = list(attributes)
+
+    def append(self, raw, flags=(), internaldate=None):
+        self.highestmodseq += 1
+        message = _Message(self.uidnext, raw, flags, self.highestmodseq, internaldate or datetime.now(timezone.utc))
+        self.messages.append(message)
+        self.uidnext += 1
+        return message
+
+    def touch(self, message):
+        self.highestmodseq += 1
+        message.modseq = self.highestmodseq
+
+    def expunge(self, messages):
+        for message in messages:
+            self.highestmodseq += 1
+            self.expunged.append((message.uid, self.highestmodseq))
+        removed = {id(message) for message in messages}
+        self.messages = [message for message in self.messages if id(message) not in removed]
+
+
+class _ProtocolError(Exception):
+    """命令格式错误，返回BAD"""
+
+
+class _CommandFailed(Exception):
+    """命令执行失败，返回NO"""
+
+
+def _quote(value) -> bytes:
+    """将值转换为imap字符串，包含非ascii字符或换行时使用字面量"""
+    if value is None:
+        return b'NIL'
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    if any(c > 127 for c in value) or b'\r' in value or b'\n' in value:
+        return b'{%d}\r\n' % len(value) + value
+    return b'"' + value.replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"'
+
+
+def _format_set(uids) -> str:
+    uids = sorted(uids)
+    if not uids:
+        return ''
+    ranges = []
+    first = last = uids[0]
+    for uid in uids[1:]:
+        if uid == last + 1:
+            last = uid
+            continue
+        ranges.append(f'{first}:{last}' if first != last else f'{first}')
+        first = last = uid
+    ranges.append(f'{first}:{last}' if first != last else f'{first}')
+    return ','.join(ranges)
+
+
+def _parse_set(text: str, largest: int) -> set:
+    """解析序列集合，``*`` 表示最大值"""
+    numbers = set()
+    for part in text.split(','):
+        if ':' in part:
+            start, end = part.split(':')
+            start = largest if start == '*' else int(start)
+            end = largest if end == '*' else int(end)
+            start, end = min(start, end), max(start, end)
+            if end - start > 10_000_000:
+                raise _ProtocolError('sequence set too large')
+            numbers.update(range(start, end + 1))
+        else:
+            numbers.add(largest if part == '*' else int(part))
+    return numbers
+
+
+def _decode_header(value: str) -> str:
+    parts = []
+    for text, charset in decode_header(value or ''):
+        if isinstance(text, bytes):
+            try:
+                text = text.decode(charset or 'utf-8', 'replace')
+            except LookupError:
+                text = text.decode('utf-8', 'replace')
+        parts.append(text)
+    return ''.join(parts)
+
+
+def _base_subject(subject: str) -> str:
+    subject = _decode_header(subject).strip().lower()
+    while True:
+        stripped = re.sub(r'^(re|fwd?|回复|转发)\s*[:：]\s*', '', subject)
+        if stripped == subject:
+            return subject
+        subject = stripped
+
+
+_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\+?\}$|([^\s()"\[]+(?:\[[^\]]*\][^\s()"]*)?))')
+
+
+def _tokenize(parts) -> list:
+    """把命令切分成记号，引号字符串和字面量保持为bytes，原子转换为str"""
+    tokens = []
+    for text, literal in parts:
+        pos = 0
+        while pos < len(text):
+            match = _TOKEN_RE.match(text, pos)
+            if match is None or match.end() == pos:
+                if text[pos:].strip():
+                    raise _ProtocolError('invalid syntax')
+                break
+            pos = match.end()
+            lparen, rparen, quoted, literal_size, atom = match.groups()
+            if lparen:
+                tokens.append('(')
+            elif rparen:
+                tokens.append(')')
+            elif quoted is not None:
+                tokens.append(re.sub(rb'\\(.)', rb'\1', quoted))
+            elif literal_size is not None:
+                continue
+            else:
+                tokens.append(atom.decode('utf-8', 'replace'))
+        if literal is not None:
+            tokens.append(literal)
+    return tokens
+
+
+def _nest(tokens, pos=0):
+    items = []
+    while pos < len(tokens):
+        token = tokens[pos]
+        pos += 1
+        if token == '(':
+            sub, pos = _nest(tokens, pos)
+            items.append(sub)
+        elif token == ')':
+            return items, pos
+        else:
+            items.append(token)
+    return items, pos
+
+
+def _text(value) -> str:
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    if isinstance(value, list):
+        raise _ProtocolError('unexpected list')
+    return value
+
+
+def _mailbox_name(value) -> str:
+    name = _text(value)
+    return 'INBOX' if name.upper() == 'INBOX' else name
+
+
+def _bodystructure(part: email.message.Message, extensible=True) -> bytes:
+    """根据邮件生成BODYSTRUCTURE"""
+    if part.is_multipart():
+        children = b''.join(_bodystructure(child, extensible) for child in part.get_payload())
+        result = children + b' ' + _quote(part.get_content_subtype())
+        if extensible:
+            params = part.get_params()[1:] or []
+            result += b' ' + _params(params) + b' ' + _disposition(part) + b' NIL NIL'
+        return b'(' + result + b')'
+
+    maintype, subtype = part.get_content_maintype(), part.get_content_subtype()
+    body = _part_body(part)
+    params = part.get_params()[1:] if part.get_params() else []
+    encoding = part.get('Content-Transfer-Encoding', '7bit').strip()
+    fields = [
+        _quote(maintype), _quote(subtype), _params(params), _quote(part.get('Content-ID')),
+        _quote(part.get('Content-Description')), _quote(encoding), str(len(body)).encode(),
+    ]
+    if maintype == 'text':
+        fields.append(str(body.count(b'\n')).encode())
+    if extensible:
+        fields += [_quote(part.get('Content-MD5')), _disposition(part), b'NIL', b'NIL']
+    return b'(' + b' '.join(fields) + b')'
+
+
+def _params(params) -> bytes:
+    if not params:
+        return b'NIL'
+    values = []
+    for key, value in params:
+        if isinstance(value, tuple):
+            value = email.utils.collapse_rfc2231_value(value)
+        values += [_quote(key), _quote(value)]
+    return b'(' + b' '.join(values) + b')'
+
+
+def _disposition(part) -> bytes:
+    disposition = part.get('Content-Disposition')
+    if not disposition:
+        return b'NIL'
+    params = part.get_params(header='Content-Disposition') or []
+    return b'(' + _quote(params[0][0]) + b' ' + _params(params[1:]) + b')'
+
+
+def _part_body(part: email.message.Message) -> bytes:
+    payload = part.get_payload()
+    if isinstance(payload, str):
+        return payload.encode('ascii', 'surrogateescape')
+    raw = part.as_bytes()
+    index = raw.find(b'\n\n')
+    return raw[index + 2:]
+
+
+def _find_part(message: email.message.Message, section: str) -> email.message.Message:
+    part = message
+    for number in section.split('.'):
+        number = int(number)
+        if part.is_multipart():
+            children = part.get_payload()
+            if not 1 <= number <= len(children):
+                return None
+            part = children[number - 1]
+        elif number != 1:
+            return None
+    return part
+
+
+def _section_bytes(message: _Message, section: str) -> bytes:
+    """返回BODY[section]对应的内容"""
+    if section == '':
+        return message.raw
+    upper = section.upper()
+    if upper == 'HEADER':
+        return message.header_bytes
+    if upper == 'TEXT':
+        return message.text_bytes
+    if upper.startswith('HEADER.FIELDS'):
+        names = re.search(r'\((.*)\)', section).group(1).lower().split()
+        exclude = upper.startswith('HEADER.FIELDS.NOT')
+        lines = []
+        for key, value in message.parsed.raw_items():
+            if (key.lower() in names) != exclude:
+                lines.append(f'{key}: {value}\r\n'.encode('utf-8', 'surrogateescape'))
+        return b''.join(lines) + b'\r\n'
+
+    match = re.fullmatch(r'([\d.]+?)(?:\.(MIME|HEADER|TEXT))?', section, re.I)
+    if not match:
+        raise _ProtocolError(f'invalid section {section}')
+    part = _find_part(message.parsed, match.group(1))
+    if part is None:
+        return b''
+    if match.group(2) and match.group(2).upper() in ('MIME', 'HEADER'):
+        return b''.join(f'{k}: {v}\r\n'.encode('utf-8', 'surrogateescape') for k, v in part.raw_items()) + b'\r\n'
+    return _part_body(part)
+
+
+def _envelope(message: _Message) -> bytes:
+    parsed = message.parsed
+
+    def addresses(name):
+        value = parsed.get(name)
+        if not value:
+            return b'NIL'
+        items = []
+        for display, address in email.utils.getaddresses([value]):
+            mailbox, _, host = address.partition('@')
+            items.append(b'(' + b' '.join([_quote(display or None), b'NIL', _quote(mailbox), _quote(host)]) + b')')
+        return b'(' + b''.join(items) + b')'
+
+    fields = [
+        _quote(parsed.get('Date')), _quote(parsed.get('Subject')), addresses('From'),
+        addresses('Sender') if parsed.get('Sender') else addresses('From'),
+        addresses('Reply-To') if parsed.get('Reply-To') else addresses('From'),
+        addresses('To'), addresses('Cc'), addresses('Bcc'), _quote(parsed.get('In-Reply-To')),
+        _quote(parsed.get('Message-ID')),
+    ]
+    return b'(' + b' '.join(fields) + b')'
+
+
+class _Session:
+    """单个客户端连接"""
+
+    def __init__(self, server: 'LocalImapServer', reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.buffer = b''
+        self.received_at = 0.0
+        self.decompressor = None
+        self.compressor = None
+        self.authenticated = False
+        self.mailbox = None
+        self.readonly = False
+        self.enabled = set()
+        # 客户端当前看到的邮件uid和modseq，用于NOOP和IDLE时推送变化
+        self.view = {}
+
+    async def _fill(self):
+        chunk = await self.reader.read(65536)
+        if not chunk:
+            raise ConnectionError('connection closed')
+        self.received_at = asyncio.get_running_loop().time()
+        self.server.bytes_received += len(chunk)
+        if self.decompressor is not None:
+            chunk = self.decompressor.decompress(chunk)
+        self.buffer += chunk
+
+    async def readline(self) -> bytes:
+        while b'\r\n' not in self.buffer:
+            await self._fill()
+        line, _, self.buffer = self.buffer.partition(b'\r\n')
+        return line
+
+    async def readexactly(self, size: int) -> bytes:
+        while len(self.buffer) < size:
+            await self._fill()
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    async def write(self, data: bytes):
+        if self.compressor is not None:
+            data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.server.bytes_sent += len(data)
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def read_command(self):
+        """读取一条完整命令，包括其中的字面量"""
+        parts = []
+        while True:
+            line = await self.readline()
+            match = re.search(rb'\{(\d+)(\+?)\}$', line)
+            if not match:
+                parts.append((line, None))
+                return parts
+            if not match.group(2):
+                await self.write(b'+ Ready for literal data\r\n')
+            literal = await self.readexactly(int(match.group(1)))
+            parts.append((line, literal))
+
+    async def run(self):
+        capabilities = ' '.join(self.server.capabilities)
+        await self.write(f'* OK [CAPABILITY {capabilities}] LocalImapServer ready\r\n'.encode())
+        try:
+            while True:
+                parts = await self.read_command()
+                # 延迟从收到命令开始计算，连续发送的命令的延迟可以重叠，和真实网络的往返时间一致
+                arrived = self.received_at
+                if not parts[0][0].strip():
+                    continue
+                tag, _, rest = parts[0][0].partition(b' ')
+                parts[0] = (rest, parts[0][1])
+                tag = tag.decode('ascii', 'replace')
+                try:
+                    tokens = _tokenize(parts)
+                    if not tokens or not isinstance(tokens[0], str):
+                        raise _ProtocolError('missing command')
+                    name = tokens[0].upper()
+                    uid = False
+                    if name == 'UID':
+                        uid = True
+                        name = _text(tokens[1]).upper()
+                        tokens = tokens[1:]
+                    args, _ = _nest(tokens[1:])
+                    if name == 'IDLE':
+                        await self._idle(tag)
+                        continue
+                    if self.server.latency:
+                        await asyncio.sleep(max(0, arrived + self.server.latency - asyncio.get_running_loop().time()))
+                    handler = getattr(self, f'do_{name.lower()}', None)
+                    if handler is None:
+                        raise _ProtocolError(f'unknown command {name}')
+                    if not self.authenticated and name not in ('LOGIN', 'CAPABILITY', 'NOOP', 'LOGOUT'):
+                        raise _ProtocolError('not authenticated')
+                    with self.server.lock:
+                        self.server.command_count += 1
+                        result = handler(args, uid) if name in self._UID_COMMANDS else handler(args)
+                    untagged, text = result if isinstance(result, tuple) else (result, f'{name} completed')
+                    await self.write(untagged + f'{tag} OK {text}\r\n'.encode())
+                    if name == 'LOGOUT':
+                        break
+                    if name == 'COMPRESS':
+                        self.compressor = zlib.compressobj(wbits=-15)
+                        self.decompressor = zlib.decompressobj(wbits=-15)
+                        self.buffer = self.decompressor.decompress(self.buffer)
+                except _CommandFailed as error:
+                    await self.write(f'{tag} NO {error}\r\n'.encode())
+                except (_ProtocolError, IndexError, ValueError, KeyError) as error:
+                    await self.write(f'{tag} BAD {error}\r\n'.encode('utf-8', 'replace'))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writer.close()
+
+    _UID_COMMANDS = ('FETCH', 'STORE', 'COPY', 'MOVE', 'SEARCH', 'EXPUNGE', 'SORT', 'THREAD')
+
+    # ---------- 辅助方法 ----------
+
+    def _require_selected(self) -> _Mailbox:
+        if self.mailbox is None:
+            raise _ProtocolError('no mailbox selected')
+        return self.mailbox
+
+    def _get_mailbox(self, name) -> _Mailbox:
+        name = _mailbox_name(name)
+        try:
+            return self.server.mailboxes[name]
+        except KeyError:
+            raise _CommandFailed(f'mailbox {name} does not exist')
+
+    def _select_messages(self, message_set: str, uid: bool) -> list:
+        """根据序列集合返回(序号, 邮件)组成的列表"""
+        messages = self._require_selected().messages
+        if uid:
+            largest = messages[-1].uid if messages else 0
+            wanted = _parse_set(message_set, largest) if message_set != '*' or messages else set()
+            return [(seq, message) for seq, message in enumerate(messages, 1) if message.uid in wanted]
+        wanted = _parse_set(message_set, len(messages))
+        return [(seq, messages[seq - 1]) for seq in sorted(wanted) if 1 <= seq <= len(messages)]
+
+    def _pending_updates(self) -> bytes:
+        """返回自上次同步以来邮箱的变化"""
+        if self.mailbox is None:
+            return b''
+        lines = []
+        current = {message.uid: message for message in self.mailbox.messages}
+        view_uids = list(self.view)
+        for seq in range(len(view_uids), 0, -1):
+            if view_uids[seq - 1] not in current:
+                lines.append(f'* {seq} EXPUNGE\r\n'.encode())
+        remaining = [uid for uid in view_uids if uid in current]
+        for seq, uid in enumerate(remaining, 1):
+            message = current[uid]
+            if message.modseq > self.view[uid]:
+                lines.append(f'* {seq} FETCH (UID {uid} FLAGS ({" ".join(sorted(message.flags))}))\r\n'.encode())
+        if len(current) != len(remaining) or lines:
+            lines.append(f'* {len(current)} EXISTS\r\n'.encode())
+        self.view = {message.uid: message.modseq for message in self.mailbox.messages}
+        return b''.join(lines)
+
+    def _search(self, args: list, mailbox: _Mailbox, charset='utf-8') -> list:
+        """返回满足搜索条件的(序号, 邮件)列表"""
+        messages = list(enumerate(mailbox.messages, 1))
+        keys = list(args)
+        matchers = []
+        while keys:
+            matchers.append(self._parse_criterion(keys, mailbox, charset))
+        return [(seq, message) for seq, message in messages if all(m(seq, message) for m in matchers)]
+
+    def _parse_criterion(self, keys: list, mailbox: _Mailbox, charset):
+        key = keys.pop(0)
+        if isinstance(key, list):
+            sub = list(key)
+            matchers = []
+            while sub:
+                matchers.append(self._parse_criterion(sub, mailbox, charset))
+            return lambda seq, message: all(m(seq, message) for m in matchers)
+
+        if isinstance(key, bytes):
+            key = key.decode()
+        upper = key.upper()
+
+        def value():
+            item = keys.pop(0)
+            return item.decode(charset, 'replace') if isinstance(item, bytes) else item
+
+        flag_keys = {'SEEN': '\\Seen', 'ANSWERED': '\\Answered', 'FLAGGED': '\\Flagged', 'DELETED': '\\Deleted',
+                     'DRAFT': '\\Draft'}
+        if upper == 'ALL':
+            return lambda seq, message: True
+        if upper in flag_keys:
+            return lambda seq, message: flag_keys[upper] in message.flags
+        if upper.startswith('UN') and upper[2:] in flag_keys:
+            return lambda seq, message: flag_keys[upper[2:]] not in message.flags
+        if upper in ('RECENT', 'NEW'):
+            return lambda seq, message: False
+        if upper == 'OLD':
+            return lambda seq, message: True
+        if upper == 'KEYWORD':
+            keyword = value()
+            return lambda seq, message: keyword in message.flags
+        if upper == 'UNKEYWORD':
+            keyword = value()
+            return lambda seq, message: keyword not in message.flags
+        if upper in ('SUBJECT', 'FROM', 'TO', 'CC', 'BCC'):
+            needle = value().lower()
+            return lambda seq, message: needle in _decode_header(message.parsed.get(upper, '')).lower()
+        if upper == 'HEADER':
+            field, needle = value(), value().lower()
+            return lambda seq, message: needle in _decode_header(message.parsed.get(field, '')).lower()
+        if upper in ('BODY', 'TEXT'):
+            needle = value().lower()
+
+            def match_body(seq, message):
+                for part in message.parsed.walk():
+                    if part.get_content_maintype() == 'text':
+                        payload = part.get_payload(decode=True) or b''
+                        if needle in payload.decode(part.get_content_charset() or 'utf-8', 'replace').lower():
+                            return True
+                if upper == 'TEXT':
+                    return needle in _decode_header(message.parsed.get('Subject', '')).lower()
+                return False
+
+            return match_body
+        if upper in ('LARGER', 'SMALLER'):
+            size = int(value())
+            if upper == 'LARGER':
+                return lambda seq, message: len(message.raw) > size
+            return lambda seq, message: len(message.raw) < size
+        if upper in ('SINCE', 'BEFORE', 'ON', 'SENTSINCE', 'SENTBEFORE', 'SENTON'):
+            day = datetime.strptime(value(), '%d-%b-%Y').date()
+
+            def match_date(seq, message):
+                if upper.startswith('SENT'):
+                    current = parsedate_to_datetime(message.parsed['Date']).date()
+                else:
+                    current = message.internaldate.date()
+                if upper.endswith('SINCE'):
+                    return current >= day
+                if upper.endswith('BEFORE'):
+                    return current < day
+                return current == day
+
+            return match_date
+        if upper == 'UID':
+            largest = mailbox.messages[-1].uid if mailbox.messages else 0
+            wanted = _parse_set(value(), largest)
+            return lambda seq, message: message.uid in wanted
+        if upper == 'MODSEQ':
+            modseq = int(value())
+            return lambda seq, message: message.modseq >= modseq
+        if upper == 'NOT':
+            matcher = self._parse_criterion(keys, mailbox, charset)
+            return lambda seq, message: not matcher(seq, message)
+        if upper == 'OR':
+            left = self._parse_criterion(keys, mailbox, charset)
+            right = self._parse_criterion(keys, mailbox, charset)
+            return lambda seq, message: left(seq, message) or right(seq, message)
+        if re.fullmatch(r'[\d:*,]+', key):
+            wanted = _parse_set(key, len(mailbox.messages))
+            return lambda seq, message: seq in wanted
+        raise _ProtocolError(f'unsupported search key {key}')
+
+    # ---------- 命令 ----------
+
+    def do_capability(self, args):
+        return f'* CAPABILITY {" ".join(self.server.capabilities)}\r\n'.encode()
+
+    def do_noop(self, args):
+        return self._pending_updates()
+
+    do_check = do_noop
+
+    def do_logout(self, args):
+        return b'* BYE LocalImapServer logging out\r\n'
+
+    def do_login(self, args):
+        user, password = _text(args[0]), _text(args[1])
+        if (user, password) != (self.server.user, self.server.password):
+            raise _CommandFailed('LOGIN failure, invalid username/password')
+        self.authenticated = True
+        return b''
+
+    def do_enable(self, args):
+        enabled = [_text(arg).upper() for arg in args if _text(arg).upper() in self.server.capabilities]
+        self.enabled.update(enabled)
+        if 'QRESYNC' in enabled:
+            self.enabled.add('CONDSTORE')
+        return f'* ENABLED {" ".join(enabled)}\r\n'.encode()
+
+    def do_compress(self, args):
+        if 'COMPRESS=DEFLATE' not in self.server.capabilities or _text(args[0]).upper() != 'DEFLATE':
+            raise _CommandFailed('compression not supported')
+        if self.compressor is not None:
+            raise _CommandFailed('[COMPRESSIONACTIVE] compression already active')
+        return b''
+
+    def do_select(self, args, readonly=False):
+        mailbox = self._get_mailbox(args[0])
+        if '\\Noselect' in mailbox.attributes:
+            raise _CommandFailed(f'mailbox {mailbox.name} is not selectable')
+        self.mailbox = mailbox
+        self.readonly = readonly
+        self.view = {message.uid: message.modseq for message in mailbox.messages}
+        flags = ' '.join(SYSTEM_FLAGS)
+        lines = [
+            f'* FLAGS ({flags})', f'* OK [PERMANENTFLAGS ({flags} \\*)] Flags permitted',
+            f'* {len(mailbox.messages)} EXISTS', '* 0 RECENT',
+            f'* OK [UIDVALIDITY {mailbox.uidvalidity}] UIDs valid', f'* OK [UIDNEXT {mailbox.uidnext}] Predicted next UID',
+        ]
+        if 'CONDSTORE' in self.server.capabilities:
+            lines.append(f'* OK [HIGHESTMODSEQ {mailbox.highestmodseq}] Highest')
+        params = args[1] if len(args) > 1 else []
+        if params and _text(params[0]).upper() == 'QRESYNC':
+            qresync = params[1]
+            if int(_text(qresync[0])) == mailbox.uidvalidity:
+                modseq = int(_text(qresync[1]))
+                vanished = [uid for uid, changed in mailbox.expunged if changed > modseq]
+                if vanished:
+                    lines.append(f'* VANISHED (EARLIER) {_format_set(vanished)}')
+                for seq, message in enumerate(mailbox.messages, 1):
+                    if message.modseq > modseq:
+                        lines.append(f'* {seq} FETCH (UID {message.uid} FLAGS ({" ".join(sorted(message.flags))}) '
+                                     f'MODSEQ ({message.modseq}))')
+        mode = 'READ-ONLY' if readonly else 'READ-WRITE'
+        return ''.join(line + '\r\n' for line in lines).encode(), f'[{mode}] SELECT completed'
+
+    def do_examine(self, args):
+        return self.do_select(args, readonly=True)
+
+    def do_close(self, args):
+        mailbox = self._require_selected()
+        if not self.readonly:
+            mailbox.expunge([message for message in mailbox.messages if '\\Deleted' in message.flags])
+        self.mailbox = None
+        return b''
+
+    def do_unselect(self, args):
+        self._require_selected()
+        self.mailbox = None
+        return b''
+
+    def do_list(self, args):
+        reference, pattern = _text(args[0]), _text(args[1])
+        returns = []
+        if len(args) > 3 and _text(args[2]).upper() == 'RETURN':
+            returns = args[3]
+        pattern = reference + pattern
+        regex = re.escape(pattern).replace(r'\*', '.*').replace('%', '[^/]*')
+        lines = []
+        for name, mailbox in self.server.mailboxes.items():
+            if not re.fullmatch(regex, name, re.I if name == 'INBOX' else 0):
+                continue
+            attributes = ' '.join(mailbox.attributes)
+            lines.append(b'* LIST (' + attributes.encode() + b') "/" ' + _quote(name) + b'\r\n')
+            for index, item in enumerate(returns):
+                if isinstance(item, str) and item.upper() == 'STATUS' and '\\Noselect' not in mailbox.attributes:
+                    lines.append(self._status_line(mailbox, returns[index + 1]))
+        return b''.join(lines)
+
+    def do_lsub(self, args):
+        return self.do_list(args).replace(b'* LIST', b'* LSUB')
+
+    def _status_line(self, mailbox: _Mailbox, items) -> bytes:
+        values = {
+            'MESSAGES': len(mailbox.messages), 'RECENT': 0, 'UIDNEXT': mailbox.uidnext,
+            'UIDVALIDITY': mailbox.uidvalidity,
+            'UNSEEN': sum(1 for message in mailbox.messages if '\\Seen' not in message.flags),
+            'HIGHESTMODSEQ': mailbox.highestmodseq, 'SIZE': sum(len(message.raw) for message in mailbox.messages),
+        }
+        pairs = ' '.join(f'{_text(item).upper()} {values[_text(item).upper()]}' for item in items)
+        return b'* STATUS ' + _quote(mailbox.name) + f' ({pairs})\r\n'.encode()
+
+    def do_status(self, args):
+        mailbox = self._get_mailbox(args[0])
+        if '\\Noselect' in mailbox.attributes:
+            raise _CommandFailed(f'mailbox {mailbox.name} is not selectable')
+        return self._status_line(mailbox, args[1])
+
+    def do_create(self, args):
+        name = _mailbox_name(args[0]).rstrip('/')
+        if name in self.server.mailboxes:
+            raise _CommandFailed('CREATE Folder exist')
+        self.server.create_mailbox(name)
+        return b''
+
+    def do_delete(self, args):
+        name = _mailbox_name(args[0])
+        if name == 'INBOX' or name not in self.server.mailboxes:
+            raise _CommandFailed('DELETE Folder not exist')
+        mailbox = self.server.mailboxes.pop(name)
+        if self.mailbox is mailbox:
+            self.mailbox = None
+        return b''
+
+    def do_rename(self, args):
+        old, new = _mailbox_name(args[0]), _mailbox_name(args[1])
+        if old not in self.server.mailboxes or new in self.server.mailboxes:
+            raise _CommandFailed('RENAME failed')
+        # 子文件夹同时被重命名
+        for name in [name for name in self.server.mailboxes if name == old or name.startswith(old + '/')]:
+            mailbox = self.server.mailboxes.pop(name)
+            mailbox.name = new + name[len(old):]
+            self.server.mailboxes[mailbox.name] = mailbox
+        return b''
+
+    def do_subscribe(self, args):
+        return b''
+
+    do_unsubscribe = do_subscribe
+
+    def do_append(self, args):
+        mailbox = self._get_mailbox(args[0])
+        rest = args[1:]
+        uids = []
+        # MULTIAPPEND: 可以连续追加多封邮件
+        while rest:
+            flags = []
+            internaldate = None
+            if isinstance(rest[0], list):
+                flags = [_text(flag) for flag in rest.pop(0)]
+            if len(rest) > 1 and isinstance(rest[1], bytes) and re.fullmatch(rb' ?\d{1,2}-\w{3}-\d{4} [\d:]{8} [-+]\d{4}',
+                                                                             rest[0]):
+                internaldate = datetime.strptime(rest.pop(0).decode(), '%d-%b-%Y %H:%M:%S %z')
+            raw = rest.pop(0)
+            if not isinstance(raw, bytes):
+                raise _ProtocolError('missing message literal')
+            uids.append(mailbox.append(raw, flags, internaldate).uid)
+        return b'', f'[APPENDUID {mailbox.uidvalidity} {_format_set(uids)}] APPEND completed'
+
+    def do_search(self, args, uid=False):
+        mailbox = self._require_selected()
+        returns = None
+        if args and isinstance(args[0], str) and args[0].upper() == 'RETURN':
+            returns = [_text(item).upper() for item in args[1]] or ['ALL']
+            args = args[2:]
+        charset = 'utf-8'
+        if args and isinstance(args[0], str) and args[0].upper() == 'CHARSET':
+            charset = _text(args[1])
+            args = args[2:]
+        matches = self._search(args, mailbox, charset)
+        numbers = [message.uid if uid else seq for seq, message in matches]
+        if returns is None:
+            return f'* SEARCH {" ".join(map(str, numbers))}\r\n'.rstrip().encode() + b'\r\n'
+        result = ['* ESEARCH']
+        if uid:
+            result.append('UID')
+        if numbers:
+            for item in returns:
+                if item == 'MIN':
+                    result.append(f'MIN {min(numbers)}')
+                elif item == 'MAX':
+                    result.append(f'MAX {max(numbers)}')
+                elif item == 'ALL':
+                    result.append(f'ALL {_format_set(numbers)}')
+                elif item == 'COUNT':
+                    result.append(f'COUNT {len(numbers)}')
+        elif 'COUNT' in returns:
+            result.append('COUNT 0')
+        return ' '.join(result).encode() + b'\r\n'
+
+    def do_fetch(self, args, uid=False):
+        mailbox = self._require_selected()
+        message_set, items = _text(args[0]), args[1]
+        modifiers = args[2] if len(args) > 2 else []
+        if not isinstance(items, list):
+            items = [items]
+            if len(args) > 2 and not isinstance(args[2], list):
+                items = args[1:]
+                modifiers = []
+        macros = {'ALL': ['FLAGS', 'INTERNALDATE', 'RFC822.SIZE', 'ENVELOPE'],
+                  'FAST': ['FLAGS', 'INTERNALDATE', 'RFC822.SIZE'],
+                  'FULL': ['FLAGS', 'INTERNALDATE', 'RFC822.SIZE', 'ENVELOPE', 'BODY']}
+        if len(items) == 1 and isinstance(items[0], str) and items[0].upper() in macros:
+            items = macros[items[0].upper()]
+
+        changedsince = None
+        vanished = False
+        for index, modifier in enumerate(modifiers):
+            if _text(modifier).upper() == 'CHANGEDSINCE':
+                changedsince = int(_text(modifiers[index + 1]))
+            if _text(modifier).upper() == 'VANISHED':
+                vanished = True
+        if vanished and 'QRESYNC' not in self.enabled:
+            raise _ProtocolError('QRESYNC not enabled')
+
+        selected = self._select_messages(message_set, uid)
+        lines = []
+        if vanished:
+            largest = mailbox.uidnext
+            wanted = _parse_set(message_set, largest)
+            gone = [u for u, changed in mailbox.expunged if changed > changedsince and u in wanted]
+            if gone:
+                lines.append(f'* VANISHED (EARLIER) {_format_set(gone)}\r\n'.encode())
+
+        for seq, message in selected:
+            if changedsince is not None and message.modseq <= changedsince:
+                continue
+            values = []
+            names = [_text(item).upper() for item in items]
+            if uid and 'UID' not in names:
+                values.append(b'UID %d' % message.uid)
+            if changedsince is not None and 'MODSEQ' not in names:
+                values.append(b'MODSEQ (%d)' % message.modseq)
+            mark_seen = False
+            for item in items:
+                name = _text(item)
+                upper = name.upper()
+                if upper == 'UID':
+                    values.append(b'UID %d' % message.uid)
+                elif upper == 'FLAGS':
+                    continue
+                elif upper == 'MODSEQ':
+                    values.append(b'MODSEQ (%d)' % message.modseq)
+                elif upper == 'INTERNALDATE':
+                    values.append(b'INTERNALDATE "' + message.internaldate.strftime('%d-%b-%Y %H:%M:%S %z').encode()
+                                  + b'"')
+                elif upper == 'RFC822.SIZE':
+                    values.append(b'RFC822.SIZE %d' % len(message.raw))
+                elif upper == 'ENVELOPE':
+                    values.append(b'ENVELOPE ' + _envelope(message))
+                elif upper == 'BODYSTRUCTURE':
+                    values.append(b'BODYSTRUCTURE ' + _bodystructure(message.parsed))
+                elif upper == 'BODY':
+                    values.append(b'BODY ' + _bodystructure(message.parsed, extensible=False))
+                elif upper in ('RFC822', 'RFC822.HEADER', 'RFC822.TEXT'):
+                    data = {'RFC822': message.raw, 'RFC822.HEADER': message.header_bytes,
+                            'RFC822.TEXT': message.text_bytes}[upper]
+                    values.append(upper.encode() + b' {%d}\r\n' % len(data) + data)
+                    mark_seen = mark_seen or upper != 'RFC822.HEADER'
+                elif upper.startswith('BODY[') or upper.startswith('BODY.PEEK['):
+                    match = re.fullmatch(r'BODY(\.PEEK)?\[(.*)\](?:<(\d+)\.(\d+)>)?', name, re.I | re.S)
+                    if not match:
+                        raise _ProtocolError(f'invalid fetch item {name}')
+                    peek, section, offset, length = match.groups()
+                    data = _section_bytes(message, section)
+                    key = f'BODY[{section}]'
+                    if offset is not None:
+                        data = data[int(offset):int(offset) + int(length)]
+                        key += f'<{offset}>'
+                    values.append(key.encode() + b' {%d}\r\n' % len(data) + data)
+                    mark_seen = mark_seen or not peek
+                else:
+                    raise _ProtocolError(f'invalid fetch item {name}')
+            if mark_seen and not self.readonly and '\\Seen' not in message.flags:
+                message.flags.add('\\Seen')
+                mailbox.touch(message)
+                self.view[message.uid] = message.modseq
+            if 'FLAGS' in names or (mark_seen and not self.readonly):
+                values.append(f'FLAGS ({" ".join(sorted(message.flags))})'.encode())
+            lines.append(b'* %d FETCH (' % seq + b' '.join(values) + b')\r\n')
+        return b''.join(lines)
+
+    def do_store(self, args, uid=False):
+        mailbox = self._require_selected()
+        if self.readonly:
+            raise _CommandFailed('mailbox is read-only')
+        message_set = _text(args[0])
+        rest = args[1:]
+        unchangedsince = None
+        if isinstance(rest[0], list):
+            unchangedsince = int(_text(rest[0][1]))
+            rest = rest[1:]
+        action = _text(rest[0]).upper()
+        flags = rest[1] if isinstance(rest[1], list) else rest[1:]
+        flags = {_text(flag) for flag in flags}
+        system = {flag.lower(): flag for flag in SYSTEM_FLAGS}
+        flags = {system.get(flag.lower(), flag) for flag in flags}
+        silent = action.endswith('.SILENT')
+        action = action.replace('.SILENT', '')
+
+        lines = []
+        modified = []
+        for seq, message in self._select_messages(message_set, uid):
+            if unchangedsince is not None and message.modseq > unchangedsince:
+                modified.append(message.uid if uid else seq)
+                continue
+            old = set(message.flags)
+            if action == 'FLAGS':
+                message.flags = set(flags)
+            elif action == '+FLAGS':
+                message.flags |= flags
+            elif action == '-FLAGS':
+                message.flags -= flags
+            else:
+                raise _ProtocolError(f'invalid store action {action}')
+            if message.flags != old:
+                mailbox.touch(message)
+            self.view[message.uid] = message.modseq
+            if not silent:
+                extra = f' UID {message.uid}' if uid else ''
+                extra += f' MODSEQ ({message.modseq})' if 'CONDSTORE' in self.enabled else ''
+                lines.append(f'* {seq} FETCH (FLAGS ({" ".join(sorted(message.flags))}){extra})\r\n'.encode())
+        if modified:
+            return b''.join(lines), f'[MODIFIED {_format_set(modified)}] Conditional STORE failed'
+        return b''.join(lines)
+
+    def _copy(self, args, uid):
+        source = self._require_selected()
+        target = self._get_mailbox(args[1])
+        selected = self._select_messages(_text(args[0]), uid)
+        source_uids, target_uids = [], []
+        for seq, message in selected:
+            copied = target.append(message.raw, message.flags - {'\\Recent'}, message.internaldate)
+            source_uids.append(message.uid)
+            target_uids.append(copied.uid)
+        code = f'[COPYUID {target.uidvalidity} {_format_set(source_uids)} {_format_set(target_uids)}]'
+        return source, selected, code
+
+    def do_copy(self, args, uid=False):
+        source, selected, code = self._copy(args, uid)
+        return b'', f'{code} COPY completed'
+
+    def do_move(self, args, uid=False):
+        if 'MOVE' not in self.server.capabilities:
+            raise _ProtocolError('MOVE not supported')
+        source, selected, code = self._copy(args, uid)
+        lines = [f'* OK {code} Moved\r\n'.encode()]
+        lines += self._expunge_lines(source, [message for seq, message in selected])
+        return b''.join(lines)
+
+    def _expunge_lines(self, mailbox: _Mailbox, messages: list) -> list:
+        if not messages:
+            return []
+        if 'QRESYNC' in self.enabled:
+            lines = [f'* VANISHED {_format_set([message.uid for message in messages])}\r\n'.encode()]
+        else:
+            positions = {id(message): seq for seq, message in enumerate(mailbox.messages, 1)}
+            lines = [f'* {seq} EXPUNGE\r\n'.encode() for seq in sorted((positions[id(m)] for m in messages), reverse=True)]
+        mailbox.expunge(messages)
+        for message in messages:
+            self.view.pop(message.uid, None)
+        return lines
+
+    def do_expunge(self, args, uid=False):
+        mailbox = self._require_selected()
+        if self.readonly:
+            raise _CommandFailed('mailbox is read-only')
+        messages = [message for message in mailbox.messages if '\\Deleted' in message.flags]
+        if uid:
+            wanted = {message.uid for seq, message in self._select_messages(_text(args[0]), True)}
+            messages = [message for message in messages if message.uid in wanted]
+        return b''.join(self._expunge_lines(mailbox, messages))
+
+    def do_sort(self, args, uid=False):
+        mailbox = self._require_selected()
+        criteria = [_text(item).upper() for item in args[0]]
+        charset = _text(args[1])
+        matches = self._search(args[2:], mailbox, charset)
+
+        keys = []
+        reverse = False
+        for item in criteria:
+            if item == 'REVERSE':
+                reverse = True
+                continue
+            keys.append((item, reverse))
+            reverse = False
+
+        def sort_value(message, item):
+            parsed = message.parsed
+            if item == 'ARRIVAL':
+                return message.internaldate
+            if item == 'DATE':
+                try:
+                    return parsedate_to_datetime(parsed['Date'])
+                except (TypeError, ValueError):
+                    return message.internaldate
+            if item == 'SIZE':
+                return len(message.raw)
+            if item == 'SUBJECT':
+                return _base_subject(parsed.get('Subject', ''))
+            return _decode_header(parsed.get(item, '')).lower()
+
+        # 按照条件从后往前依次稳定排序
+        matches.sort(key=lambda match: match[0])
+        for item, reverse in reversed(keys):
+            matches.sort(key=lambda match: sort_value(match[1], item), reverse=reverse)
+        numbers = [message.uid if uid else seq for seq, message in matches]
+        return f'* SORT {" ".join(map(str, numbers))}'.rstrip().encode() + b'\r\n'
+
+    def do_thread(self, args, uid=False):
+        mailbox = self._require_selected()
+        algorithm = _text(args[0]).upper()
+        if f'THREAD={algorithm}' not in self.server.capabilities:
+            raise _ProtocolError(f'unsupported thread algorithm {algorithm}')
+        matches = self._search(args[2:], mailbox, _text(args[1]))
+        threads = {}
+        for seq, message in matches:
+            threads.setdefault(_base_subject(message.parsed.get('Subject', '')), []).append(
+                message.uid if uid else seq)
+        output = ''
+        for numbers in threads.values():
+            if len(numbers) == 1:
+                output += f'({numbers[0]})'
+            else:
+                output += f'({numbers[0]} ' + ''.join(f'({number})' for number in numbers[1:]) + ')'
+        return f'* THREAD {output}'.rstrip().encode() + b'\r\n'
+
+    async def _idle(self, tag: str):
+        if 'IDLE' not in self.server.capabilities:
+            await self.write(f'{tag} BAD IDLE not supported\r\n'.encode())
+            return
+        await self.write(b'+ idling\r\n')
+        while True:
+            with self.server.lock:
+                updates = self._pending_updates()
+            if updates:
+                await self.write(updates)
+            if b'\r\n' in self.buffer:
+                break
+            try:
+                await asyncio.wait_for(self._fill(), timeout=self.server.idle_poll_interval)
+            except asyncio.TimeoutError:
+                continue
+        line = await self.readline()
+        if line.strip().upper() != b'DONE':
+            await self.write(f'{tag} BAD expected DONE\r\n'.encode())
+            return
+        await self.write(f'{tag} OK IDLE terminated\r\n'.encode())
+
+
+class LocalImapServer:
+    """运行在本机的imap服务器，数据保存在内存中
+
+    Parameters
+    ----------
+    host: str, default '127.0.0.1'
+        监听地址
+    port: int, default 0
+        监听端口，为0时由系统分配空闲端口
+    user: str, default 'user'
+        用户名
+    password: str, default 'password'
+        密码
+    latency: float, default 0
+        收到命令以后至少等待多少秒才返回响应，用于模拟网络往返时间，连续发送的多条命令的等待时间会重叠
+    capabilities: iterable of str, default None
+        服务器声明支持的扩展，默认为 ``DEFAULT_CAPABILITIES``，可以去掉部分扩展测试降级逻辑
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, user: str = 'user', password: str = 'password',
+                 latency: float = 0, capabilities=None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.latency = latency
+        self.capabilities = tuple(capabilities if capabilities is not None else DEFAULT_CAPABILITIES)
+        self.idle_poll_interval = 0.05
+        self.lock = threading.RLock()
+        self.mailboxes = {}
+        self.command_count = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._uidvalidity = int(time.time())
+        self._loop = None
+        self._thread = None
+        self._server = None
+        self._sessions = set()
+        for name, attributes in (('INBOX', ()), ('Drafts', ('\\Drafts',)), ('Sent', ('\\Sent',)),
+                                 ('Trash', ('\\Trash',)), ('&V4NXPpCuTvY-', ('\\Junk',))):
+            self.create_mailbox(name, attributes)
+
+    def create_mailbox(self, name: str, attributes=()) -> _Mailbox:
+        """创建文件夹，``name`` 为imap编码后的名称"""
+        with self.lock:
+            self._uidvalidity += 1
+            mailbox = _Mailbox(name, self._uidvalidity, attributes)
+            self.mailboxes[name] = mailbox
+            return mailbox
+
+    def add_message(self, folder: str, raw: bytes, flags=(), internaldate: datetime = None) -> int:
+        """向文件夹追加一封邮件，返回邮件的uid"""
+        with self.lock:
+            return self.mailboxes[folder].append(raw, flags, internaldate).uid
+
+    def expunge(self, folder: str, uids):
+        """直接删除文件夹中的邮件，模拟其它客户端的操作"""
+        uids = set(uids)
+        with self.lock:
+            mailbox = self.mailboxes[folder]
+            mailbox.expunge([message for message in mailbox.messages if message.uid in uids])
+
+    def set_flags(self, folder: str, uid: int, flags):
+        """直接修改邮件标志，模拟其它客户端的操作"""
+        with self.lock:
+            mailbox = self.mailboxes[folder]
+            for message in mailbox.messages:
+                if message.uid == uid:
+                    message.flags = set(flags)
+                    mailbox.touch(message)
+
+    def reset_uidvalidity(self, folder: str):
+        """修改文件夹的UIDVALIDITY，模拟服务器重建文件夹"""
+        with self.lock:
+            self._uidvalidity += 1
+            self.mailboxes[folder].uidvalidity = self._uidvalidity
+
+    def seed(self, folder: str = 'INBOX', count: int = 100, *, size: int = 1024, attachment_size: int = 0,
+             charsets=('utf-8', 'gbk'), html: bool = False, seen_ratio: float = 0.5, seed: int = 0,
+             lazy: bool | None = None):
+        """批量生成测试邮件
+
+        Parameters
+        ----------
+        folder: str, default 'INBOX'
+            文件夹名称，不存在时自动创建
+        count: int, default 100
+            邮件数量
+        size: int, default 1024
+            正文大约的字节数
+        attachment_size: int, default 0
+            附件字节数，为0时不带附件
+        charsets: tuple of str, default ('utf-8', 'gbk')
+            正文和主题的编码，邮件依次轮流使用
+        html: bool, default False
+            是否同时生成html正文和内嵌图片
+        seen_ratio: float, default 0.5
+            标记为已读的邮件比例
+        seed: int, default 0
+            随机数种子，相同的种子生成相同的邮件
+        lazy: bool, default None
+            是否在访问时才生成邮件内容，内存中只保存邮件的元信息，为 ``None`` 时超过10000封邮件才延迟生成。
+            延迟生成和立即生成的邮件内容相同
+        """
+        rng = random.Random(seed)
+        start = datetime(2023, 1, 1, tzinfo=timezone(timedelta(hours=8)))
+        if lazy is None:
+            lazy = count > 10000
+
+        def make(index, date):
+            # 每封邮件使用单独的随机数生成器，延迟生成时内容不变
+            charset = charsets[index % len(charsets)]
+            return _make_message(random.Random(seed * 1000003 + index), index, charset, date, size,
+                                 attachment_size, html)
+
+        with self.lock:
+            mailbox = self.mailboxes.get(folder) or self.create_mailbox(folder)
+            for index in range(count):
+                date = start + timedelta(minutes=index * 7 + rng.randrange(7))
+                raw = functools.partial(make, index, date) if lazy else make(index, date)
+                flags = ('\\Seen',) if rng.random() < seen_ratio else ()
+                mailbox.append(raw, flags, date)
+
+    def start(self) -> 'LocalImapServer':
+        """在后台线程中启动服务器"""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+            self._server.close()
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='LocalImapServer', daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        """停止服务器"""
+        if self._loop is not None:
+            # 先断开还没有退出的客户端连接，再停止事件循环
+            asyncio.run_coroutine_threadsafe(self._close_sessions(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    async def _close_sessions(self):
+        self._server.close()
+        # 关闭连接以后会话读取到EOF正常退出
+        for session in list(self._sessions):
+            session.writer.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=1)
+
+    async def _handle(self, reader, writer):
+        session = _Session(self, reader, writer)
+        self._sessions.add(session)
+        try:
+            await session.run()
+        finally:
+            self._sessions.discard(session)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def _encode_words(text: str, charset: str) -> str:
+    if text.isascii():
+        return text
+    encoded = base64.b64encode(text.encode(charset)).decode('ascii')
+    return f'=?{charset}?b?{encoded}?='
+
+
+def _wrap_base64(data: bytes) -> bytes:
+    encoded = base64.b64encode(data)
+    return b'\r\n'.join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+
+
+def _make_message(rng: random.Random, index: int, charset: str, date: datetime, size: int, attachment_size: int,
+                  html: bool) -> bytes:
+    """按照模板快速拼接一封邮件的原始字节"""
+    words = _CJK_WORDS if charset.lower() != 'utf-8' or index % 3 == 0 else _WORDS
+    separator = '' if words is _CJK_WORDS else ' '
+    subject = f'{separator.join(rng.choice(words) for _ in range(3))} #{index}'
+    sentence = separator.join(rng.choice(words) for _ in range(12))
+    text = ''
+    while len(text.encode(charset)) < size:
+        text += sentence + '\r\n'
+    headers = (
+        f'From: {_encode_words("发件人", charset)} <sender{index % 50}@example.com>\r\n'
+        f'To: user@example.com\r\n'
+        f'Subject: {_encode_words(subject, charset)}\r\n'
+        f'Date: {date.strftime("%a, %d %b %Y %H:%M:%S %z")}\r\n'
+        f'Message-ID: <{index}.{rng.randrange(1 << 30)}@example.com>\r\n'
+        f'MIME-Version: 1.0\r\n'
+    )
+    text_part = (
+        f'Content-Type: text/plain; charset="{charset}"\r\n'
+        f'Content-Transfer-Encoding: base64\r\n\r\n'
+    ).encode() + _wrap_base64(text.encode(charset)) + b'\r\n'
+
+    if not attachment_size and not html:
+        return headers.encode() + text_part
+
+    boundary = f'----=_Part_{index}_{rng.randrange(1 << 30)}'
+    parts = [text_part]
+    if html:
+        html_text = f'<html><body><p>{sentence}</p><img src="cid:image{index}"></body></html>'
+        parts.append((
+            f'Content-Type: text/html; charset="{charset}"\r\n'
+            f'Content-Transfer-Encoding: base64\r\n\r\n'
+        ).encode() + _wrap_base64(html_text.encode(charset)) + b'\r\n')
+        parts.append((
+            f'Content-Type: image/png; name="image{index}.png"\r\n'
+            f'Content-Transfer-Encoding: base64\r\n'
+            f'Content-ID: <image{index}>\r\n'
+            f'Content-Disposition: inline; filename="image{index}.png"\r\n\r\n'
+        ).encode() + _wrap_base64(rng.randbytes(256)) + b'\r\n')
+    if attachment_size:
+        filename = _encode_words(f'附件{index % 10}.bin', charset)
+        parts.append((
+            f'Content-Type: application/octet-stream; name="{filename}"\r\n'
+            f'Content-Transfer-Encoding: base64\r\n'
+            f'Content-Disposition: attachment; filename="{filename}"\r\n\r\n'
+        ).encode() + _wrap_base64(rng.randbytes(attachment_size)) + b'\r\n')
+
+    body = b''.join(f'--{boundary}\r\n'.encode() + part for part in parts) + f'--{boundary}--\r\n'.encode()
+    content_type = 'multipart/related' if html and not attachment_size else 'multipart/mixed'
+    return (headers + f'Content-Type: {content_type}; boundary="{boundary}"\r\n\r\n').encode() + body
@@ -1,28 +1,139 @@
 from email.message import Message
 from email.header import decode_header
+from email.utils import decode_rfc2231
 from pathlib import Path
-from typing import Union
+from typing import Union, Iterable
+from urllib.parse import unquote
 import base64
+import os
+import quopri
+import re
+
+
+# GB2312和GBK都是GB18030的子集，很多邮件声明为GB2312却包含GBK字符，统一按GB18030解码
+_CHARSET_ALIASES = {
+    'gb2312': 'gb18030',
+    'gbk': 'gb18030',
+    'x-gbk': 'gb18030',
+    'cp936': 'gb18030',
+    'unknown-8bit': None,
+}
+
+
+def decode_bytes(data: bytes, charset: str | None = None) -> str:
+    """按字符集解码，字符集缺失或者错误时依次尝试utf-8和gb18030，都失败时替换无法解码的字符"""
+    charsets = []
+    if charset:
+        charset = charset.strip().lower()
+        charsets.append(_CHARSET_ALIASES.get(charset, charset))
+    charsets.extend(['utf-8', 'gb18030'])
+
+    for charset in charsets:
+        if charset is None:
+            continue
+        try:
+            return str(data, charset)
+        except (LookupError, UnicodeDecodeError):
+            continue
+
+    return str(data, 'utf-8', 'replace')
 
 
 def decode_mail_header(header):
     """解析邮件元数据"""
 
+    # message_from_bytes解析邮件时，邮件头中未编码的8bit字符以surrogateescape的形式保存
+    if isinstance(header, str) and not header.isascii():
+        try:
+            header = decode_bytes(header.encode('ascii', 'surrogateescape'))
+        except UnicodeEncodeError:
+            pass
+
     results = decode_header(header)
     values = []
 
     for val, encoding in results:
-        if encoding is None:
-            encoding = 'utf8'
-
         if isinstance(val, bytes):
-            val = val.decode(encoding)
+            # 没有编码的部分被decode_header以raw-unicode-escape编码
+            val = decode_bytes(val, encoding) if encoding is not None else val.decode('raw-unicode-escape')
 
         values.append(val)
 
     return values
 
 
+def decode_transfer_encoding(data: bytes, encoding: str | None) -> bytes:
+    """根据Content-Transfer-Encoding解码邮件内容"""
+    encoding = (encoding or '7bit').lower()
+
+    if encoding == 'base64':
+        return base64.b64decode(data)
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(data)
+    return data
+
+
+class TransferDecoder:
+    """增量解码Content-Transfer-Encoding，用于分块下载附件时边下载边解码
+
+    Examples
+    --------
+    >>> decoder = TransferDecoder('base64')
+    >>> decoder.decode(b'aGVsbG8g') + decoder.decode(b'd29y\r\nbGQ=') + decoder.flush()
+    b'hello world'
+    """
+
+    def __init__(self, encoding: str | None):
+        self.encoding = (encoding or '7bit').lower()
+        self._pending = b''
+
+    def decode(self, data: bytes) -> bytes:
+        """解码一块数据，不完整的部分留到下一次解码"""
+        if self.encoding == 'base64':
+            data = self._pending + data.translate(None, b' \t\r\n')
+            # base64每4个字符对应3个字节，剩余的字符留到下一块
+            end = len(data) - len(data) % 4
+            self._pending = data[end:]
+            return base64.b64decode(data[:end])
+        if self.encoding == 'quoted-printable':
+            data = self._pending + data
+            # quoted-printable按行解码，最后不完整的一行留到下一块
+            end = data.rfind(b'\n') + 1
+            self._pending = data[end:]
+            return quopri.decodestring(data[:end])
+        return data
+
+    def flush(self) -> bytes:
+        """解码剩余的数据"""
+        pending, self._pending = self._pending, b''
+        return decode_transfer_encoding(pending, self.encoding) if pending else b''
+
+
+def decode_params(params: list | None) -> dict:
+    """将BODYSTRUCTURE中的参数列表转换为字典，键为小写，并解码RFC2231和RFC2047编码的值
+
+    Examples
+    --------
+    >>> decode_params(['CHARSET', 'utf-8', 'NAME*', "utf-8''%E9%99%84%E4%BB%B6.pdf"])
+    {'charset': 'utf-8', 'name': '附件.pdf'}
+    """
+    results = {}
+
+    for key, value in zip((params or [])[::2], (params or [])[1::2]):
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', 'replace')
+        key = key.lower()
+        if key.endswith('*'):
+            key = key.rstrip('*')
+            charset, language, value = decode_rfc2231(value)
+            value = unquote(value, encoding=charset or 'utf-8')
+        elif value is not None:
+            value = ''.join(decode_mail_header(value))
+        results[key] = value
+
+    return results
+
+
 def parse_raw_mail(raw_mail: Message) -> dict:
     """递归解析原始邮件，返回邮件内容组成的字典:
 
@@ -52,10 +163,10 @@ def parse_raw_mail(raw_mail: Message) -> dict:
             for part in parts.get_payload():
                 _parse(part)
         elif content_type == 'text/plain':
-            content['text_body'] = parts.get_payload(decode=True).decode(parts.get_content_charset())
+            content['text_body'] = decode_bytes(parts.get_payload(decode=True), parts.get_content_charset())
         elif content_type == 'text/html':
             html_coding = parts.get_content_charset()
-            content['html_body'] = parts.get_payload(decode=True).decode(html_coding)
+            content['html_body'] = decode_bytes(parts.get_payload(decode=True), html_coding)
             content['html_encoding'] = html_coding
         elif content_type.startswith('image'):
             filename = decode_mail_header(parts.get_filename())[0]
@@ -81,14 +192,29 @@ def parse_raw_mail(raw_mail: Message) -> dict:
     return content
 
 
-def image_to_base64(image: Union[str, bytes], encoding) -> str:
+_SUBJECT_PREFIX_RE = re.compile(r'^\s*((re|fw|fwd|回复|答复|转发)\s*(\[\d+\])?\s*[:：]\s*)+', re.I)
+_SUBJECT_SUFFIX_RE = re.compile(r'(\s*\(fwd\))+\s*$', re.I)
+
+
+def base_subject(subject: str) -> str:
+    """去掉主题中的回复、转发前缀，用于按主题排序和归并会话，参考RFC 5256的base subject"""
+    subject = ' '.join(subject.split())
+
+    while True:
+        stripped = _SUBJECT_SUFFIX_RE.sub('', _SUBJECT_PREFIX_RE.sub('', subject))
+        if stripped == subject:
+            return subject.lower()
+        subject = stripped
+
+
+def image_to_base64(image: Union[str, os.PathLike, bytes], encoding) -> str:
     """
     将图片转换成base64编码
 
     Parameters
     ----------
-    image: str or bytes
-        字节码或者字符串，如果是字符串，表示图片的路径
+    image: str, PathLike or bytes
+        字节码或者字符串，如果是字符串或者路径对象，表示图片的路径
     encoding: str
         字符串编码
 
@@ -97,7 +223,7 @@ def image_to_base64(image: Union[str, bytes], encoding) -> str:
         base64编码的字符串
     """
 
-    if isinstance(image, str):
+    if isinstance(image, (str, os.PathLike)):
         image = Path(image).read_bytes()
     image_base64 = base64.b64encode(image)
     image_base64 = image_base64.decode(encoding)
@@ -112,3 +238,228 @@ def imap_utf7_encode(text: str) -> bytes:
 def imap_utf7_decode(bytes_: bytes) -> str:
     """将imap的字节编码转换成字符串，imap是utf7格式，并将+号替换成&号"""
     return bytes_.replace(b'&', b'+').decode('utf7')
+
+
+def to_message_sets(ids: Iterable[Union[int, str]], batch_size: int | None = 500,
+                    max_length: int | None = None) -> list[str]:
+    """将邮件编号压缩成imap的序列集合字符串，比如 ``[1, 2, 3, 5]`` 转换成 ``['1:3,5']``
+
+    Parameters
+    ----------
+    ids: iterable of int or str
+        邮件编号
+    batch_size: int, default 500
+        每个序列集合最多包含的邮件数量，避免单条命令过长，为 ``None`` 时不限制
+    max_length: int, default None
+        每个序列集合字符串的最大长度，为 ``None`` 时不限制
+
+    Returns
+    -------
+        序列集合字符串组成的列表
+    """
+    ids = sorted({int(i) for i in ids})
+    batch_size = batch_size or max(len(ids), 1)
+    message_sets = []
+
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        ranges = []
+        first = last = batch[0]
+
+        for i in batch[1:]:
+            if i == last + 1:
+                last = i
+                continue
+            ranges.append(f"{first}:{last}" if first != last else f"{first}")
+            first = last = i
+
+        ranges.append(f"{first}:{last}" if first != last else f"{first}")
+
+        if max_length is None:
+            message_sets.append(','.join(ranges))
+            continue
+
+        # 按长度拆分成多个序列集合
+        chunk, length = [], 0
+        for item in ranges:
+            if chunk and length + len(item) + 1 > max_length:
+                message_sets.append(','.join(chunk))
+                chunk, length = [], 0
+            chunk.append(item)
+            length += len(item) + 1
+        message_sets.append(','.join(chunk))
+
+    return message_sets
+
+
+def parse_message_set(message_set: str) -> list[int]:
+    """将序列集合字符串展开成编号列表，是 :func:`to_message_sets` 的逆操作
+
+    Examples
+    --------
+    >>> parse_message_set('1:3,5')
+    [1, 2, 3, 5]
+    """
+    numbers = []
+
+    for part in message_set.split(','):
+        if not part:
+            continue
+        if ':' in part:
+            start, end = sorted(int(i) for i in part.split(':'))
+            numbers.extend(range(start, end + 1))
+        else:
+            numbers.append(int(part))
+
+    return numbers
+
+
+_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\+?\}$|([^\s()"\[]+(?:\[[^\]]*\][^\s()"]*)?))')
+
+
+def _tokenize(data: list) -> list:
+    """将imaplib返回的响应数据切分成记号
+
+    响应中的字面量(literal)在imaplib中表示为元组 ``(b'... {n}', b'<n个字节>')``，
+    字面量之后的内容作为单独的字节串出现在列表中
+    """
+    tokens = []
+
+    for resp in data:
+        if isinstance(resp, tuple):
+            text, literal = resp
+        else:
+            text, literal = resp, None
+
+        pos = 0
+        while pos < len(text):
+            match = _TOKEN_RE.match(text, pos)
+            if match is None or match.end() == pos:
+                break
+            pos = match.end()
+            lparen, rparen, quoted, literal_size, atom = match.groups()
+
+            if lparen:
+                tokens.append('(')
+            elif rparen:
+                tokens.append(')')
+            elif quoted is not None:
+                tokens.append(re.sub(rb'\\(.)', rb'\1', quoted).decode('utf-8', 'replace'))
+            elif literal_size is not None:
+                # 字面量大小标记只出现在行尾，后面紧跟元组中的字面量内容
+                continue
+            elif atom.upper() == b'NIL':
+                tokens.append(None)
+            else:
+                tokens.append(atom.decode('utf-8', 'replace'))
+
+        if literal is not None:
+            tokens.append(literal)
+
+    return tokens
+
+
+def _build_list(tokens: list, pos: int = 0) -> tuple[list, int]:
+    """根据记号构造嵌套列表，返回列表和结束位置"""
+    items = []
+
+    while pos < len(tokens):
+        token = tokens[pos]
+        pos += 1
+        if token == '(':
+            sub_items, pos = _build_list(tokens, pos)
+            items.append(sub_items)
+        elif token == ')':
+            return items, pos
+        else:
+            items.append(token)
+
+    return items, pos
+
+
+def parse_imap_list(data: Union[bytes, list]) -> list:
+    """将imap响应解析成嵌套列表，括号对应列表，NIL对应None，字面量保持为bytes
+
+    Examples
+    --------
+    >>> parse_imap_list(b'(\\HasNoChildren) "/" "INBOX"')
+    [['\\HasNoChildren'], '/', 'INBOX']
+    """
+    if isinstance(data, bytes):
+        data = [data]
+    items, _ = _build_list(_tokenize(data))
+    return items
+
+
+def parse_fetch_response(data: list) -> list[tuple[str, dict]]:
+    """解析fetch命令返回的数据
+
+    Parameters
+    ----------
+    data: list
+        :meth:`imaplib.IMAP4.fetch` 返回的数据
+
+    Returns
+    -------
+        列表，元素是 ``(邮件编号, 数据项字典)`` 组成的元组，数据项字典的键为大写的数据项名称，
+        比如 ``{'FLAGS': ['\\Seen'], 'RFC822': b'...'}``
+    """
+    data = [resp for resp in data if resp is not None]
+    items = parse_imap_list(data)
+    results = []
+
+    # 每条响应的格式为: 编号 (数据项名称 数据项值 ...)
+    for number, values in zip(items[::2], items[1::2]):
+        attrs = {}
+        for key, value in zip(values[::2], values[1::2]):
+            attrs[key.upper()] = value
+        results.append((number, attrs))
+
+    return results
+
+
+def parse_list_response(data: list) -> list[tuple[tuple, str | None, str]]:
+    """解析list命令返回的数据，返回(属性, 层级分隔符, 原始名称)组成的列表
+
+    Examples
+    --------
+    >>> parse_list_response([b'(\\HasNoChildren \\Sent) "/" "&XfJT0ZAB-"'])
+    [(('\\HasNoChildren', '\\Sent'), '/', '&XfJT0ZAB-')]
+    """
+    # 名称为字面量时，imaplib返回(b'(\\HasNoChildren) "/" {5}', b'INBOX')和后续的b''
+    lines = []
+    for item in data:
+        if item is None:
+            continue
+        if isinstance(item, bytes) and lines and isinstance(lines[-1][-1], tuple):
+            lines[-1].append(item)
+        else:
+            lines.append([item])
+
+    results = []
+    for line in lines:
+        tokens = parse_imap_list(line)
+        if len(tokens) < 3:
+            continue
+        attributes, delimiter, name = tokens[:3]
+        if isinstance(delimiter, bytes):
+            delimiter = delimiter.decode('ascii')
+        if isinstance(name, bytes):
+            name = name.decode('utf-8')
+        results.append((tuple(attributes or ()), delimiter, name))
+
+    return results
+
+
+def parse_folder_list(data: list) -> dict[str, str]:
+    """解析list命令返回的数据，返回字典，键是解码后的小写文件夹名称，值是文件夹的原始名称"""
+    # 结果中类似&XfJT0ZAB-的字符串是utf7编码，并且把+号替换回&符号
+    return {imap_utf7_decode(name.encode('ascii')).lower(): name for attributes, delimiter, name in
+            parse_list_response(data)}
+
+
+def quote_mailbox(name: str) -> str:
+    """文件夹名称包含空格、引号等不能出现在atom中的字符时，加上双引号"""
+    if re.fullmatch(r'[^\x00-\x20(){%*"\\\]\x7f]+', name):
+        return name
+    return '"' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
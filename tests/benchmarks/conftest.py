@@ -0,0 +1,24 @@
+import os
+import pytest
+from imap_easybox import ImapEasyBox
+from imap_easybox.testing import LocalImapServer
+
+# 可以通过环境变量调整邮件数量和网络延迟，比如 IMAP_EASYBOX_BENCH_MAILS=100000 IMAP_EASYBOX_BENCH_LATENCY=0.02
+MAIL_COUNT = int(os.environ.get('IMAP_EASYBOX_BENCH_MAILS', 10000))
+LATENCY = float(os.environ.get('IMAP_EASYBOX_BENCH_LATENCY', 0))
+
+
+@pytest.fixture(scope='session')
+def imap_server():
+    with LocalImapServer(latency=LATENCY) as server:
+        server.seed('INBOX', MAIL_COUNT, size=2048)
+        server.seed('Attachments', 200, size=1024, attachment_size=256 * 1024, html=True)
+        server.create_mailbox('Archive')
+        server.create_mailbox('Moves')
+        yield server
+
+
+@pytest.fixture
+def box(imap_server):
+    with ImapEasyBox(imap_server.host, imap_server.port, imap_server.user, imap_server.password, ssl=False) as box:
+        yield box
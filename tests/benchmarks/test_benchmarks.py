@@ -0,0 +1,72 @@
+import itertools
+import pytest
+from imap_easybox.email import Mail
+
+pytest.importorskip('pytest_benchmark')
+
+
+def test_search_all(benchmark, box):
+    inbox = box.select('inbox')
+    mails = benchmark(inbox.search, 'ALL')
+    assert len(mails) == len(box.select('inbox').mails)
+
+
+def test_search_criteria(benchmark, box):
+    inbox = box.select('inbox')
+    mails = benchmark(inbox.search, seen=True)
+    assert 0 < len(mails)
+
+
+def test_fetch_headers(benchmark, box):
+    inbox = box.select('inbox')
+    uids = inbox.mails.uids[:500]
+
+    # 每轮使用新的邮件对象，避免已经获取的邮件头被复用
+    mails = benchmark(lambda: inbox.fetch([Mail(uid, inbox) for uid in uids], 'BODY.PEEK[HEADER]'))
+    assert all(mail.subject for mail in mails)
+
+
+def test_raw_mail(benchmark, box):
+    inbox = box.select('inbox')
+    uids = itertools.cycle(inbox.mails.uids[:1000])
+    raw_mail = benchmark(lambda: Mail(next(uids), inbox).raw_mail)
+    assert raw_mail['Subject']
+
+
+def test_content(benchmark, box):
+    inbox = box.select('inbox')
+    uids = itertools.cycle(inbox.mails.uids[:1000])
+    content = benchmark(lambda: Mail(next(uids), inbox).content)
+    assert content['text_body']
+
+
+def test_store_flags(benchmark, box):
+    inbox = box.select('inbox')
+    # 间隔选择邮件，uid不能压缩成连续区间
+    mails = inbox.mails.uids[:2000:2]
+
+    def store():
+        inbox.add_flags(mails, 'flagged')
+        inbox.remove_flags(mails, 'flagged')
+
+    benchmark(store)
+    assert not inbox.search(flagged=True)
+
+
+def test_move_to(benchmark, box, imap_server):
+    moves = box.select('moves')
+    raw = imap_server.mailboxes['INBOX'].messages[0].raw
+
+    def setup():
+        uid = imap_server.add_message('Moves', raw)
+        return (Mail(uid, moves),), {}
+
+    benchmark.pedantic(lambda mail: mail.move_to('archive'), setup=setup, rounds=50)
+    assert not box.select('moves', force=True).mails
+
+
+def test_save_attachments(benchmark, box, tmp_path):
+    folder = box.select('attachments')
+    uids = itertools.cycle(folder.mails.uids)
+    paths = benchmark(lambda: Mail(next(uids), folder).save_attachments(tmp_path))
+    assert paths
@@ -0,0 +1,16 @@
+from pathlib import Path
+
+import pytest
+
+# 仓库中保存的性能基准结果
+BENCHMARK_BASELINES = Path(__file__).parent / 'benchmarks' / 'baselines'
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    """没有指定 ``--benchmark-storage`` 时，保存和比较都使用仓库中的基准目录，和运行pytest时的当前目录无关
+
+    性能基准在插件初始化时加载，所以需要放在顶层的conftest中，只运行 ``tests`` 下的某个目录时也能生效
+    """
+    if config.getoption('benchmark_storage', None) == 'file://./.benchmarks':
+        config.option.benchmark_storage = BENCHMARK_BASELINES.as_uri()
@@ -1,4 +1,6 @@
 import pytest
+from imap_easybox import ImapEasyBox, MailCache
+from .conftest import settings
 
 
 class TestServer:
@@ -26,6 +28,11 @@ class TestServer:
         assert mail_box.state == 'SELECTED'
         assert inbox.folder_name == 'inbox'
 
+    def test_select_records_uidvalidity(self, mail_box):
+        inbox = mail_box.select('inbox')
+        assert inbox.uidvalidity is not None
+        assert int(inbox.mails[-1].mail_id) < inbox.uidnext
+
     def test_select_folder_by_item(self, mail_box):
         folders = mail_box.folders
         draft_folder = folders[1]
@@ -60,6 +67,26 @@ class TestFolder:
         mails = inbox.search('(SUBJECT "new")')
         assert "new" in mails[0].subject
 
+    def test_fetch_all(self, inbox):
+        mails = inbox.fetch_all(inbox.mails[:20], batch_size=5, workers=2)
+        assert [mail.mail_id for mail in mails] == [mail.mail_id for mail in inbox.mails[:20]]
+        assert all(mail._raw_mail is not None for mail in mails)
+
+    def test_sync(self, inbox):
+        result = inbox.sync()
+        assert result.full
+        result = inbox.sync(result.state)
+        assert not result.full and result.new == []
+
+    def test_fetch_mails(self, inbox):
+        mails = inbox.fetch(inbox.mails[:5])
+        assert all(mail._raw_mail is not None for mail in mails)
+
+    def test_search_prefetch_headers(self, inbox):
+        mails = inbox.search(subject="new", prefetch='headers')
+        assert "new" in mails[0].subject
+        assert mails[0]._raw_mail is None
+
 
 class TestMail:
 
@@ -67,3 +94,18 @@ class TestMail:
         mail = inbox.mails[0]
         mail.add_flags(['Flagged', 'Answered'])
         assert 'Flagged' in mail.flags and 'Answered' in mail.flags
+
+    def test_text_body_without_raw_mail(self, inbox):
+        mail = inbox.mails[0]
+        assert mail.text_body is not None or mail.html_body is not None
+        assert mail._raw_mail is None
+
+
+class TestCache:
+    def test_read_from_cache(self):
+        cache = MailCache(':memory:')
+        with ImapEasyBox(settings.host, settings.port, settings.user, settings.password, cache=cache) as box:
+            inbox = box.select('inbox')
+            subject = inbox.mails[0].subject
+            assert len(cache) == 1
+            assert inbox.mails[0].subject == subject
@@ -4,6 +4,10 @@ from imap_easybox import ImapEasyBox
 
 
 class FakeImap(IMAP4_SSL):
+    capabilities = ('IMAP4REV1',)
+
+    def capability(self):
+        return 'OK', [b'IMAP4REV1']
 
     def list(self, *args, **kwargs):
         return 'OK', [b'(\\Marked) "/" "INBOX"', b'(\\Marked) "/" "Drafts"', b'(\\Marked) "/" "&XfJT0ZAB-"']
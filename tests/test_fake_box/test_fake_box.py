@@ -1,2 +1,1261 @@
+import asyncio
+import base64
+import email
+import hashlib
+import imaplib
+import json
+import quopri
+import socket
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
 
+import pytest
+from imap_easybox import ImapEasyBox
+from imap_easybox.aio import AsyncImapConnection, AsyncImapEasyBox
+from imap_easybox.archive import ArchivedMail, open_writer, read_archive, detect_format
+from imap_easybox.cache import MailCache
+from imap_easybox.compress import DeflateSocket
+from imap_easybox.email import Mail, MailPart
+from imap_easybox.extract import SpilledPayload, extract_batch
+from imap_easybox.index import MailIndex, segment
+from imap_easybox.folder import Folder, FolderInfo, FolderList, IdleEvent, MailList
+from imap_easybox.pipeline import Pipeline, PipelineResultGroup
+from imap_easybox.stats import Stats, StatsEvent
+from imap_easybox.store import AttachmentStore
+from imap_easybox.testing import DEFAULT_CAPABILITIES, LocalImapServer
+from imap_easybox.utils import (to_message_sets, parse_fetch_response, decode_params, TransferDecoder,
+                                parse_message_set, decode_bytes, decode_mail_header, base_subject,
+                                parse_list_response, quote_mailbox)
 
+
+class TestUtils:
+    def test_to_message_sets(self):
+        assert to_message_sets([5, 1, 2, 3, 9, 10, 12]) == ['1:3,5,9:10,12']
+        assert to_message_sets(['3', '1', '2', '4'], batch_size=2) == ['1:2', '3:4']
+        assert to_message_sets([]) == []
+        assert to_message_sets(range(1, 10001), None) == ['1:10000']
+        assert to_message_sets([1, 3, 5, 7, 9, 11], None, max_length=5) == ['1,3', '5,7', '9,11']
+
+    def test_parse_message_set(self):
+        assert parse_message_set('1:3,5,9:8') == [1, 2, 3, 5, 8, 9]
+
+    def test_parse_fetch_response(self):
+        data = [(b'1 (UID 5 RFC822 {3}', b'abc'), b' FLAGS (\\Seen))', b'2 (FLAGS ())']
+        assert parse_fetch_response(data) == [
+            ('1', {'UID': '5', 'RFC822': b'abc', 'FLAGS': ['\\Seen']}),
+            ('2', {'FLAGS': []}),
+        ]
+
+    def test_decode_params(self):
+        params = ['CHARSET', 'utf-8', 'NAME*', "utf-8''%E9%99%84%E4%BB%B6.pdf", 'FILENAME', '=?gbk?b?uL28/g==?=']
+        assert decode_params(params) == {'charset': 'utf-8', 'name': '附件.pdf', 'filename': '附件'}
+
+    def test_parse_list_response(self):
+        data = [b'(\\HasNoChildren \\Sent) "/" "&XfJT0ZAB-"', (b'(\\Noselect) "." {6}', b'My box'), b'']
+        assert parse_list_response(data) == [
+            (('\\HasNoChildren', '\\Sent'), '/', '&XfJT0ZAB-'),
+            (('\\Noselect',), '.', 'My box'),
+        ]
+
+    def test_quote_mailbox(self):
+        assert quote_mailbox('INBOX') == 'INBOX'
+        assert quote_mailbox('My "box"') == '"My \\"box\\""'
+
+    def test_decode_bytes(self):
+        assert decode_bytes('镕'.encode('gbk'), 'gb2312') == '镕'
+        assert decode_bytes('中文'.encode('gbk')) == '中文'
+        assert decode_bytes('中文'.encode('utf-8'), 'unknown-charset') == '中文'
+
+    def test_decode_mail_header_8bit(self):
+        header = '中文主题'.encode('gbk').decode('ascii', 'surrogateescape')
+        assert decode_mail_header(header) == ['中文主题']
+
+    def test_base_subject(self):
+        assert base_subject('Re: RE: Fwd: Weekly  report (fwd)') == 'weekly report'
+        assert base_subject('回复：会议通知') == '会议通知'
+
+    def test_transfer_decoder(self):
+        decoder = TransferDecoder('base64')
+        assert decoder.decode(b'aGVsbG8g') + decoder.decode(b'd29y\r\nbGQ=') + decoder.flush() == b'hello world'
+        decoder = TransferDecoder('quoted-printable')
+        assert decoder.decode(b'caf=C3=A9 =\r\nbar\r\nba') + decoder.decode(b'z') + decoder.flush() == \
+               'café bar\r\nbaz'.encode()
+
+
+class TestFolder:
+    def test_parse_idle_line(self):
+        assert Folder._parse_idle_line(b'* 12 EXISTS') == [IdleEvent('EXISTS', 12)]
+        assert Folder._parse_idle_line(b'* 3 FETCH (UID 8 FLAGS (\\Seen))') == [
+            IdleEvent('FETCH', 3, {'UID': '8', 'FLAGS': ['\\Seen']})]
+        assert Folder._parse_idle_line(b'* VANISHED 4:6') == [IdleEvent('VANISHED', None, ['4', '5', '6'])]
+        assert Folder._parse_idle_line(b'* OK Still here') == []
+
+    def test_parse_sort_criteria(self):
+        assert Folder._parse_sort_criteria('reverse date subject') == [('DATE', True), ('SUBJECT', False)]
+        with pytest.raises(ValueError):
+            Folder._parse_sort_criteria(['unknown'])
+
+    def test_parse_copyuid(self):
+        data = [b'[COPYUID 38505 3:4,8 101:103] Done']
+        assert Folder._parse_copyuid(data) == {'3': '101', '4': '102', '8': '103'}
+
+
+def _connect(server, **kwargs) -> ImapEasyBox:
+    return ImapEasyBox(server.host, server.port, server.user, server.password, ssl=False, **kwargs)
+
+
+def _commands(box: ImapEasyBox) -> list[str]:
+    """记录之后发送的命令名称"""
+    names = []
+    box.add_observer(lambda event: names.append(event.name) if event.kind == 'command' else None)
+    return names
+
+
+def _sent(box: ImapEasyBox, monkeypatch) -> list[tuple]:
+    """记录之后通过主连接发送的命令和参数"""
+    sent = []
+    command = box.server._command
+
+    def record(name, *args):
+        sent.append((name, *args))
+        return command(name, *args)
+
+    monkeypatch.setattr(box.server, '_command', record)
+    return sent
+
+
+class TestFolderFetch:
+    def test_fetch_batches(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 25)
+            with _connect(server) as box:
+                inbox = box.select('inbox')
+                mails = list(inbox.mails)
+                commands = _commands(box)
+                assert inbox.fetch(mails, batch_size=10) == mails
+                assert commands.count('UID FETCH') == 3
+
+                # 内容已经填充到Mail对象中，不再请求服务器
+                assert [mail.subject.rsplit('#', 1)[1] for mail in mails] == [str(i) for i in range(25)]
+                assert all(mail.text_body for mail in mails)
+                assert len(commands) == 3
+
+    def test_search_prefetch(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 12)
+            with _connect(server) as box:
+                inbox = box.select('inbox')
+                commands = _commands(box)
+                mails = inbox.search('ALL', prefetch='headers', page_size=5)
+                assert mails[6].subject.endswith('#6') and mails[9].subject.endswith('#9')
+                # 第二页的5封邮件只需要一条fetch命令
+                assert commands == ['UID SEARCH', 'UID FETCH']
+                assert mails[6]._raw_mail is None
+
+    def test_fetch_all(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 40, seen_ratio=0)
+            with _connect(server, pool_size=3) as box:
+                inbox = box.select('inbox')
+                mails = inbox.fetch_all(batch_size=7)
+                assert [mail.mail_id for mail in mails] == [str(uid) for uid in range(1, 41)]
+                assert all(mail._raw_mail is not None for mail in mails)
+                assert mails[13].subject.endswith('#13')
+                assert 1 <= len(box.pool) <= 3
+                # 连接池以只读方式选择文件夹，不会把邮件标记为已读
+                assert len(inbox.search('UNSEEN')) == 40
+
+
+class TestFolderFlags:
+    def test_bulk_flags_split_long_sets(self, monkeypatch):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 6000, size=16, seen_ratio=0, lazy=True)
+            with _connect(server) as box:
+                inbox = box.select('inbox')
+                mails = inbox.mails[::2]
+                sent = _sent(box, monkeypatch)
+                assert inbox.add_flags(mails, ['seen', 'flagged']) == {}
+
+                stores = [command for command in sent if command[:2] == ('UID', 'STORE')]
+                assert len(stores) > 1 and all(len(command[2]) <= 4000 for command in stores)
+                assert stores[0][3:] == ('+FLAGS.SILENT', '(\\Seen \\Flagged)')
+                assert len(inbox.search('FLAGGED SEEN')) == 3000
+
+                result = inbox.remove_flags([mail.mail_id for mail in mails[:3]], 'flagged', silent=False)
+                assert result == {'1': ['Seen'], '3': ['Seen'], '5': ['Seen']}
+                assert inbox.set_flags([2, 4], 'answered') == {}
+                assert inbox.mails[1].flags == ['Answered']
+                assert len(inbox.search('FLAGGED')) == 2997
+
+
+    def test_mail_list_uses_uids(self, monkeypatch):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 20, size=16, seen_ratio=0)
+            server.create_mailbox('Archive')
+            with _connect(server) as box:
+                inbox = box.select('inbox')
+                mails = inbox.search('ALL', prefetch=True, page_size=5)
+                sent = _sent(box, monkeypatch)
+
+                # 设置标志、移动和流水线命令直接使用uid数组，不创建邮件对象，也不会预取邮件内容
+                inbox.add_flags(mails[:10], 'flagged')
+                with box.pipeline() as pipe:
+                    pipe.store(mails[10:], '+FLAGS.SILENT', 'seen')
+                    pipe.copy(mails[10:], 'archive')
+                inbox.move(mails[15:], 'archive')
+                assert mails._mails == {}
+                assert not any(command[:2] == ('UID', 'FETCH') for command in sent)
+                assert len(inbox.search('FLAGGED')) == 10 and len(inbox.search('SEEN')) == 5
+
+                # 生成器只能遍历一次，也能得到完整的uid
+                with box.pipeline() as pipe:
+                    store = pipe.store((uid for uid in (1, 2)), '+FLAGS.SILENT', 'answered')
+                assert store.args[1] == '1:2'
+                assert len(box.select('archive').search('ALL')) == 15
+
+
+class TestFolderIdle:
+    RAW = b'From: a@example.com\r\nTo: b@example.com\r\nSubject: pushed\r\n\r\nbody\r\n'
+
+    @pytest.mark.parametrize('capabilities', [DEFAULT_CAPABILITIES, ('IMAP4rev1', 'UIDPLUS')])
+    def test_push(self, capabilities):
+        with LocalImapServer(capabilities=capabilities) as server:
+            server.seed('INBOX', 1)
+            with _connect(server) as box:
+                inbox = box.select('inbox')
+                # 没有变化时到时间就结束
+                assert list(inbox.idle(timeout=0.1, poll_interval=0.02)) == []
+
+                timer = threading.Timer(0.1, server.add_message, ('INBOX', self.RAW))
+                timer.start()
+                events = inbox.idle(timeout=5, poll_interval=0.02)
+                assert next(events) == IdleEvent('EXISTS', 2)
+                events.close()
+                timer.join()
+
+                # 返回事件时已经结束IDLE，连接可以继续使用
+                assert [mail.subject for mail in inbox.search('UID 2')] == ['pushed']
+
+
+class TestFolderSync:
+    RAW = b'From: a@example.com\r\nTo: b@example.com\r\nSubject: new\r\n\r\nbody\r\n'
+
+    @staticmethod
+    def box(server):
+        return ImapEasyBox(server.host, server.port, server.user, server.password, ssl=False)
+
+    def test_incremental_sync(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 5, seen_ratio=0)
+            with self.box(server) as box:
+                # QRESYNC在第一次同步时才启用，已经选择了文件夹时先UNSELECT
+                inbox = box.select('inbox')
+                assert 'QRESYNC' not in box._enabled
+                result = inbox.sync()
+                assert 'QRESYNC' in box._enabled
+                assert result.full and [mail.mail_id for mail in result.new] == ['1', '2', '3', '4', '5']
+                assert result.changed is None and result.vanished is None
+
+                server.add_message('INBOX', self.RAW)
+                server.set_flags('INBOX', 2, ['\\Flagged'])
+                server.expunge('INBOX', [3])
+                result = inbox.sync(result.state)
+                assert not result.full
+                assert [mail.mail_id for mail in result.new] == ['6']
+                assert result.changed == {'2': ['Flagged']}
+                assert result.vanished == ['3']
+
+                result = inbox.sync(result.state)
+                assert (result.new, result.changed, result.vanished) == ([], {}, [])
+
+    def test_changedsince_failure(self, monkeypatch):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 3)
+            with self.box(server) as box:
+                inbox = box.select('inbox')
+                state = inbox.sync().state
+                server.set_flags('INBOX', 1, ['\\Flagged'])
+
+                uid = box.server.uid
+
+                def failing_uid(command, *args):
+                    if command == 'FETCH' and 'CHANGEDSINCE' in args[-1]:
+                        return 'NO', [b'CHANGEDSINCE failed']
+                    return uid(command, *args)
+
+                monkeypatch.setattr(box.server, 'uid', failing_uid)
+                with pytest.raises(RuntimeError, match='CHANGEDSINCE failed'):
+                    inbox.sync(state)
+
+    def test_without_qresync(self):
+        capabilities = tuple(c for c in DEFAULT_CAPABILITIES if c != 'QRESYNC')
+        with LocalImapServer(capabilities=capabilities) as server:
+            server.seed('INBOX', 2)
+            with self.box(server) as box:
+                state = box.select('inbox').sync().state
+                server.expunge('INBOX', [1])
+                result = box.select('inbox').sync(state)
+                assert result.vanished is None and 'QRESYNC' not in box._enabled
+
+    def test_missing_uidnext(self, monkeypatch):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 3)
+            with self.box(server) as box:
+                select = box.select
+
+                def select_without_uidnext(*args, **kwargs):
+                    folder = select(*args, **kwargs)
+                    folder.uidnext = None
+                    return folder
+
+                monkeypatch.setattr(box, 'select', select_without_uidnext)
+                inbox = box.select('inbox')
+                result = inbox.sync()
+                assert result.state['uidnext'] == 4
+
+                server.add_message('INBOX', self.RAW)
+                result = inbox.sync(result.state)
+                assert [mail.mail_id for mail in result.new] == ['4'] and result.state['uidnext'] == 5
+                assert len(inbox.sync({**result.state, 'uidnext': None}).new) == 4
+
+
+class TestFolderList:
+    def test_folder_info(self):
+        info = FolderInfo('已发送', '&XfJT0ZAB-', '/', ('\\HasNoChildren', '\\Sent'))
+        assert info.special_use == '\\Sent' and info.selectable
+        assert not info._replace(attributes=('\\NoSelect',)).selectable
+
+    def test_name_index(self):
+        box = SimpleNamespace(server=None)
+        folders = FolderList([Folder('inbox', box), Folder('已发送', box)])
+        assert folders._find('已发送') == 1
+        folders.insert(0, Folder('草稿箱', box))
+        assert folders._find('INBOX') == 1
+
+
+class TestImapEasyBox:
+    def test_parse_status(self):
+        data = [b'"INBOX" (MESSAGES 3 UNSEEN 1)', b'&V4NXPpCuTvY- (UIDNEXT 5)']
+        assert ImapEasyBox._parse_status(data) == [
+            ('INBOX', {'messages': 3, 'unseen': 1}),
+            ('&V4NXPpCuTvY-', {'uidnext': 5}),
+        ]
+
+
+class TestCompress:
+    def test_compressed_login(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 20, size=4096)
+            with _connect(server) as box:
+                inbox = box.select('inbox')
+                plain = [mail.raw_mail.as_bytes() for mail in inbox.fetch(list(inbox.mails))]
+                assert not box.compressed
+
+            with _connect(server, compress=True) as box:
+                assert box.compressed
+                inbox = box.select('inbox')
+                assert [mail.raw_mail.as_bytes() for mail in inbox.fetch(list(inbox.mails))] == plain
+
+                compression = box.stats()['compression']
+                assert compression['raw_bytes_received'] < compression['bytes_received'] and compression['ratio'] > 1
+
+                # IDLE超时以后重新创建文件对象，解压状态保存在socket上，可以继续读取
+                assert list(inbox.idle(timeout=0.05)) == []
+                assert len(inbox.search('ALL')) == 20
+
+                # 连接池中的连接同样启用压缩
+                with box.pool.acquire() as conn:
+                    assert isinstance(conn.sock, DeflateSocket)
+
+    def test_server_without_compress(self):
+        capabilities = [capability for capability in DEFAULT_CAPABILITIES if capability != 'COMPRESS=DEFLATE']
+        with LocalImapServer(capabilities=capabilities) as server:
+            server.seed('INBOX', 2)
+            with _connect(server, compress=True) as box:
+                assert not box.compressed and 'compression' not in box.stats()
+                assert len(box.select('inbox').mails) == 2
+
+
+class TestSelect:
+    def test_cached_select(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 3)
+            with _connect(server) as box:
+                commands = _commands(box)
+                inbox = box.select('INBOX')
+                again = box.select('inbox')
+                assert commands == ['SELECT']
+                assert (again.exists, again.uidvalidity, again.uidnext) == (3, inbox.uidvalidity, 4)
+
+                # 只读方式不同、强制重新选择或者连接状态改变时重新发送命令
+                box.select('inbox', readonly=True)
+                assert commands[-1] == 'EXAMINE'
+                server.add_message('INBOX', b'Subject: new\r\n\r\nbody\r\n')
+                assert box.select('inbox', readonly=True).exists == 3
+                assert box.select('inbox', readonly=True, force=True).exists == 4
+                box.server.close()
+                box.select('inbox', readonly=True)
+                assert commands == ['SELECT', 'EXAMINE', 'EXAMINE', 'CLOSE', 'EXAMINE']
+
+
+class TestStatus:
+    @staticmethod
+    def status(capabilities):
+        with LocalImapServer(capabilities=capabilities) as server:
+            server.seed('INBOX', 5, seen_ratio=0)
+            server.seed('Archive 2024', 3, seen_ratio=1)
+            server.create_mailbox('Projects', ('\\Noselect',))
+            with _connect(server) as box:
+                commands = _commands(box)
+                result = box.status()
+                # STATUS和LIST-STATUS都不需要选择文件夹
+                assert box.server.state == 'AUTH'
+                return result, list(commands), box.status(['INBOX'], items=['MESSAGES'])
+
+    def test_list_status(self):
+        with_list_status, commands, inbox = self.status(DEFAULT_CAPABILITIES)
+        assert commands == ['LIST']
+        assert inbox == {'inbox': {'messages': 5}}
+
+        capabilities = [capability for capability in DEFAULT_CAPABILITIES if capability != 'LIST-STATUS']
+        without_list_status, commands, inbox = self.status(capabilities)
+        # 每个文件夹一条STATUS命令，不能选择的文件夹返回NO，不在结果中
+        assert commands == ['STATUS'] * 7
+        assert inbox == {'inbox': {'messages': 5}}
+
+        assert with_list_status == without_list_status
+        assert with_list_status['inbox'] == {'messages': 5, 'unseen': 5, 'uidnext': 6}
+        assert with_list_status['archive 2024'] == {'messages': 3, 'unseen': 0, 'uidnext': 4}
+        assert 'projects' not in with_list_status and len(with_list_status) == 6
+
+
+class TestConnectionPool:
+    @staticmethod
+    def box(server, pool_size=2):
+        return ImapEasyBox(server.host, server.port, server.user, server.password, ssl=False, pool_size=pool_size)
+
+    def test_acquire_reuses_connection(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 5)
+            with self.box(server) as box:
+                with box.pool.acquire('INBOX', readonly=True) as first:
+                    assert first.state == 'SELECTED'
+                    assert first.uid('SEARCH', 'ALL')[1] == [b'1 2 3 4 5']
+                with box.pool.acquire('INBOX', readonly=True) as second:
+                    assert second is first
+                assert len(box.pool) == 1
+
+    def test_concurrency_limited_to_size(self):
+        with LocalImapServer() as server:
+            with self.box(server) as box:
+                in_use, peak, lock = set(), [0], threading.Lock()
+
+                def work():
+                    with box.pool.acquire() as conn:
+                        with lock:
+                            in_use.add(conn)
+                            peak[0] = max(peak[0], len(in_use))
+                        time.sleep(0.02)
+                        conn.noop()
+                        with lock:
+                            in_use.discard(conn)
+
+                threads = [threading.Thread(target=work) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                assert peak[0] == 2 and len(box.pool) == 2
+
+    def test_close_logs_out_connections_in_use(self):
+        with LocalImapServer() as server:
+            with self.box(server) as box:
+                pool = box.pool
+                with pool.acquire() as busy:
+                    with pool.acquire() as idle:
+                        pass
+                    pool.close()
+                    assert idle.state == 'LOGOUT' and busy.state != 'LOGOUT'
+                assert busy.state == 'LOGOUT' and len(pool) == 0
+                with pytest.raises(RuntimeError, match='closed'):
+                    with pool.acquire():
+                        pass
+
+    def test_failed_reconnect_is_discarded(self, monkeypatch):
+        with LocalImapServer() as server:
+            with self.box(server) as box:
+                pool = box.pool
+                pool.health_check_interval = 0
+                with pool.acquire() as conn:
+                    pass
+                conn.shutdown()
+
+                def connect():
+                    raise imaplib.IMAP4.error('LOGIN failed')
+
+                with monkeypatch.context() as patch:
+                    patch.setattr(box, 'connect', connect)
+                    with pytest.raises(imaplib.IMAP4.error):
+                        with pool.acquire():
+                            pass
+                assert len(pool) == 0 and not pool._idle
+
+                with pool.acquire() as conn:
+                    assert conn.noop()[0] == 'OK'
+
+
+    def test_folder_affinity_and_readonly(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 3, seen_ratio=0)
+            server.seed('Archive', 2)
+            with self.box(server) as box:
+                pool = box.pool
+                with pool.acquire('INBOX', readonly=True) as inbox:
+                    with pool.acquire('Archive', readonly=True) as archive:
+                        assert archive is not inbox
+
+                # 优先取出已经选择了该文件夹的连接，不需要重新选择
+                with pool.acquire('Archive', readonly=True) as conn:
+                    assert conn is archive
+                    assert conn.uid('SEARCH', 'ALL')[1] == [b'1 2']
+                with pool.acquire('INBOX', readonly=True) as conn:
+                    assert conn is inbox
+                    # 只读方式选择的文件夹不能修改标志
+                    assert conn.uid('STORE', '1', '+FLAGS', '(\\Seen)')[0] == 'NO'
+
+                # 读写方式不同时重新选择文件夹
+                with pool.acquire('INBOX') as conn:
+                    assert conn is inbox
+                    assert conn.uid('STORE', '1', '+FLAGS', '(\\Seen)')[0] == 'OK'
+                assert len(box.select('inbox').search('UNSEEN')) == 2 and len(pool) == 2
+
+    def test_broken_connections_are_replaced(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 2)
+            with self.box(server) as box:
+                pool = box.pool
+                # 命令执行中连接断开，连接不再放回连接池
+                with pytest.raises(imaplib.IMAP4.abort):
+                    with pool.acquire('INBOX'):
+                        raise imaplib.IMAP4.abort('socket error')
+                assert len(pool) == 0 and not pool._idle
+
+                # 空闲的连接被服务器断开，使用前检查发现以后重新登录
+                pool.health_check_interval = 0
+                with pool.acquire('INBOX') as conn:
+                    pass
+                conn.shutdown()
+                with pool.acquire('INBOX') as new:
+                    assert new is not conn
+                    assert new.uid('SEARCH', 'ALL')[1] == [b'1 2']
+                assert len(pool) == 1
+
+    def test_fetch_all_keeps_order(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 30)
+            with self.box(server, pool_size=4) as box:
+                inbox = box.select('inbox')
+                mails = list(reversed(inbox.mails))
+                # 多个连接按批次并行获取，结果按照传入的顺序返回
+                assert inbox.fetch_all(mails, batch_size=4, workers=3) == mails
+                assert [mail.subject.rsplit('#', 1)[1] for mail in mails] == [str(i) for i in range(29, -1, -1)]
+                assert 1 <= len(box.pool) <= 3
+
+class TestPipeline:
+    class FakeServer:
+        error = RuntimeError
+        abort = ConnectionError
+
+        def __init__(self, responses):
+            self.responses = responses
+            self.sent = []
+            self.untagged_responses = {}
+
+        def _command(self, name, *args):
+            self.sent.append((name, *args))
+            return f"A{len(self.sent)}".encode()
+
+        def _command_complete(self, name, tag):
+            # 只有发送完所有命令以后才读取响应
+            assert len(self.sent) == len(self.responses)
+            typ, untagged, text = self.responses[int(tag[1:]) - 1]
+            if untagged:
+                self.untagged_responses.setdefault('FETCH', []).extend(untagged)
+            return typ, [text]
+
+        def _untagged_response(self, typ, data, name):
+            return typ, self.untagged_responses.pop(name, [None])
+
+    def test_execute(self):
+        server = self.FakeServer([
+            ('OK', [b'1 (UID 3 FLAGS (\\Seen))'], b'FETCH completed'),
+            ('OK', None, b'STORE completed'),
+            ('NO', None, b'STATUS failed'),
+        ])
+        box = SimpleNamespace(server=server, _folders={})
+        mail = Mail('3', SimpleNamespace(box=box))
+
+        with Pipeline(box) as pipe:
+            flags = pipe.fetch(mail, 'FLAGS')
+            store = pipe.store([mail, '5', '6'], '+FLAGS.SILENT', 'seen')
+            status = pipe.command('STATUS', 'Trash', '(MESSAGES)', untagged='STATUS')
+            assert not flags.done
+
+        assert server.sent[0] == ('UID', 'FETCH', '3', '(FLAGS)')
+        assert server.sent[1] == ('UID', 'STORE', '3,5:6', '+FLAGS.SILENT', '(\\Seen)')
+        assert flags.data == [b'1 (UID 3 FLAGS (\\Seen))'] and store.text == [b'STORE completed']
+        assert status.typ == 'NO'
+
+        with pytest.raises(RuntimeError):
+            with Pipeline(box) as pipe:
+                server.sent, server.responses = [], [('NO', None, b'STORE failed')]
+                pipe.store('1:*', '+FLAGS', 'seen')
+
+    def test_empty_mails(self):
+        server = self.FakeServer([])
+        box = SimpleNamespace(server=server, _folders={'archive': 'Archive'})
+        empty = MailList(SimpleNamespace(box=box), [])
+
+        with Pipeline(box) as pipe:
+            with pytest.raises(ValueError, match='must not be empty'):
+                pipe.fetch([], 'FLAGS')
+            with pytest.raises(ValueError, match='must not be empty'):
+                pipe.store(empty, '+FLAGS', 'seen')
+            with pytest.raises(ValueError, match='must not be empty'):
+                pipe.copy((mail for mail in []), 'archive')
+        assert server.sent == []
+
+    def test_long_message_sets_are_split(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 6000, size=16, seen_ratio=0, lazy=True)
+            with ImapEasyBox(server.host, server.port, server.user, server.password, ssl=False) as box:
+                inbox = box.select('inbox')
+                mails = inbox.mails[::2]
+                with box.pipeline() as pipe:
+                    headers = pipe.fetch(mails, 'BODY.PEEK[HEADER]')
+                    store = pipe.store(mails, '+FLAGS.SILENT', 'flagged')
+
+                assert isinstance(headers, PipelineResultGroup) and len(headers.parts) > 1
+                assert all(len(part.args[1]) <= 4000 for part in headers.parts)
+                assert headers.typ == store.typ == 'OK'
+                assert len(parse_fetch_response(headers.data)) == 3000
+                assert mails[-1].subject.endswith('#5998')
+                assert len(inbox.search('FLAGGED')) == 3000
+
+
+class TestArchive:
+    @pytest.mark.parametrize('format', ['mbox', 'maildir', 'eml'])
+    def test_round_trip(self, tmp_path, format):
+        date = datetime(2023, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        mails = [
+            ArchivedMail(1, b'Subject: a\r\n\r\nFrom here\r\n>From there\r\n', ('\\Seen', '\\Flagged'), date),
+            ArchivedMail(2, b'Subject: b\r\n\r\nbody\r\n', (), date),
+        ]
+        path = tmp_path / f"archive.{format}"
+        writer = open_writer(path, format, 1234)
+        writer.write(mails)
+        writer.close()
+
+        assert detect_format(path) == format
+        archived = list(read_archive(path))
+        assert [mail.data.replace(b'\r\n', b'\n') for mail in archived] == [
+            mail.data.replace(b'\r\n', b'\n') for mail in mails]
+        assert all(mail.date == date for mail in archived)
+        if format == 'maildir':
+            assert sorted(archived[0].flags) == ['\\Flagged', '\\Seen']
+
+    def test_mbox_resume(self, tmp_path):
+        path = tmp_path / 'archive.mbox'
+        writer = open_writer(path, 'mbox')
+        writer.write([ArchivedMail(1, b'Subject: a\r\n\r\na\r\n')])
+        state = writer.state()
+        writer.write([ArchivedMail(2, b'Subject: b\r\n\r\nb\r\n')])
+        writer.close()
+
+        # 从检查点继续时丢弃检查点之后写入的邮件
+        writer = open_writer(path, 'mbox', state=state)
+        writer.write([ArchivedMail(3, b'Subject: c\r\n\r\nc\r\n')])
+        writer.close()
+        assert [mail.data for mail in read_archive(path)] == [b'Subject: a\n\na\n', b'Subject: c\n\nc\n']
+
+
+class TestFolderExport:
+    @pytest.mark.parametrize('format', ['mbox', 'maildir'])
+    def test_resume_and_import(self, tmp_path, monkeypatch, format):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 23, seen_ratio=0.5)
+            with _connect(server) as box:
+                inbox = box.select('inbox')
+                path = tmp_path / f'inbox.{format}'
+
+                # 获取第三批邮件时连接断开，前两批已经写入并记录检查点
+                uid_fetch, calls = Folder._uid_fetch, []
+
+                def interrupted(server_, message_set, parts):
+                    calls.append(message_set)
+                    if len(calls) == 3:
+                        raise imaplib.IMAP4.abort('connection lost')
+                    return uid_fetch(server_, message_set, parts)
+
+                monkeypatch.setattr(inbox, '_uid_fetch', interrupted)
+                with pytest.raises(imaplib.IMAP4.abort):
+                    inbox.export(path, format, batch_size=5)
+                monkeypatch.undo()
+                assert json.loads(path.with_name(path.name + '.checkpoint').read_text('utf-8'))['uid'] == 10
+
+                assert inbox.export(path, format, batch_size=5) == 13
+                server.add_message('INBOX', b'Subject: late\r\n\r\nbody\r\n', flags=('\\Flagged',))
+                assert box.select('inbox', force=True).export(path, format, batch_size=5) == 1
+
+                messages = server.mailboxes['INBOX'].messages
+                archived = list(read_archive(path))
+                assert [mail.data.replace(b'\r\n', b'\n') for mail in archived] == [
+                    message.raw.replace(b'\r\n', b'\n') for message in messages]
+
+                # 导入到其它文件夹，Maildir同时导入标志
+                assert box.select('trash').import_(path, batch_size=7) == 24
+                imported = server.mailboxes['Trash'].messages
+                assert [message.raw.replace(b'\r\n', b'\n') for message in imported] == [
+                    mail.data.replace(b'\r\n', b'\n') for mail in archived]
+                if format == 'maildir':
+                    assert [message.flags for message in imported] == [message.flags for message in messages]
+
+
+class TestDeflateSocket:
+    def test_round_trip(self):
+        left, right = socket.socketpair()
+        with left, right:
+            sock = DeflateSocket(left)
+            sock.sendall(b'A1 NOOP\r\n')
+            decompressor = zlib.decompressobj(-15)
+            assert decompressor.decompress(right.recv(1024)) == b'A1 NOOP\r\n'
+
+            compressor = zlib.compressobj(wbits=-15)
+            lines = b''.join(b'* %d FETCH (FLAGS ())\r\n' % i for i in range(1000))
+            right.sendall(compressor.compress(lines) + compressor.flush(zlib.Z_SYNC_FLUSH))
+            file = sock.makefile('rb')
+            assert file.readline() == b'* 0 FETCH (FLAGS ())\r\n'
+            # 重新创建文件对象以后继续读取
+            assert sock.makefile('rb') is file
+            assert file.read(len(lines) - 22) == lines[22:]
+            assert sock.bytes_received == len(lines) and sock.ratio > 1
+
+
+class TestMailList:
+    def test_lazy_sequence(self):
+        mails = MailList(None, [b'3', b'5', b'8', b'13'])
+        assert len(mails) == 4
+        assert mails[-1].mail_id == '13'
+        assert [mail.mail_id for mail in reversed(mails[1:])] == ['13', '8', '5']
+        assert mails[1:][0] is mails[1]
+        assert mails[0] in mails[:2] and mails[0] not in mails[2:]
+
+
+class TestMail:
+    def test_parse_headers(self):
+        headers = Mail._parse_headers(b'Subject: ' + '主题'.encode('gbk') + b'\r\nTo: a@b.c\r\n\r\n')
+        assert ''.join(decode_mail_header(headers['subject'])) == '主题'
+        assert headers['to'] == 'a@b.c'
+
+    def test_format_flags(self):
+        assert Mail._format_flags('seen, flagged') == '\\Seen \\Flagged'
+        assert Mail._format_flags(['answered']) == '\\Answered'
+
+
+    def test_uid_identity(self, monkeypatch):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 5, seen_ratio=0)
+            server.create_mailbox('Archive')
+            with _connect(server) as box:
+                inbox = box.select('inbox')
+                mail = inbox.search('ALL')[3]
+                assert mail.mail_id == '4'
+
+                # 删除前面的邮件以后序号变化，uid不变，同一个Mail对象仍然指向原来的邮件
+                server.expunge('INBOX', [1, 2])
+                sent = _sent(box, monkeypatch)
+                assert mail.subject.endswith('#3')
+                mail.add_flags('flagged')
+                assert mail.flags == ['Flagged']
+                assert [found.mail_id for found in inbox.search('FLAGGED')] == ['4']
+                assert [found.mail_id for found in inbox.search('ALL')] == ['3', '4', '5']
+
+                mail.move_to('archive')
+                assert [found.mail_id for found in inbox.search('ALL')] == ['3', '5']
+                # 所有命令都使用uid，不使用会随着删除变化的序号
+                assert {command[:2] for command in sent} == {
+                    ('UID', 'FETCH'), ('UID', 'STORE'), ('UID', 'SEARCH'), ('UID', 'MOVE')}
+
+    def test_select_records_uidvalidity(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 2)
+            with _connect(server) as box:
+                inbox = box.select('inbox')
+                assert inbox.uidvalidity == server.mailboxes['INBOX'].uidvalidity
+                assert box._uidvalidities == {'inbox': inbox.uidvalidity}
+
+                # 服务器重建文件夹以后，重新选择时记录新的UIDVALIDITY
+                server.reset_uidvalidity('INBOX')
+                inbox = box.select('inbox', force=True)
+                assert inbox.uidvalidity == server.mailboxes['INBOX'].uidvalidity
+                assert box._uidvalidities == {'inbox': inbox.uidvalidity}
+
+class TestMailHeaders:
+    def test_header_only_fetch(self, monkeypatch):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 3, seen_ratio=0)
+            with _connect(server) as box:
+                inbox = box.select('inbox')
+                mail = inbox.mails[1]
+                sent = _sent(box, monkeypatch)
+                assert mail.subject.endswith('#1') and mail.to == 'user@example.com'
+                assert mail.from_.startswith('发件人')
+                assert sent == [('UID', 'FETCH', '2', '(BODY.PEEK[HEADER])')]
+                assert mail._raw_mail is None and mail.date
+
+                # 邮件头已经获取，不再请求服务器；获取完整邮件以后邮件头从完整邮件中解析
+                assert mail.sender is None and len(sent) == 1
+                assert mail.raw_mail['subject'] and sent[-1] == ('UID', 'FETCH', '2', '(RFC822)')
+                assert mail.subject.endswith('#1')
+                assert len(inbox.search('UNSEEN')) == 2
+
+
+class TestMailPart:
+    def test_parse_bodystructure(self):
+        data = [b'1 (BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "gbk") NIL NIL "BASE64" 20 1 NIL NIL NIL NIL)'
+                b'("APPLICATION" "PDF" ("NAME" "a.pdf") NIL NIL "BASE64" 100 NIL ("ATTACHMENT" ("FILENAME" "a.pdf"))'
+                b' NIL NIL) "MIXED" ("BOUNDARY" "xyz") NIL NIL NIL))']
+        structure = parse_fetch_response(data)[0][1]['BODYSTRUCTURE']
+        root = MailPart(None, '', structure)
+        text, attachment = root.children
+        assert root.content_type == 'multipart/mixed'
+        assert (text.section, text.content_type, text.charset) == ('1', 'text/plain', 'gbk')
+        assert (attachment.section, attachment.filename, attachment.size) == ('2', 'a.pdf', 100)
+        assert attachment.is_attachment and not text.is_attachment
+
+
+class TestPartialFetch:
+    def test_text_body_downloads_only_text_part(self, monkeypatch):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 1, attachment_size=50000)
+            with _connect(server) as box:
+                mail = box.select('inbox').mails[0]
+                sent = _sent(box, monkeypatch)
+                assert mail.text_body
+                assert [command[3] for command in sent] == ['(BODYSTRUCTURE)', '(BODY.PEEK[1])']
+
+                attachment, = mail.attachments
+                assert isinstance(attachment, MailPart) and attachment.section == '2'
+                assert attachment.filename == '附件0.bin' and attachment.size > 50000
+                assert mail._raw_mail is None and len(sent) == 2
+
+
+class TestStreamingSave:
+    @staticmethod
+    def qp_message(payload: bytes) -> bytes:
+        boundary = 'b0undary'
+        return (
+            f'Subject: qp\r\nMIME-Version: 1.0\r\nContent-Type: multipart/mixed; boundary="{boundary}"\r\n\r\n'
+            f'--{boundary}\r\nContent-Type: text/plain; charset="utf-8"\r\n\r\nbody\r\n'
+            f'--{boundary}\r\nContent-Type: application/octet-stream; name="notes.txt"\r\n'
+            f'Content-Transfer-Encoding: quoted-printable\r\n'
+            f'Content-Disposition: attachment; filename="notes.txt"\r\n\r\n'
+        ).encode() + quopri.encodestring(payload).replace(b'\n', b'\r\n') + f'\r\n--{boundary}--\r\n'.encode()
+
+    def test_chunked_save(self, tmp_path, monkeypatch):
+        payload = '中文内容 = 等号\t制表符，行尾空格 \n'.encode('utf-8') * 300
+        with LocalImapServer() as server:
+            server.seed('INBOX', 1, attachment_size=20000)
+            server.add_message('INBOX', self.qp_message(payload))
+            base64_expected, qp_expected = (email.message_from_bytes(message.raw).get_payload()[-1]
+                                            .get_payload(decode=True) for message in server.mailboxes['INBOX'].messages)
+
+            with _connect(server) as box:
+                base64_mail, qp_mail = box.select('inbox').mails
+                sent = _sent(box, monkeypatch)
+                attachment, = base64_mail.attachments
+                # 块的边界不和base64的4字节分组、换行对齐，TransferDecoder需要保留不完整的部分
+                path = attachment.save(tmp_path / 'a.bin', chunk_size=999)
+                assert path.read_bytes() == base64_expected
+                fetches = [command[3] for command in sent if command[1] == 'FETCH']
+                assert fetches[1:4] == ['(BODY.PEEK[2]<0.999>)', '(BODY.PEEK[2]<999.999>)', '(BODY.PEEK[2]<1998.999>)']
+                assert len(fetches) == 1 + -(-attachment.size // 999)
+
+                path, = qp_mail.save_attachments(tmp_path / 'qp', chunk_size=101)
+                assert Path(path).read_bytes() == qp_expected == payload.replace(b'\n', b'\r\n')
+                assert base64_mail._raw_mail is None and qp_mail._raw_mail is None
+
+
+class TestMailCache:
+    def test_put_and_get(self):
+        cache = MailCache(':memory:')
+        cache.put('inbox', 1, 10, headers=b'Subject: test\r\n\r\n')
+        cache.put('inbox', 1, 10, raw=b'raw')
+        assert cache.get('inbox', 1, '10') == {'raw': b'raw', 'headers': b'Subject: test\r\n\r\n'}
+        assert cache.get('inbox', 2, 10) is None
+
+    def test_evict(self):
+        cache = MailCache(':memory:', max_size=10)
+        for uid in range(5):
+            cache.put('inbox', 1, uid, raw=b'12345')
+        cache.put('inbox', 2, 1, raw=b'1')
+        cache.evict({'inbox': 2})
+        assert len(cache) == 1 and cache.get('inbox', 2, 1) is not None
+
+    def test_cached_read_does_not_write(self, tmp_path):
+        path = tmp_path / 'cache.db'
+        cache = MailCache(path, max_size=10)
+        cache.put('inbox', 1, 1, raw=b'12345')
+        cache.put('inbox', 1, 2, raw=b'12345')
+        cache.commit()
+
+        # 命中缓存时访问时间只记录在内存中，不修改数据库文件
+        mtime, changes = path.stat().st_mtime_ns, cache._conn.total_changes
+        for _ in range(50):
+            assert cache.get('inbox', 1, 1)['raw'] == b'12345'
+        assert cache._conn.total_changes == changes and not cache._conn.in_transaction
+        assert path.stat().st_mtime_ns == mtime
+
+        # 清理时先写入访问时间，最近读取过的邮件被保留
+        cache.put('inbox', 1, 3, raw=b'1')
+        cache.evict()
+        assert cache.get('inbox', 1, 1) is not None and cache.get('inbox', 1, 2) is None
+        cache.close()
+        assert len(MailCache(path)) == 2
+
+    def test_select_evicts_old_uidvalidity(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 3)
+            cache = MailCache(':memory:')
+            # 之前的会话留下的其它UIDVALIDITY的缓存，在文件夹第一次选择时删除
+            cache.put('inbox', server.mailboxes['INBOX'].uidvalidity + 1, 1, raw=b'stale')
+            with ImapEasyBox(server.host, server.port, server.user, server.password, ssl=False, cache=cache) as box:
+                inbox = box.select('inbox')
+                assert len(cache) == 0
+                assert [mail.subject for mail in inbox.mails]
+                assert len(cache) == 3
+
+                box.select('inbox', force=True)
+                assert len(cache) == 3
+
+                server.reset_uidvalidity('INBOX')
+                box.select('inbox', force=True)
+                assert len(cache) == 0
+
+
+class TestAsyncImapConnection:
+    def test_untagged_responses(self):
+        conn = AsyncImapConnection('imap.fakeserver.com')
+        conn._add_untagged([b'* 3 EXISTS'])
+        conn._add_untagged([b'* OK [UIDVALIDITY 42] UIDs valid'])
+        conn._add_untagged([(b'* 1 FETCH (UID 5 RFC822 {3}', b'abc'), b')'])
+        assert conn._untagged['EXISTS'] == [b'3']
+        assert conn._untagged['UIDVALIDITY'] == [b'42']
+        assert parse_fetch_response(conn._untagged['FETCH']) == [('1', {'UID': '5', 'RFC822': b'abc'})]
+
+
+    def test_malformed_response_fails_pending(self):
+        async def handle(reader, writer):
+            writer.write(b'* OK ready\r\n')
+            while line := await reader.readline():
+                tag, name = line.split()[:2]
+                if name == b'CAPABILITY':
+                    writer.write(b'* CAPABILITY IMAP4rev1\r\n' + tag + b' OK done\r\n')
+                else:
+                    writer.write(tag + b' \xff\xfe garbage\r\n')
+                await writer.drain()
+
+        async def main():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            conn = AsyncImapConnection('127.0.0.1', server.sockets[0].getsockname()[1], ssl=False)
+            await conn.open()
+            # 解析响应出错时等待的命令抛出ConnectionError，不会一直等待
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(conn.command('NOOP'), 5)
+            with pytest.raises(ConnectionError):
+                await conn.command('NOOP')
+            await conn.close()
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(main())
+
+class TestAsyncImapEasyBox:
+    @staticmethod
+    def run(server, main):
+        async def wrapper():
+            async with AsyncImapEasyBox(server.host, server.port, server.user, server.password, ssl=False) as box:
+                return await main(box)
+        return asyncio.run(wrapper())
+
+    def test_select_search_fetch(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 30)
+
+            async def main(box):
+                inbox = await box.select('inbox')
+                assert (inbox.exists, inbox.uidnext) == (30, 31)
+                assert inbox.uidvalidity == server.mailboxes['INBOX'].uidvalidity
+
+                mails = await inbox.mails
+                assert [mail.mail_id for mail in mails] == [str(uid) for uid in range(1, 31)]
+                # 多个批次的fetch命令连续发送
+                await inbox.fetch(mails, batch_size=7)
+                assert mails[3].subject.endswith('#3') and mails[3].text_body
+
+                found = await inbox.search(subject='#12', encoding='utf-8', prefetch='headers')
+                assert [mail.mail_id for mail in found] == ['13']
+                assert found[0].subject.endswith('#12')
+
+                mail = (await inbox.search('UID 5'))[0]
+                assert (await mail.fetch_content())['text_body'] == mails[4].text_body
+
+            self.run(server, main)
+
+    def test_flags_and_move(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 3, seen_ratio=0)
+
+            async def main(box):
+                inbox = await box.select('inbox')
+                mail, = await inbox.search('UID 2')
+                await mail.add_flags(['seen', 'flagged'])
+                assert sorted(await mail.fetch_flags()) == ['Flagged', 'Seen']
+                await mail.remove_flags('flagged')
+                assert await mail.fetch_flags() == ['Seen']
+
+                await mail.move_to('trash')
+                assert len(await (await box.select('inbox')).mails) == 2
+                assert len(await (await box.select('trash')).mails) == 1
+
+            self.run(server, main)
+
+    def test_sync_api_raises_type_error(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 1)
+
+            async def main(box):
+                inbox = await box.select('inbox')
+                mail, = await inbox.mails
+                for call in (lambda: inbox.add_flags([mail], 'seen'), lambda: inbox.sort(), inbox.sync, inbox.idle,
+                             lambda: inbox.move([mail], 'trash'), lambda: inbox.export('inbox.mbox'),
+                             lambda: inbox.info, lambda: mail.flags, lambda: mail.structure):
+                    with pytest.raises(TypeError, match='not supported by the async client'):
+                        call()
+                with pytest.raises(TypeError, match=r"await mail\.fetch_flags\(\)"):
+                    mail.flags
+
+            self.run(server, main)
+
+
+class TestLocalImapServer:
+    def test_round_trip(self):
+        with LocalImapServer(capabilities=('IMAP4rev1', 'UIDPLUS')) as server:
+            server.seed('INBOX', 20, attachment_size=1024)
+            with ImapEasyBox(server.host, server.port, server.user, server.password, ssl=False) as box:
+                inbox = box.select('inbox')
+                assert len(inbox.mails) == 20
+                assert inbox.mails[0].attachments[0]['filename'] == '附件0.bin'
+                assert inbox.move(inbox.mails[:5], 'trash') == {str(uid): str(uid) for uid in range(1, 6)}
+                assert len(box.select('inbox', force=True).mails) == 15
+
+    def test_move_without_move_capability(self):
+        with LocalImapServer(capabilities=('IMAP4rev1', 'UIDPLUS')) as server:
+            server.seed('INBOX', 10)
+            with ImapEasyBox(server.host, server.port, server.user, server.password, ssl=False) as box:
+                inbox = box.select('inbox')
+                for start in (0, 5):
+                    copied = inbox.move(inbox.search(f'UID {start + 1}:{start + 5}'), 'trash')
+                    assert copied == {str(uid): str(uid) for uid in range(start + 1, start + 6)}
+                    assert 'COPYUID' not in box.server.untagged_responses
+                assert len(box.select('inbox', force=True).mails) == 0
+
+
+    def test_long_search_line(self, monkeypatch):
+        # imaplib的单行长度限制只对本库创建的连接放宽，不修改全局设置
+        monkeypatch.setattr(imaplib, '_MAXLINE', 1000)
+        with LocalImapServer() as server:
+            server.seed('INBOX', 400, size=16)
+            with ImapEasyBox(server.host, server.port, server.user, server.password, ssl=False) as box:
+                assert len(box.select('inbox').search('ALL')) == 400
+
+            plain = imaplib.IMAP4(server.host, server.port)
+            plain.login(server.user, server.password)
+            plain.select('INBOX')
+            with pytest.raises(imaplib.IMAP4.error, match='got more than 1000 bytes'):
+                plain.uid('SEARCH', 'ALL')
+            plain.shutdown()
+
+
+class TestExtract:
+    def test_extract_batch(self, tmp_path):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 1, attachment_size=4096)
+            raw = server.mailboxes['INBOX'].messages[0].raw
+        (headers, content, duration), = extract_batch([raw], str(tmp_path), spill_threshold=1024)
+        payload = content['attachments'][0]['content']
+        assert isinstance(payload, SpilledPayload) and len(payload) == 4096
+        assert Path(payload).parent == tmp_path and len(bytes(payload)) == 4096
+        assert 'subject' in headers and content['text_body']
+
+    def test_extract_contents(self, tmp_path):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 6, attachment_size=2048)
+            with ImapEasyBox(server.host, server.port, server.user, server.password, ssl=False) as box:
+                inbox = box.select('inbox')
+                mails = list(inbox.mails)
+                contents = inbox.extract_contents(mails, workers=2, batch_size=4, spill_threshold=1024,
+                                                  spill_dir=tmp_path)
+                assert len(contents) == 6 and all(content['text_body'] for content in contents)
+                assert mails[0].attachments[0]['filename'] == '附件0.bin'
+                saved = mails[0].save_attachments(tmp_path / 'saved')
+                assert Path(saved[0]).stat().st_size == 2048
+                assert box.stats()['parse']['content']['count'] == 6
+
+
+class TestMailIndex:
+    def test_segment(self):
+        assert segment('Q3季度报告') == 'Q3 季度 度报 报告 告'
+
+    def test_search(self):
+        index = MailIndex(':memory:')
+        index.put('inbox', 1, 1, subject='关于Q3季度报告书的会议', body='请查收附件')
+        index.put('inbox', 1, 2, subject='Weekly report', sender='张三 <zhang@example.com>')
+        index.put('inbox', 1, 2, body='会议纪要')
+        index.put('inbox', 2, 3, subject='会议')
+
+        assert index.search('inbox', 1, '会议') == [1, 2]
+        assert index.search('inbox', 1, '会') == [1, 2]
+        assert index.search('inbox', 1, '季度报告书') == [1]
+        assert index.search('inbox', 1, 'REPORT 会议') == [2]
+        assert index.search('inbox', 1, '会议', fields=['subject']) == [1]
+        assert index.search('inbox', 1, '张三') == [2]
+
+        index.delete('inbox', 1, [1])
+        index.evict({'inbox': 1})
+        assert len(index) == 1
+
+    def test_search_local(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 10)
+            with ImapEasyBox(server.host, server.port, server.user, server.password, ssl=False,
+                             index=':memory:') as box:
+                inbox = box.select('inbox')
+                mail = inbox.mails[3]
+                word = mail.subject.split()[0]
+                expected = [int(m.mail_id) for m in inbox.mails if word in m.subject]
+                assert [int(m.mail_id) for m in inbox.search_local(word, fields=['subject'])] == expected
+
+                inbox.extract_contents(inbox.mails, workers=1)
+                body_word = mail.text_body.split()[0]
+                assert int(mail.mail_id) in inbox.search_local(body_word, fields=['body']).uids
+
+                inbox.move([mail], 'trash')
+                assert int(mail.mail_id) not in inbox.search_local(word).uids
+
+
+def _attachment_message(index: int, payload: bytes, content_md5: bool = True) -> bytes:
+    md5 = f"Content-MD5: {base64.b64encode(hashlib.md5(payload).digest()).decode()}\r\n" if content_md5 else ''
+    return (
+        f'Subject: mail {index}\r\nMIME-Version: 1.0\r\nContent-Type: multipart/mixed; boundary="XX"\r\n\r\n'
+        f'--XX\r\nContent-Type: text/plain\r\n\r\nhello\r\n'
+        f'--XX\r\nContent-Type: application/pdf; name="a.pdf"\r\nContent-Transfer-Encoding: base64\r\n{md5}'
+        f'Content-Disposition: attachment; filename="a.pdf"\r\n\r\n'
+    ).encode() + base64.encodebytes(payload).replace(b'\n', b'\r\n') + b'--XX--\r\n'
+
+
+class TestAttachmentStore:
+    def test_dedup_and_link(self, tmp_path):
+        store = AttachmentStore(tmp_path / 'store')
+        blob = store.add(b'pdf content')
+        assert store.add(b'pdf content') == blob and len(store) == 1
+        assert blob.sha256 in store and bytes(blob) == b'pdf content'
+
+        md5 = base64.b64encode(hashlib.md5(b'pdf content').digest())
+        assert not store.add_alias(base64.b64encode(b'0' * 16), 20, blob)
+        assert store.add_alias(md5, 20, blob)
+        assert store.lookup(md5, 20) == blob and store.lookup(md5, 21) is None
+
+        path = store.link(blob, tmp_path / 'out' / 'a.pdf')
+        assert store.link(blob, path) == path
+        (tmp_path / 'out' / 'b.pdf').write_bytes(b'other')
+        assert store.link(blob, tmp_path / 'out' / 'b.pdf').name == 'b (1).pdf'
+
+    def test_skip_download(self, tmp_path):
+        payload = bytes(range(256)) * 64
+        with LocalImapServer() as server:
+            for index in range(3):
+                server.add_message('INBOX', _attachment_message(index, payload))
+            server.add_message('INBOX', _attachment_message(3, payload, content_md5=False))
+
+            store = AttachmentStore(tmp_path / 'store')
+            with ImapEasyBox(server.host, server.port, server.user, server.password, ssl=False,
+                             attachment_store=store) as box:
+                paths = [mail.save_attachments(tmp_path / 'out')[0] for mail in box.select('inbox').mails]
+                assert len(set(paths)) == 1 and Path(paths[0]).read_bytes() == payload
+                assert len(store) == 1
+                # 只有第一封和没有Content-MD5的邮件需要下载附件
+                assert box.stats()['write']['attachment']['size'] == 2 * len(payload)
+
+
+class TestStats:
+    def test_snapshot(self):
+        stats = Stats()
+        events = []
+        stats.add_observer(events.append)
+        stats.record(StatsEvent('command', 'NOOP', 0.02, bytes_sent=10, bytes_received=20, typ='OK'))
+        stats.record(StatsEvent('command', 'NOOP', 0.3, bytes_sent=10, bytes_received=20, typ='NO'))
+        with stats.timer('write', 'eml') as timer:
+            timer.size = 100
+
+        snapshot = stats.snapshot()
+        noop = snapshot['commands']['NOOP']
+        assert (noop['count'], noop['errors'], noop['min_time'], noop['max_time']) == (2, 1, 0.02, 0.3)
+        assert noop['buckets'][0.025] == 1 and noop['buckets'][0.25] == 1 and noop['buckets'][0.5] == 2
+        assert noop['buckets'][float('inf')] == 2
+        assert (snapshot['round_trips'], snapshot['bytes_sent'], snapshot['bytes_received']) == (2, 20, 40)
+        assert snapshot['write']['eml']['size'] == 100
+        assert len(events) == 3
+
+        stats.reset()
+        assert stats.snapshot()['round_trips'] == 0
+
+    def test_box_stats(self):
+        with LocalImapServer() as server:
+            server.seed('INBOX', 5)
+            with ImapEasyBox(server.host, server.port, server.user, server.password, ssl=False) as box:
+                events = []
+                box.add_observer(events.append)
+                box.select('inbox').mails[0].raw_mail
+                stats = box.stats()
+                assert stats['commands']['UID FETCH']['count'] >= 1
+                assert stats['commands']['LOGIN']['bytes_received'] > 0
+                assert stats['parse']['message']['count'] == 1
+                assert any(event.name == 'UID FETCH' for event in events)
+
+
+class TestSearchFallback:
+    @pytest.mark.parametrize('fallback', [False, True])
+    def test_encoded_query(self, fallback):
+        capabilities = [capability for capability in DEFAULT_CAPABILITIES if not fallback or
+                        capability not in ('SORT', 'ESEARCH') and not capability.startswith('THREAD')]
+        with LocalImapServer(capabilities=capabilities) as server:
+            server.seed('INBOX', 30)
+            with ImapEasyBox(server.host, server.port, server.user, server.password, ssl=False) as box:
+                inbox = box.select('inbox')
+                uids = list(inbox.search(subject='周报', encoding='utf-8').uids)
+                assert uids
+
+                assert list(inbox.sort('REVERSE DATE', subject='周报', encoding='utf-8').uids) == uids[::-1]
+
+                def flatten(items):
+                    for item in items:
+                        yield from flatten(item) if isinstance(item, list) else [int(item.mail_id)]
+
+                assert sorted(flatten(inbox.thread(subject='周报', encoding='utf-8'))) == uids
+                assert inbox.search_stats(subject='周报', encoding='utf-8') == \
+                    {'min': uids[0], 'max': uids[-1], 'count': len(uids)}